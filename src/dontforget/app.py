@@ -1,20 +1,32 @@
 """The app module, containing the app factory function."""
 
 import logging
+import os
 from abc import ABC, abstractmethod
+from datetime import datetime
 from enum import Enum
 from pathlib import Path
 from subprocess import run
 from typing import Any
 
 import rumps
+from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED
 from apscheduler.schedulers.background import BackgroundScheduler
 from pluginbase import PluginBase
 from rumps import MenuItem
 
 from dontforget.constants import DEFAULT_PIPES_DIR_NAME, PROJECT_NAME
 from dontforget.generic import UT
-from dontforget.settings import CONFIG_FILE_PATH, DEFAULT_DIRS, LOG_LEVEL, load_config_file
+from dontforget.scheduling import JobHistory
+from dontforget.settings import (
+    CACHE_DIR,
+    CONFIG_FILE_PATH,
+    DEFAULT_DIRS,
+    LOG_LEVEL,
+    STATUS_SOCKET_PATH,
+    load_config_file,
+)
+from dontforget.status import StatusServer
 
 log_file = Path(DEFAULT_DIRS.user_log_dir) / "app.log"
 log_file.parent.mkdir(parents=True, exist_ok=True)
@@ -57,7 +69,10 @@ class DontForgetApp(rumps.App):
 
         logger.debug("Creating scheduler")
         self.scheduler = BackgroundScheduler()
+        self.job_history = JobHistory(CACHE_DIR / "scheduler.sqlite3")
+        self.scheduler.add_listener(self.job_history.record_event, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR)
         self.plugins: list = []
+        rumps.events.before_quit.register(self.stop_plugins)
 
     def create_preferences_menu(self):
         """Create the preference menu."""
@@ -83,6 +98,28 @@ class DontForgetApp(rumps.App):
         self.scheduler.print_jobs(out=log_file.open("a"))
         return True
 
+    def status(self) -> dict[str, Any]:
+        """Latest status of each plugin; called from the threads of the status server."""
+        plugins = {}
+        for plugin in self.plugins:  # type: BasePlugin
+            plugin_status = plugin.status()
+            if plugin_status is not None:
+                plugins[plugin.name.lower()] = plugin_status
+        return {"pid": os.getpid(), "time": datetime.now().isoformat(), "plugins": plugins}
+
+    def stop_plugins(self) -> None:
+        """Stop each plugin before the app quits."""
+        for plugin in self.plugins:  # type: BasePlugin
+            try:
+                plugin.stop()
+            except Exception:  # noqa: B902
+                logger.exception("%s: Error while stopping the plugin", plugin.name)
+
+    def start_status_server(self) -> bool:
+        """Serve the status of the app on a local socket, so the CLI and scripts can read it."""
+        self.status_server = StatusServer(STATUS_SOCKET_PATH, self.status)
+        return self.status_server.start()
+
 
 class BasePlugin(ABC):
     """Base class for plugins."""
@@ -110,3 +147,13 @@ class BasePlugin(ABC):
     @abstractmethod
     def reload_config(self) -> bool:
         """Actions to perform when the YAML config is reloaded."""
+
+    def status(self) -> dict[str, Any] | None:
+        """Latest status of the plugin, serializable to JSON; None if the plugin has no status to share.
+
+        It's called from other threads, so it should only read state, without calling any API.
+        """
+        return None
+
+    def stop(self) -> None:  # noqa: B027
+        """Actions to perform before the app quits, like releasing shared resources."""
@@ -0,0 +1,213 @@
+"""A persistent cache with per-entry expiry, LRU eviction and per-namespace invalidation, stored in SQLite.
+
+Entries are grouped in namespaces (e.g. ``todoist``, ``gmail-labels``), which can be cleared separately.
+Values are pickled, so any picklable object can be cached.
+"""
+
+from __future__ import annotations
+
+import functools
+import logging
+import pickle
+import sqlite3
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import closing, contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, TypeVar
+
+from dontforget.constants import CACHE_MAX_ENTRIES
+from dontforget.settings import CACHE_DIR, LOG_LEVEL
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+_MISSING = object()
+
+
+@dataclass(frozen=True)
+class NamespaceStats:
+    """Statistics of a cache namespace."""
+
+    namespace: str
+    entries: int
+    size: int
+    hits: int
+    misses: int
+
+    @property
+    def hit_ratio(self) -> float:
+        """Hits over all lookups.
+
+        >>> NamespaceStats("toggl", 2, 100, 3, 1).hit_ratio
+        0.75
+        >>> NamespaceStats("toggl", 0, 0, 0, 0).hit_ratio
+        0.0
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class Cache:
+    """Cache entries in SQLite; the least recently used entries are evicted when there are more than ``max_entries``.
+
+    >>> import tempfile
+    >>> cache = Cache(Path(tempfile.mkdtemp()) / "cache.sqlite3", max_entries=2)
+    >>> cache.set("toggl", "clients", {1: "Acme"}, ttl=60)
+    >>> cache.get("toggl", "clients"), cache.get("toggl", "projects")
+    ({1: 'Acme'}, None)
+    >>> cache.set("toggl", "expired", "old", ttl=-1)
+    >>> cache.get("toggl", "expired", "default")
+    'default'
+    >>> cache.set("gmail-labels", "me@x.io", ["INBOX"])
+    >>> cache.set("gmail-labels", "you@x.io", ["INBOX"])
+    >>> cache.get("toggl", "clients") is None  # evicted: least recently used
+    True
+    >>> [(stats.namespace, stats.entries, stats.hits, stats.misses) for stats in cache.stats()]
+    [('gmail-labels', 2, 0, 0), ('toggl', 0, 1, 3)]
+    >>> cache.clear("gmail-labels")
+    2
+    """
+
+    def __init__(self, path: Path, max_entries: int = CACHE_MAX_ENTRIES) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._created = False
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Open a connection for a transaction; it's committed (or rolled back) and closed at the end."""
+        # Tables are created on first use, so importing this module doesn't touch the disk
+        if not self._created:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(sqlite3.connect(self.path, timeout=10)) as conn, conn:
+            if not self._created:
+                conn.executescript("""
+                    CREATE TABLE IF NOT EXISTS entry (
+                        namespace TEXT NOT NULL,
+                        key TEXT NOT NULL,
+                        value BLOB NOT NULL,
+                        expires_at REAL,
+                        accessed_at REAL NOT NULL,
+                        PRIMARY KEY (namespace, key)
+                    );
+                    CREATE INDEX IF NOT EXISTS entry_accessed_at ON entry (accessed_at);
+                    CREATE TABLE IF NOT EXISTS stats (
+                        namespace TEXT PRIMARY KEY,
+                        hits INTEGER NOT NULL DEFAULT 0,
+                        misses INTEGER NOT NULL DEFAULT 0
+                    );
+                    """)
+                self._created = True
+            yield conn
+
+    def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        """Get a value that didn't expire, or the default."""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT value FROM entry WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, key, now),
+            ).fetchone()
+            value = _MISSING
+            if row:
+                try:
+                    value = pickle.loads(row[0])
+                except Exception as err:  # noqa: B902
+                    # The class of the value was probably changed or removed; treat it as a miss
+                    logger.warning("Discarding cache entry %s/%s: %r", namespace, key, err)
+                    conn.execute("DELETE FROM entry WHERE namespace = ? AND key = ?", (namespace, key))
+            if value is _MISSING:
+                column = "misses"
+            else:
+                column = "hits"
+                conn.execute("UPDATE entry SET accessed_at = ? WHERE namespace = ? AND key = ?", (now, namespace, key))
+            conn.execute(
+                f"INSERT INTO stats (namespace, {column}) VALUES (?, 1)"
+                f" ON CONFLICT (namespace) DO UPDATE SET {column} = {column} + 1",
+                (namespace,),
+            )
+        logger.debug("Cache %s: %s/%s", "miss" if value is _MISSING else "hit", namespace, key)
+        return default if value is _MISSING else value
+
+    def set(self, namespace: str, key: str, value: Any, ttl: float | None = None) -> None:
+        """Set a value; it expires after ``ttl`` seconds, or never if None.
+
+        Expired entries are removed, then the least recently used ones if the cache is full.
+        """
+        now = time.time()
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT INTO entry (namespace, key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT (namespace, key) DO UPDATE"
+                " SET value = excluded.value, expires_at = excluded.expires_at, accessed_at = excluded.accessed_at",
+                (namespace, key, data, now + ttl if ttl is not None else None, now),
+            )
+            conn.execute("DELETE FROM entry WHERE expires_at <= ?", (now,))
+            conn.execute(
+                "DELETE FROM entry WHERE rowid IN"
+                " (SELECT rowid FROM entry ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def delete(self, namespace: str, key: str) -> None:
+        """Delete an entry."""
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM entry WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def clear(self, namespace: str | None = None) -> int:
+        """Delete the entries and statistics of a namespace, or of all namespaces.
+
+        :return: Number of deleted entries.
+        """
+        with self._lock, self._connect() as conn:
+            if namespace is None:
+                deleted = conn.execute("DELETE FROM entry").rowcount
+                conn.execute("DELETE FROM stats")
+            else:
+                deleted = conn.execute("DELETE FROM entry WHERE namespace = ?", (namespace,)).rowcount
+                conn.execute("DELETE FROM stats WHERE namespace = ?", (namespace,))
+        logger.info("Cleared %d cache entries of %s", deleted, namespace or "all namespaces")
+        return deleted
+
+    def stats(self) -> list[NamespaceStats]:
+        """Statistics of each namespace with entries or lookups, sorted by namespace."""
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                """
+                SELECT namespace, SUM(entries), SUM(size), SUM(hits), SUM(misses) FROM (
+                    SELECT namespace, COUNT(*) AS entries, SUM(LENGTH(value)) AS size, 0 AS hits, 0 AS misses
+                    FROM entry WHERE expires_at IS NULL OR expires_at > ? GROUP BY namespace
+                    UNION ALL
+                    SELECT namespace, 0, 0, hits, misses FROM stats
+                ) GROUP BY namespace ORDER BY namespace
+                """,
+                (time.time(),),
+            ).fetchall()
+        return [NamespaceStats(*row) for row in rows]
+
+    def cached(self, namespace: str, ttl: float | None = None) -> Callable[[Callable[..., T]], Callable[..., T]]:
+        """Decorator that caches the results of a function, by its name and arguments."""
+
+        def decorator(func: Callable[..., T]) -> Callable[..., T]:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs) -> T:
+                key = func.__name__ + repr((args, sorted(kwargs.items()))) if args or kwargs else func.__name__
+                value = self.get(namespace, key, _MISSING)
+                if value is _MISSING:
+                    value = func(*args, **kwargs)
+                    self.set(namespace, key, value, ttl)
+                return value
+
+            return wrapper
+
+        return decorator
+
+
+CACHE = Cache(CACHE_DIR / "cache.sqlite3")
@@ -1,5 +1,6 @@
 """Command-line."""
 
+import json
 import sys
 
 import click
@@ -8,15 +9,12 @@ import rumps
 from dontforget.app import DontForgetApp
 from dontforget.constants import PROJECT_NAME
 from dontforget.pipes import PIPE_CONFIG, Pipe, PipeType
-from dontforget.settings import DEBUG, JOBLIB_MEMORY, load_config_file
+from dontforget.settings import DEBUG, load_config_file
 
 
 @click.group()
-@click.option("--clear-cache", "-c", is_flag=True, default=False, help="Clear the cache before starting")
-def main(clear_cache):
+def main():
     """Don't forget to do your things."""
-    if clear_cache:
-        JOBLIB_MEMORY.clear()
 
 
 @main.command()
@@ -43,6 +41,7 @@ def menu():
         app.create_preferences_menu()
         if not app.start_scheduler():
             sys.exit(2)
+        app.start_status_server()
         app.run()
     except Exception as err:  # noqa: B902
         # TODO(AA): Fix this error when installing or setting up the app on macOS
@@ -55,12 +54,76 @@ def menu():
         rumps.notification(PROJECT_NAME, "Generic error", str(err))
 
 
+@main.command()
+@click.option("--json", "as_json", is_flag=True, default=False, help="Output JSON")
+def status(as_json: bool):
+    """Show the status of the running app; if it's not running, check email directly."""
+    from dontforget.email_checker import check_all, create_checkers
+    from dontforget.email_status import AccountState, StatusBoard, format_states
+    from dontforget.status import StatusError, read_status
+
+    try:
+        app_status = read_status()
+    except StatusError as err:
+        raise click.ClickException(str(err)) from err
+    if app_status is None:
+        status_board = StatusBoard()
+        check_all(create_checkers((), status_board))
+        _, states = status_board.snapshot()
+        app_status = {"pid": None, "plugins": {"email": {"accounts": [state.as_dict() for state in states.values()]}}}
+
+    if as_json:
+        click.echo(json.dumps(app_status))
+        return
+    plugins = app_status["plugins"]
+    if "email" in plugins:
+        click.echo(format_states(AccountState.from_dict(data) for data in plugins["email"]["accounts"]))
+    tracking = plugins.get("toggl", {}).get("tracking")
+    if tracking:
+        click.echo(f"Toggl: {tracking['description']} ({tracking['client']}/{tracking['project']})")
+
+
+@main.group()
+def cache():
+    """Cached data: Todoist sync data and the go home task, Gmail labels and Toggl shortcuts."""
+
+
+@cache.command()
+def stats():
+    """Show entries, size and hit ratio of each cache namespace."""
+    from dontforget.cache import CACHE
+
+    all_stats = CACHE.stats()
+    if not all_stats:
+        click.echo("The cache is empty")
+        return
+    for namespace_stats in all_stats:
+        click.echo(
+            f"{namespace_stats.namespace}: {namespace_stats.entries} entries, {namespace_stats.size} bytes,"
+            f" {namespace_stats.hits} hits, {namespace_stats.misses} misses"
+            f" ({namespace_stats.hit_ratio:.0%} hit ratio)"
+        )
+
+
+@cache.command()
+@click.argument("namespaces", nargs=-1)
+def clear(namespaces: tuple[str]):
+    """Clear the chosen cache namespaces, or all of them."""
+    from dontforget.cache import CACHE
+
+    for namespace in namespaces or (None,):
+        deleted = CACHE.clear(namespace)
+        click.echo(f"Cleared {deleted} entries from {namespace or 'all namespaces'}")
+
+
 def register_plugin_commands():
     """Register commands added by plugins."""
     from dontforget.default_pipes.toggl_plugin import TogglPlugin
+    from dontforget.email_checker import email
 
     for command in TogglPlugin.register_cli_commands():
         main.add_command(command)
+    main.add_command(email)
 
 
 register_plugin_commands()
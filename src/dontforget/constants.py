@@ -12,3 +12,77 @@ UNIQUE_SEPARATOR = "$#@"
 # Delay before trying to execute the job for the first time
 DEFAULT_DELAY_SECONDS = 15
 MISFIRE_GRACE_TIME = 10
+
+# Random delay added to job start times, so jobs don't all hit the servers at the same time
+JOB_START_JITTER_SECONDS = 30
+
+# IMAP connections
+IMAP_TIMEOUT_SECONDS = 30
+# Send a NOOP before using a connection that was idle for longer than this
+IMAP_KEEPALIVE_SECONDS = 5 * 60
+IMAP_MIN_BACKOFF_SECONDS = 5
+IMAP_MAX_BACKOFF_SECONDS = 5 * 60
+# Connections per account (host, port and user) shared by pipes and the email plugin
+IMAP_POOL_MAX_SIZE = 2
+# Close pooled connections that were not leased for longer than this
+IMAP_POOL_IDLE_SECONDS = 30 * 60
+IMAP_POOL_WAIT_SECONDS = 60
+# Flag/move processed emails with UID set commands after this many messages (and at the end of a pipe run)
+IMAP_BATCH_SIZE = 100
+# Maximum number of UIDs on a single UID set command, to keep the command line short
+IMAP_UID_CHUNK_SIZE = 500
+# Fetch message headers in chunks of this many UIDs
+IMAP_FETCH_CHUNK_SIZE = 50
+
+# Maximum time of an email check; the watchdog aborts the connections of jobs that run longer, every few seconds
+EMAIL_JOB_DEADLINE_SECONDS = 3 * 60
+EMAIL_WATCHDOG_SECONDS = 30
+
+# Maximum number of email checks running at the same time on the asyncio engine
+EMAIL_ENGINE_CONCURRENCY = 10
+
+# Largest response body (HTTP) or literal (IMAP) read by the asyncio engine
+EMAIL_ENGINE_MAX_RESPONSE_BYTES = 1024 * 1024
+
+# Maximum time to authenticate an email account (reading tokens, refreshing OAuth tokens, building API clients)
+EMAIL_AUTH_TIMEOUT_SECONDS = 60
+
+# Gmail labels are cached on disk and fetched again from the API after this time
+GMAIL_LABELS_TTL_SECONDS = 60 * 60
+
+# Least recently used entries are evicted from the cache above this number of entries
+CACHE_MAX_ENTRIES = 1000
+# Todoist sync data is cached so new processes sync incrementally; a full sync is done again after this time
+TODOIST_SYNC_TTL_SECONDS = 24 * 60 * 60
+
+# Email menus are redrawn from the latest account states at most once per this interval, on the main thread
+EMAIL_MENU_REFRESH_SECONDS = 0.5
+
+# The process table is scanned at most once per this interval, and shared by all jobs that depend on open apps
+PROCESS_SCAN_TTL_SECONDS = 30
+
+# Toggl API requests
+TOGGL_TIMEOUT_SECONDS = 30
+# Clients and projects changed on Toggl are synced at most once per this interval
+TOGGL_CATALOG_REFRESH_SECONDS = 5 * 60
+# The first sync of time entries fetches this many days; older entries are fetched when a report needs them
+TOGGL_ENTRIES_INITIAL_DAYS = 31
+# Long ranges of time entries are fetched in chunks of this many days, by a few threads in parallel
+TOGGL_ENTRIES_CHUNK_DAYS = 7
+TOGGL_FETCH_WORKERS = 4
+# Attempts to fetch a chunk while the API is throttling
+TOGGL_FETCH_ATTEMPTS = 3
+# Time entries are synced at this interval by the menu app, so its status shows the running entry
+TOGGL_ENTRIES_SYNC_SECONDS = 5 * 60
+
+# Todoist API requests
+TODOIST_TIMEOUT_SECONDS = 30
+
+# The time to go home is computed again from the local Toggl entries at this interval
+GO_HOME_INTERVAL_SECONDS = 10 * 60
+
+# Maximum time to read the status of the running app from its local socket
+STATUS_SOCKET_TIMEOUT_SECONDS = 2
+
+# A lock file of an email lease older than this was left by a crashed process
+LEASE_MUTEX_STALE_SECONDS = 30
@@ -0,0 +1,187 @@
+"""Coordination of several apps (on several hosts, or several processes) that check the same accounts.
+
+One app holds the lease of an account while it polls the servers; it publishes its results next to the lease file,
+then releases the lease. The other apps read the published results; the lease only expires if its holder dies.
+Files can be on a shared filesystem; writes are atomic (a temporary file is renamed over the old one).
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+from dontforget.constants import LEASE_MUTEX_STALE_SECONDS
+from dontforget.settings import LOG_LEVEL
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+
+def default_owner() -> str:
+    """Owner of the leases of this process: host and process ID, so processes on the same host also compete."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def write_atomic(path: Path, data: dict[str, Any]) -> None:
+    """Write JSON to a file atomically, so readers never see a partial file."""
+    temp_path = path.with_name(f".{path.name}.{default_owner()}.tmp")
+    temp_path.write_text(json.dumps(data))
+    os.replace(temp_path, path)
+
+
+def read_json(path: Path) -> dict[str, Any] | None:
+    """Read JSON from a file; None if it doesn't exist or is invalid."""
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+@dataclass
+class Lease:
+    """A lease on a resource, held by one owner until it expires.
+
+    >>> import tempfile
+    >>> directory = Path(tempfile.mkdtemp())
+    >>> first, second = Lease(directory, "me@x.io", 60, owner="a:1"), Lease(directory, "me@x.io", 60, owner="b:2")
+    >>> first.acquire(), second.acquire(), first.acquire()
+    (True, False, True)
+    >>> first.publish({"unread": 3})
+    >>> second.read_published()
+    {'unread': 3}
+    >>> first.release()
+    >>> second.acquire()
+    True
+    """
+
+    directory: Path
+    name: str
+    ttl: float
+    owner: str = field(default_factory=default_owner)
+
+    @property
+    def path(self) -> Path:
+        """The lease file, with its owner and expiry time."""
+        return self.directory / f"{self.name}.lease"
+
+    @property
+    def published_path(self) -> Path:
+        """Results published by the owner of the lease."""
+        return self.directory / f"{self.name}.json"
+
+    @property
+    def mutex_path(self) -> Path:
+        """Lock file held while the lease is being changed."""
+        return self.directory / f"{self.name}.lock"
+
+    @contextmanager
+    def mutex(self) -> Iterator[bool]:
+        """Hold the lock file while the lease is read and written; yield False if another owner holds it now.
+
+        The lock file is created exclusively, which also works on network filesystems.
+        A lock file older than :py:data:`LEASE_MUTEX_STALE_SECONDS` was left by a crashed process: it's renamed away
+        (only one process can rename it) before the lock file is created again.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        token = f"{self.owner}:{uuid.uuid4().hex}"
+        for _ in range(2):
+            try:
+                fd = os.open(self.mutex_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+                break
+            except FileExistsError:
+                try:
+                    stat = self.mutex_path.stat()
+                except FileNotFoundError:
+                    # Released in the meantime
+                    continue
+                if time.time() - stat.st_mtime <= LEASE_MUTEX_STALE_SECONDS or not self._break_stale_mutex(stat):
+                    yield False
+                    return
+        else:
+            yield False
+            return
+
+        try:
+            os.write(fd, token.encode())
+            os.close(fd)
+            yield True
+        finally:
+            if self._mutex_token() == token:
+                self.mutex_path.unlink(missing_ok=True)
+
+    def _break_stale_mutex(self, stale: os.stat_result) -> bool:
+        """Rename a stale lock file away, so the lock can be created again.
+
+        :return: False if the lock file was not the stale one anymore (e.g. another process broke it first).
+        """
+        broken_path = self.mutex_path.with_name(f".{self.mutex_path.name}.{uuid.uuid4().hex}.stale")
+        try:
+            os.rename(self.mutex_path, broken_path)
+        except FileNotFoundError:
+            return False
+        renamed = broken_path.stat()
+        if (renamed.st_ino, renamed.st_mtime_ns) != (stale.st_ino, stale.st_mtime_ns):
+            # A fresh lock file of another process was renamed: put it back, unless there is a new one already
+            try:
+                os.link(broken_path, self.mutex_path)
+            except FileExistsError:
+                pass
+            broken_path.unlink()
+            return False
+        logger.warning("%s: Removed stale lock file %s", self.name, self.mutex_path)
+        broken_path.unlink()
+        return True
+
+    def _mutex_token(self) -> str | None:
+        """Token of the process that holds the lock file."""
+        try:
+            return self.mutex_path.read_text()
+        except OSError:
+            return None
+
+    def holder(self) -> str | None:
+        """Current owner of the lease, if it's not expired."""
+        lease = read_json(self.path)
+        if not lease or lease.get("expires_at", 0) <= time.time():
+            return None
+        return lease.get("owner")
+
+    def acquire(self) -> bool:
+        """Acquire or renew the lease.
+
+        :return: True if this owner holds the lease now.
+        """
+        with self.mutex() as locked:
+            if not locked:
+                # Another owner is changing the lease right now; keep the lease if it's still ours
+                return self.holder() == self.owner
+            holder = self.holder()
+            if holder and holder != self.owner:
+                return False
+            if holder is None:
+                logger.info("%s: Lease acquired by %s", self.name, self.owner)
+            write_atomic(self.path, {"owner": self.owner, "expires_at": time.time() + self.ttl})
+            return True
+
+    def release(self) -> None:
+        """Release the lease, if this owner holds it, so another owner can take over right away."""
+        with self.mutex() as locked:
+            if locked and self.holder() == self.owner:
+                self.path.unlink(missing_ok=True)
+
+    def publish(self, data: dict[str, Any]) -> None:
+        """Publish results for the other owners."""
+        write_atomic(self.published_path, data)
+
+    def read_published(self) -> dict[str, Any] | None:
+        """Read the results published by the owner of the lease."""
+        return read_json(self.published_path)
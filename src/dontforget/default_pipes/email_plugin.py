@@ -1,59 +1,45 @@
-"""Email checker (Gmail/IMAP). It is not a source nor a target... yet.
+"""Email checker (Gmail/IMAP) on the menu app. It is not a source nor a target... yet.
 
-Parts of the code below adapted from:
-https://github.com/gsuitedevs/python-samples/blob/master/gmail/quickstart/quickstart.py
-
-Copyright 2018 Google LLC
-
-Licensed under the Apache License, Version 2.0 (the "License");
-you may not use this file except in compliance with the License.
-You may obtain a copy of the License at
-
-    http://www.apache.org/licenses/LICENSE-2.0
-
-Unless required by applicable law or agreed to in writing, software
-distributed under the License is distributed on an "AS IS" BASIS,
-WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
-See the License for the specific language governing permissions and
-limitations under the License.
-
-New format documentation:
-https://developers.google.com/gmail/api/v1/reference
-
-Old format documentation:
-https://developers.google.com/resources/api-libraries/documentation/gmail/v1/python/latest/index.html
+Checking is done by the headless :py:mod:`dontforget.email_checker`; this plugin schedules checks and draws menus.
 """
 
 from __future__ import annotations
 
 import logging
 import socket
-from dataclasses import dataclass, field
+import threading
+import time
+from collections.abc import Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import replace
 from datetime import datetime, timedelta
 from enum import Enum
 from pathlib import Path
-from pprint import pformat
 from subprocess import run
 from typing import Any
 
-import click
 import rumps
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build as build_google_api_client
-from imbox import Imbox
+from apscheduler.jobstores.base import JobLookupError
 
 from dontforget.app import BasePlugin, DontForgetApp
-from dontforget.constants import DEFAULT_DELAY_SECONDS, MISFIRE_GRACE_TIME
+from dontforget.constants import (
+    DEFAULT_DELAY_SECONDS,
+    EMAIL_AUTH_TIMEOUT_SECONDS,
+    EMAIL_JOB_DEADLINE_SECONDS,
+    EMAIL_MENU_REFRESH_SECONDS,
+    EMAIL_WATCHDOG_SECONDS,
+)
+from dontforget.coordination import Lease
+from dontforget.email_checker import AccountChecker, ImapApi, find_server_by_domain
+from dontforget.email_engine import EMAIL_ENGINE
+from dontforget.email_status import AccountState, ImportantCounter, LabelState, StatusBoard, format_count
 from dontforget.generic import UT, parse_interval
-from dontforget.settings import DEFAULT_DIRS, LOG_LEVEL
+from dontforget.processes import PROCESS_TABLE
+from dontforget.scheduling import AdaptiveInterval, RateLimitError, interval_seconds
+from dontforget.settings import EMAIL_ASYNC_ENGINE, EMAIL_LEASE_DIR, LOG_LEVEL
 
 CHECK_NOW_LAST_CHECK = "Check now (last check: "
 
-# If modifying these scopes, delete the file token.pickle.
-SCOPES = ["https://www.googleapis.com/auth/gmail.readonly"]
-
 logger = logging.getLogger(__name__)
 logger.setLevel(LOG_LEVEL)
 
@@ -66,38 +52,60 @@ class Menu(Enum):
     NoNewMail = "No new mail"
 
 
-# TODO: format_count() should be the str() or repr() of this dataclass
-# @dataclass
-# class MessageCount:
-#     threads: int = 0
-#     messages: int = 0
-def format_count(threads: int, messages: int) -> str:
-    """Format the count of threads and messages."""
-    if threads == messages:
-        return str(threads) if threads else ""
-    return f"{threads} ({messages})"
-
-
 class EmailPlugin(BasePlugin):
     """Email plugin (Gmail/IMAP)."""
 
-    # TODO: self.important: Dict[str, MessageCount] = {}
-    important: dict[str, list[int]] = {}
-
     @property
     def name(self) -> str:
         """Plugin name."""
         return "Email"
 
     def init_app(self, app: DontForgetApp) -> bool:
-        """Add email jobs to the background scheduler.
+        """Authenticate email accounts concurrently and add their jobs to the background scheduler.
+
+        The configuration and credentials of all accounts are checked first, without network calls.
+        Authentication then runs in background threads, so the app starts without waiting for the servers.
+        Each account has its own timeout, and a failing account doesn't affect the others.
 
-        :return: True if all email accounts were authenticated (with OAuth in Gmail's case).
+        :return: False if an account has an unknown server or missing credentials.
         """
         self.app = app
+        self.status_board = StatusBoard()
+        self.important = ImportantCounter()
+        self.jobs: dict[str, EmailJob] = {}
+        accounts = list(self.accounts_to_check())
+        # Check all accounts, so every configuration error is reported at once
+        configured = [self.check_account(data) for data in accounts]
+        if not all(configured):
+            return False
+        if not accounts:
+            return True
+
+        # Jobs publish account states from scheduler threads; menus are only changed by this timer, on the main thread
+        self.applied_title: tuple[int, bool] | None = None
+        self.applied_version = 0
+        self.applied_states: dict[str, AccountState] = {}
+        self.menu_timer = rumps.Timer(self.refresh_menus, EMAIL_MENU_REFRESH_SECONDS)
+        self.menu_timer.start()
+        app.scheduler.add_job(
+            self.watchdog, "interval", id="email-watchdog", replace_existing=True, seconds=EMAIL_WATCHDOG_SECONDS
+        )
+
+        executor = ThreadPoolExecutor(max_workers=len(accounts), thread_name_prefix="email-auth")
+        futures: dict[Future, tuple[str, float]] = {}
+        for data in accounts:
+            timeout = data.pop("auth-timeout", EMAIL_AUTH_TIMEOUT_SECONDS)
+            future = executor.submit(self.create_job, data)
+            futures[future] = (data["email"], time.monotonic() + timeout)
+        executor.shutdown(wait=False)
+
+        threading.Thread(target=self.register_jobs, args=(futures,), name="email-register", daemon=True).start()
+        return True
+
+    def accounts_to_check(self) -> Iterator[dict[str, Any]]:
+        """Yield the config of email accounts that should be checked on this host."""
         current_host = socket.gethostname()
 
-        all_authenticated = True
         # Read items in reversed order because they will be added to the menu always after the "Email" menu
         for data in reversed(self.plugin_config):
             hosts = data.pop("hosts", None)
@@ -106,319 +114,150 @@ class EmailPlugin(BasePlugin):
                 continue
 
             # TODO: the YAML file schema should be validated with pydantic/attrs/something else
-            open_apps = data.pop("open-apps", [])
-            if open_apps:
-                app_is_open = False
-                for open_app in open_apps:
-                    process = run(["pidof", open_app], capture_output=True, text=True)
-                    if process.stdout:
-                        app_is_open = True
-                        break
-                if not app_is_open:
-                    logger.debug(
-                        "%s: Ignoring email check because none of these apps are open %s", data["email"], open_apps
-                    )
+            # Apps are checked on each job run, so the gating follows apps being opened and closed
+            if "open-apps" in data:
+                data["open_apps"] = data.pop("open-apps")
+            if "max-check" in data:
+                data["max_check"] = data.pop("max-check")
+            yield data
+
+    @staticmethod
+    def check_account(data: dict[str, Any]) -> bool:
+        """Check the server and the credentials of an account, without network calls."""
+        try:
+            server = find_server_by_domain(data["email"])
+        except ValueError as err:
+            logger.error("%s", err)
+            return False
+        return server.api_class.check_credentials(data["email"], data.get("password"))
+
+    def create_job(self, data: dict[str, Any]) -> EmailJob:
+        """Create an email job; this authenticates the account."""
+        logger.debug("%s: Creating email job", data["email"])
+        return EmailJob(plugin=self, app=self.app, **data)
+
+    def register_jobs(self, futures: dict[Future, tuple[str, float]]) -> None:
+        """Add jobs to the scheduler as soon as their accounts are authenticated, until their deadlines."""
+        pending = set(futures)
+        while pending:
+            timeout = max(0.0, min(futures[future][1] for future in pending) - time.monotonic())
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                email = futures[future][0]
+                try:
+                    job: EmailJob = future.result()
+                except Exception:  # noqa: B902
+                    logger.exception("%s: Authentication failed", email)
                     continue
-
-            logger.debug("%s: Creating email job", data["email"])
-            job = EmailJob(plugin=self, app=self.app, **data)
-            if not job.authenticated:
-                all_authenticated = False
-            else:
-                self.app.scheduler.add_job(
-                    job,
-                    "interval",
-                    id=data["email"],
-                    replace_existing=True,
-                    misfire_grace_time=MISFIRE_GRACE_TIME,
-                    **job.trigger_args,
-                )
-
-        return all_authenticated
+                if not job.authenticated:
+                    logger.error("%s: Not authenticated, email will not be checked", email)
+                    continue
+                self.add_job(job)
+
+            now = time.monotonic()
+            for future in [future for future in pending if futures[future][1] <= now]:
+                logger.error("%s: Authentication timed out, email will not be checked", futures[future][0])
+                pending.discard(future)
+
+    def add_job(self, job: EmailJob) -> None:
+        """Add the jobs of an authenticated email account to the scheduler."""
+        email = job.email_api.email
+        self.jobs[email] = job
+        self.app.scheduler.add_job(
+            job,
+            "interval",
+            id=email,
+            replace_existing=True,
+            # Runs missed while the computer was asleep are coalesced into a single catch-up run, however late
+            coalesce=True,
+            misfire_grace_time=None,
+            **job.trigger_args,
+        )
+        if isinstance(job.email_api, ImapApi) and not EMAIL_ASYNC_ENGINE:
+            self.app.scheduler.add_job(
+                job.email_api.keep_alive,
+                "interval",
+                id=f"{email}-keepalive",
+                replace_existing=True,
+                seconds=job.email_api.keepalive,
+            )
 
     def reload_config(self) -> bool:
         """Update jobs with new intervals, trigger email check again."""  # TODO
         return True
 
-    def update_important(self, email: str, threads: int = 0, messages: int = 0, clear: bool = False) -> None:
-        """Update the count of important messages, grouped by email."""
-        if clear:
-            self.important[email] = [0, 0]
-            return
-
-        self.important[email][0] += threads
-        self.important[email][1] += messages
-
-        sum_threads = sum_messages = 0
-        for count_threads, count_messages in self.important.values():
-            sum_threads += count_threads
-            sum_messages += count_messages
-        important = format_count(sum_threads, sum_messages)
-        if important:
-            self.app.title = f"{UT.DoubleExclamationMark} {important}"
-            return
-        self.app.title = self.app.DEFAULT_TITLE
+    def status(self) -> dict[str, Any] | None:
+        """Unread email of each account, as published by the last checks."""
+        _, states = self.status_board.snapshot()
+        _, threads, messages = self.important.snapshot()
+        return {
+            "accounts": [state.as_dict() for state in states.values()],
+            "important": {"threads": threads, "messages": messages},
+        }
 
+    def stop(self) -> None:
+        """Release the leases, so other apps take over the accounts right away."""
+        for job in list(self.jobs.values()):
+            job.release_lease()
 
-@dataclass
-class Label:
-    """An email label."""
+    def watchdog(self) -> None:
+        """Report jobs that are running past their deadline and abort their connections, so the jobs fail fast.
 
-    id: str
-    name: str
-    anchor: str | None = None
-    check_unread: bool = True
-    special: bool = False
-    min_threads: int = 0
-    min_messages: int = 0
-
-
-class LabelMenuItem(rumps.MenuItem):
-    """A menu item for an email label."""
-
-    label: Label
-
-
-# TODO: inherit from UserList and keep internal dicts to search by id/name
-#  from collections import UserList
-class GmailLabelCollection:
-    """A collection of Gmail labels."""
-
-    SPECIAL_LABELS = (
-        Label("INBOX", "Inbox", "inbox"),
-        Label("UNREAD", "Unread"),
-        Label("STARRED", "Starred", "starred"),
-        Label("IMPORTANT", "Important", "imp"),
-        Label("CHAT", "Chat", "chats"),
-        Label("SENT", "Sent", "sent"),
-        Label("DRAFT", "Drafts", "drafts"),
-        Label("SPAM", "Spam", "spam"),
-        Label("TRASH", "Trash", "trash"),
-        Label("CATEGORY_PERSONAL", "Category/Personal"),
-        Label("CATEGORY_SOCIAL", "Category/Social", "category/social"),
-        Label("CATEGORY_UPDATES", "Category/Updates", "category/updates"),
-        Label("CATEGORY_FORUMS", "Category/Forums", "category/forums"),
-        Label("CATEGORY_PROMOTIONS", "Category/Promotions", "category/promotions"),
-    )
-
-    def __init__(self):
-        """Init the collection with the special labels."""
-        self._labels: dict[str, Label] = {}
-        for label in self.SPECIAL_LABELS:
-            label.special = True
-            # On special labels, only check the inbox by default
-            label.check_unread = label.id == "INBOX"
-            self.add(label)
-        self.fetched = False
-
-    def add(self, label: Label):
-        """Add a label to the collection."""
-        if label.id in self._labels:
-            return
-
-        if not label.special:
-            label.anchor = "label/" + label.name.replace(" ", "+")
-            label.check_unread = True
-
-        self._labels[label.id] = label
-
-    def items(self):
-        """Return the labels as dictionary items."""
-        return self._labels.items()
-
-
-@dataclass(kw_only=True)
-class Server:
-    """Server information."""
-
-    name: str
-    host: str
-    port: int
-    webmail_url: str
-    search_unread_anchor: str
-    domains: list[str] = field(default_factory=list)
-    api_class: type[ImapApi | GmailApi]
-
-
-@dataclass
-class BaseApi:
-    """Base class for API wrappers."""
-
-    server: Server
-    email: str
-
-    def build_url(self, anchor: str) -> str:
-        """Build the web URL for a label."""
-        return f"{self.server.webmail_url}{anchor}?_email={self.email}"
-
-    def build_unread_url(self) -> str:
-        """Build the web URL for the unread messages."""
-        return f"{self.server.webmail_url}{self.server.search_unread_anchor}?_email={self.email}"
-
-
-@dataclass
-class GmailApi(BaseApi):
-    """Gmail API wrapper."""
-
-    gmail_client: Any | None = field(init=False)
-
-    PYTHON_QUICKSTART_URL = "https://developers.google.com/gmail/api/quickstart/python"
-    CONSOLE_CREDENTIALS_URL = "https://console.cloud.google.com/apis/credentials"
-
-    def __post_init__(self) -> None:
-        self.labels = GmailLabelCollection()
+        Otherwise, a stalled socket would hold a scheduler thread forever, and enough of them would stop all checks.
+        """
+        for job in list(self.jobs.values()):
+            overrun = job.overrun_seconds
+            if overrun <= 0:
+                continue
+            logger.error("%s: Email check running %.0fs past its deadline", job.job_id, overrun)
+            self.status_board.publish(replace(job.state, error=f"Check running {overrun:.0f}s past its deadline"))
+            job.email_api.abort_connections()
 
-    def authenticate(self, password: str | None = None) -> bool:
-        """Authenticate using the Gmail API.
+    def refresh_menus(self, _timer: rumps.Timer | None = None) -> None:
+        """Apply the account states published since the last refresh; only changed accounts are redrawn.
 
-        The file token.pickle stores the user's access and refresh tokens, and is created automatically when the
-        authorization flow completes for the first time.
+        Several states published by a job between two refreshes are coalesced: only the latest one is drawn.
         """
-        config_dir = Path(DEFAULT_DIRS.user_config_dir)
-        token_file = config_dir / f"{self.email}-token.json"
-        credentials_file = config_dir / f"{self.email}-credentials.json"
-        if not credentials_file.exists():
-            click.secho(f"Credential file not found for {self.email}.", fg="bright_red")
-            click.echo("Follow the steps and save the OAuth 2.0 Client-ID JSON file as ", nl=False)
-            click.secho(str(credentials_file), fg="green")
-
-            # Open the URL on the browser
-            run(["open", f"{self.PYTHON_QUICKSTART_URL}?for_finickyjs={self.email}"], check=False)
-            run(["open", f"{self.CONSOLE_CREDENTIALS_URL}?for_finickyjs={self.email}"], check=False)
-
-            # Open the folder on Finder
-            run(["open", str(credentials_file.parent)], check=False)
-            return False
+        version, states = self.status_board.snapshot()
+        if version == self.applied_version:
+            return
+        self.applied_version = version
 
-        creds = None
-        # The file token.json stores the user's access and refresh tokens, and is
-        # created automatically when the authorization flow completes for the first
-        # time.
-        if token_file.exists():
-            creds = Credentials.from_authorized_user_file(str(token_file), SCOPES)
-        # If there are no (valid) credentials available, let the user log in.
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
-            else:
-                flow = InstalledAppFlow.from_client_secrets_file(str(credentials_file), SCOPES)
-                creds = flow.run_local_server(port=0, for_finickyjs=self.email)
-            # Save the credentials for the next run
-            token_file.write_text(creds.to_json())
+        for email, state in states.items():
+            job = self.jobs.get(email)
+            old_state = self.applied_states.get(email)
+            if job is None or old_state == state:
+                continue
+            job.apply_state(old_state, state)
+            self.applied_states[email] = state
 
-        self.gmail_client = build_google_api_client("gmail", "v1", credentials=creds)
-        return True
+        self.update_title(checking=any(state.checking for state in states.values()))
 
-    def fetch_labels(self) -> bool:
-        """Fetch Gmail labels.
+    def update_title(self, checking: bool = False) -> None:
+        """Show the count of important messages on the app title, or an hourglass while accounts are being checked.
 
-        :return: True if labels were fetched.
+        The title is only changed when the important count or the checking status changed since the last update.
         """
-        if not self.gmail_client or self.labels.fetched:
-            return False
-
-        request = self.gmail_client.users().labels().list(userId="me")
-        response = request.execute()
-        for label in response.get("labels") or []:
-            self.labels.add(Label(label["id"], label["name"]))
-
-        logger.debug("%s: %s", self.email, pformat(dict(self.labels.items()), width=200))
-        self.labels.fetched = True
-        return True
-
-    def unread_count(self, label: Label) -> tuple[int, int]:
-        """Return the unread thread/message count for a label.
+        version, threads, messages = self.important.snapshot()
+        if self.applied_title == (version, checking):
+            return
+        self.applied_title = (version, checking)
 
-        See https://developers.google.com/gmail/api/v1/reference/users/labels/get.
+        important = format_count(threads, messages)
+        if checking:
+            title = UT.Hourglass
+        elif important:
+            title = f"{UT.DoubleExclamationMark} {important}"
+        else:
+            title = self.app.DEFAULT_TITLE
+        if self.app.title != title:
+            self.app.title = title
 
-        :return: A tuple with unread thread and unread message count.
-        """
-        if self.gmail_client and self.labels and label.check_unread:
-            request = self.gmail_client.users().labels().get(id=label.id, userId="me")
-            response = request.execute()
-            return response["threadsUnread"], response["messagesUnread"]
-        return -1, -1
-
-        # TODO: how to read a single email message
-        # for message_dict in response["messages"]:
-        #     # https://developers.google.com/gmail/api/v1/reference/users/messages/get#python
-        #     result_dict = messages.get(userId="me", id=message_dict["id"], format="full").execute()
-        #     parts = result_dict["payload"]["parts"]
-        #     for part in parts:
-        #         body = base64.urlsafe_b64decode(part["body"]["data"].encode("ASCII"))
-        #         print("-" * 50)
-        #         pprint(body.decode(), width=200)
-
-
-@dataclass
-class ImapApi(BaseApi):
-    """IMAP API wrapper."""
-
-    imbox: Imbox = field(init=False)
-    labels: dict[str, Label] = field(init=False, default_factory=dict)
-
-    def authenticate(self, password: str | None = None) -> bool:
-        """Authenticate using IMAP."""
-        self.imbox = Imbox(
-            self.server.host,
-            port=self.server.port,
-            username=self.email.strip(),
-            password=password,
-            ssl=True,
-            ssl_context=None,
-            starttls=False,
-        )
-        return True
 
-    def fetch_labels(self) -> bool:
-        """Fetch IMAP labels."""
-        self.labels["INBOX"] = Label("INBOX", "Inbox", "inbox")
-        return True
+class LabelMenuItem(rumps.MenuItem):
+    """A menu item for an email label."""
 
-    def unread_count(self, label: Label) -> tuple[int, int]:
-        """Return the unread thread/message count for a label."""
-        count = len(self.imbox.messages(folder=label.id, unread=True))
-        return count, count
-
-
-ALLOWED_SERVERS = [
-    Server(
-        name="Fastmail",
-        host="imap.fastmail.com",
-        port=993,
-        webmail_url="https://app.fastmail.com/mail/",
-        search_unread_anchor="search:is%3Aunread/",
-        domains=[
-            "fastmail.com",
-            "sent.com",
-            "fea.st",
-            "fastmail.de",
-        ],
-        api_class=ImapApi,
-    ),
-    Server(
-        name="Gmail",
-        host="",
-        port=0,
-        webmail_url="https://mail.google.com/#",
-        search_unread_anchor="search/is%3Aunread",
-        domains=[
-            "gmail.com",
-            "googlemail.com",
-            "wolt.com",
-        ],
-        api_class=GmailApi,
-    ),
-]
-
-
-def find_server_by_domain(email: str) -> Server:
-    """Find the IMAP server by the domain of the email address."""
-    for server in ALLOWED_SERVERS:
-        for domain in server.domains:
-            if email.endswith(domain):
-                return server
-    raise ValueError(f"IMAP server not configured for this domain: {email}")
+    label: LabelState
 
 
 class EmailJob:
@@ -436,25 +275,56 @@ class EmailJob:
         labels: list[dict[str, str]] = None,
         password: str = None,
         delay: int = DEFAULT_DELAY_SECONDS,
+        timeout: int = None,
+        keepalive: int = None,
+        concurrency: int = 1,
+        max_check: str = None,
+        open_apps: list[str] = None,
+        deadline: int = EMAIL_JOB_DEADLINE_SECONDS,
     ):
         self.plugin = plugin
         self.app = app
-        server: Server = find_server_by_domain(email)
-        self.email_api: ImapApi | GmailApi = server.api_class(server, email)
-        self.authenticated = self.email_api.authenticate(password)
+        # Only check email while one of these apps is open
+        self.open_apps = open_apps or []
+        # Maximum duration of a check, enforced by the watchdog
+        self.deadline = deadline
+        # Check running on the asyncio engine
+        self.pending: Future | None = None
+        self.checker = AccountChecker(
+            email=email,
+            status_board=plugin.status_board,
+            important=plugin.important,
+            labels=labels,
+            timeout=timeout,
+            keepalive=keepalive,
+            concurrency=concurrency,
+        )
+        self.email_api = self.checker.email_api
+        self.authenticated = self.checker.authenticate(password)
         self.trigger_args = parse_interval(check or "1 hour")
+        self.check_seconds = interval_seconds(check or "1 hour")
         self.menu: rumps.MenuItem | None = None
 
-        # TODO: update the existing labels in self.email_api.labels instead
-        self.config_labels: list[Label] = []
-        for data in labels or []:
-            data.setdefault("id", data.get("name", ""))
-            self.config_labels.append(Label(**data))  # type: ignore
-
-        # Add a few seconds of delay before triggering the first request to Gmail
+        # With a maximum interval, poll faster after new mail or user interaction, and back off while quiet
+        self.interval: AdaptiveInterval | None = None
+        if max_check:
+            self.interval = AdaptiveInterval(interval_seconds(check or "1 hour"), interval_seconds(max_check))
+        self.last_unread_total = 0
+        self.recent_interaction = False
+
+        # With a lease directory, only one app (on any host) polls this account; the others read its results.
+        # The lease is released after each check; its TTL only matters if the poller dies in the middle of a check
+        self.lease: Lease | None = None
+        if EMAIL_LEASE_DIR:
+            longest = self.interval.max_seconds if self.interval else interval_seconds(check or "1 hour")
+            self.lease = Lease(Path(EMAIL_LEASE_DIR), email, 2 * longest + deadline)
+
+        # Add a few seconds of delay before triggering the first request to Gmail, or resume the schedule of the
+        # last run before the app was restarted; start times are jittered so accounts are not checked all at once
         # TODO: Configure the optional delay on the config.toml file
         self.trigger_args.update(
-            name=f"{self.__class__.__name__}: {email}", start_date=datetime.now() + timedelta(seconds=delay)
+            name=f"{self.__class__.__name__}: {email}",
+            start_date=app.job_history.start_date(email, interval_seconds(check or "1 hour"), delay),
         )
 
     def add_to_menu(self, menuitem):
@@ -480,100 +350,187 @@ class EmailJob:
 
     def __call__(self, *args, **kwargs):
         """Check Gmail for new mail on inbox and specific labels."""
-        self.check_unread_labels()
+        if self.open_apps and not PROCESS_TABLE.any_running(self.open_apps):
+            logger.debug("%s: Skipping email check because none of these apps are open %s", self.job_id, self.open_apps)
+            return
+        if self.lease and not self.acquire_lease():
+            return
+        if EMAIL_ASYNC_ENGINE:
+            self.submit_check()
+            return
+        try:
+            self.checked(self.checker.check())
+        except RateLimitError as err:
+            self.rate_limited(err)
+        finally:
+            self.release_lease()
+
+    def checked(self, state: AccountState) -> None:
+        """Adapt the polling interval after a check, and share the results if this app holds the lease."""
+        self.adapt_interval(state.unread_messages)
+        if self.lease:
+            self.lease.publish(state.as_dict())
+
+    def acquire_lease(self) -> bool:
+        """Acquire the lease to poll this account; otherwise, show the results published by another app.
+
+        The lease is released after each check, so another app takes over right away if this one stops.
+        Results published by another app less than half an interval ago are shown instead of polling again,
+        unless the user asked for a check.
+        """
+        assert self.lease is not None
+        if not self.lease.acquire():
+            self.follow_leader()
+            return False
+        published = self.lease.read_published()
+        checked_at = AccountState.from_dict(published).checked_at if published else None
+        interval = self.interval.seconds if self.interval else self.check_seconds
+        if not self.recent_interaction and checked_at and checked_at > datetime.now() - timedelta(seconds=interval / 2):
+            self.follow_leader()
+            self.lease.release()
+            return False
+        return True
+
+    def release_lease(self) -> None:
+        """Release the lease after a check."""
+        if self.lease:
+            self.lease.release()
+
+    def follow_leader(self) -> None:
+        """Show the results published by the app that holds the lease of this account, instead of polling."""
+        assert self.lease is not None
+        published = self.lease.read_published()
+        if published:
+            self.checker.adopt(AccountState.from_dict(published))
+
+    def rate_limited(self, err: RateLimitError) -> None:
+        """Slow down when the server is throttling requests."""
+        logger.warning("%s: Rate limited by the server: %s", self.email_api.email, err)
+        if self.interval:
+            self.reschedule(self.interval.rate_limited(err.retry_after))
+
+    def submit_check(self) -> None:
+        """Check on the asyncio engine; the scheduler thread returns right away, instead of waiting for the servers.
+
+        The engine cancels the check at the deadline.
+        """
+        if self.pending is not None and not self.pending.done():
+            logger.debug("%s: Previous check still running on the engine", self.job_id)
+            return
+        self.pending = EMAIL_ENGINE.submit(self.checker.check_async(), self.deadline)
+        self.pending.add_done_callback(self.check_done)
+
+    def check_done(self, future: Future) -> None:
+        """Log the outcome of a check that ran on the asyncio engine."""
+        try:
+            self.checked(future.result())
+        except RateLimitError as err:
+            self.rate_limited(err)
+        except Exception:  # noqa: B902
+            logger.exception("%s: Email check failed", self.job_id)
+        finally:
+            self.release_lease()
+
+    @property
+    def overrun_seconds(self) -> float:
+        """Seconds the running check is past its deadline; zero or negative if it's not running late."""
+        started_at = self.checker.started_at
+        if started_at is None:
+            return 0.0
+        return time.monotonic() - started_at - self.deadline
+
+    @property
+    def state(self) -> AccountState:
+        """Last state of the account published to the status board; the menu is drawn from it on the main thread."""
+        return self.checker.state
+
+    @property
+    def job_id(self) -> str:
+        """ID of this job on the scheduler."""
+        return self.email_api.email
+
+    def reschedule(self, seconds: float) -> None:
+        """Change the interval of this job on the scheduler, if it changed."""
+        job = self.app.scheduler.get_job(self.job_id)
+        if job is None or getattr(job.trigger, "interval", None) == timedelta(seconds=seconds):
+            return
+        logger.debug("%s: Checking email every %ss", self.email_api.email, seconds)
+        try:
+            self.app.scheduler.reschedule_job(self.job_id, trigger="interval", seconds=seconds)
+        except JobLookupError:
+            pass
+
+    def user_interacted(self) -> None:
+        """The user is paying attention to this account: poll faster."""
+        if self.interval:
+            self.recent_interaction = True
+            self.reschedule(self.interval.activity())
+
+    def adapt_interval(self, unread_total: int) -> None:
+        """Poll faster when there is new mail, back off while the account stays quiet."""
+        if not self.interval:
+            return
+        active = unread_total > self.last_unread_total or self.recent_interaction
+        self.last_unread_total = unread_total
+        self.recent_interaction = False
+        self.reschedule(self.interval.activity() if active else self.interval.quiet())
 
     def check_now_clicked(self, sender: rumps.MenuItem | None):
-        """Callback executed when a check is manually requested."""
-        self.check_unread_labels()
+        """Callback executed when a check is manually requested.
+
+        The check runs on the scheduler, so the main thread (and the menu) is not blocked while it runs.
+        """
+        self.user_interacted()
+        try:
+            self.app.scheduler.modify_job(self.job_id, next_run_time=datetime.now())
+        except JobLookupError:
+            logger.warning("%s: Job not found on the scheduler", self.email_api.email)
 
     def open_unread_messages_clicked(self, sender: rumps.MenuItem | None):
         """Callback executed when the user wants to open the unread messages on the browser."""
+        self.user_interacted()
         url = self.email_api.build_unread_url()
         logger.debug("Opening URL on browser: %s", url)
         run(["open", url], check=False)
 
     def label_clicked(self, menu: LabelMenuItem):
         """Callback executed when a label menu item is clicked."""
-        label: Label = menu.label
+        self.user_interacted()
+        label: LabelState = menu.label
         url = self.email_api.build_url(label.anchor)
         logger.debug("Opening URL on browser: %s", url)
         run(["open", url], check=False)
 
-    def check_unread_labels(self):
-        """Check unread labels."""
+    def apply_state(self, old: AccountState | None, new: AccountState) -> None:
+        """Change only the menu items that differ between the states; called on the main thread."""
         self.create_main_menu()
         if self.menu is None:
             return
 
-        self.app.title = UT.Hourglass
-
-        self.email_api.fetch_labels()
-
-        current_time = datetime.now().strftime("%H:%M:%S")
-        logger.debug("Checking email %s at %s", self.email_api.email, current_time)
-        last_checked_menu: rumps.MenuItem = self.menu[Menu.CheckNow.value]
-        last_checked_menu.title = f"{CHECK_NOW_LAST_CHECK}{current_time})"
-
-        new_mail = has_important = False
-        total_unread_threads = total_unread_messages = 0
-        self.plugin.update_important(self.email_api.email, clear=True)
-        for _label_id, label in self.email_api.labels.items():
-            config_label: Label | None = None
-            for i in self.config_labels:
-                if label.name.casefold() == i.name.casefold():
-                    config_label = i
-                    break
-            if config_label:
-                if not config_label.check_unread:
-                    continue
-                # TODO: config labels and labels should be a single collection
-                label.check_unread = config_label.check_unread
-            elif not label.check_unread:
-                continue
-
-            menu_already_exists = label.name in self.menu
-            unread_threads, unread_messages = self.email_api.unread_count(label)
-
-            # Only show labels with unread messages
-            if unread_threads <= 0 or unread_messages <= 0:
-                if menu_already_exists:
-                    # Remove the menu if it exists
-                    del self.menu[label.name]
-                continue
-
-            if not menu_already_exists:
-                label_menuitem = LabelMenuItem(label.name, callback=self.label_clicked)
-                label_menuitem.label = label
-                self.add_to_menu(label_menuitem)
+        if new.checked_at and (old is None or old.checked_at != new.checked_at):
+            last_checked_menu: rumps.MenuItem = self.menu[Menu.CheckNow.value]
+            last_checked_menu.title = f"{CHECK_NOW_LAST_CHECK}{new.checked_at:%H:%M:%S})"
+
+        old_labels = {label.name: label for label in old.labels} if old else {}
+        new_labels = {label.name: label for label in new.labels}
+        for name in old_labels.keys() - new_labels.keys():
+            if name in self.menu:
+                del self.menu[name]
+        for name, label_state in new_labels.items():
+            if name in self.menu:
+                label_menuitem = self.menu[name]
             else:
-                label_menuitem = self.menu[label.name]
-
-            important = ""
-            if config_label:
-                if (config_label.min_threads and unread_threads >= config_label.min_threads) or (
-                    config_label.min_messages and unread_messages >= config_label.min_messages
-                ):
-                    important = f"{UT.HeavyExclamationMarkSymbol}"
-                    has_important = True
-                    self.plugin.update_important(self.email_api.email, unread_threads, unread_messages)
-
-            # Show unread count of threads for each label
-            total_unread_threads += unread_threads
-            total_unread_messages += unread_messages
-            label_menuitem.title = f"{important}{label.name}: {format_count(unread_threads, unread_messages)}"
-            new_mail = True
-
-        important = f"{UT.HeavyExclamationMarkSymbol}" if has_important else ""
-        envelope = ""
-        if total_unread_threads > 0 or total_unread_messages > 0:
-            envelope = f"{important}{UT.Envelope} {format_count(total_unread_threads, total_unread_messages)} | "
-        self.menu.title = f"{envelope}{self.email_api.email}"
-
-        if not new_mail:
-            if Menu.NoNewMail.value not in self.menu:
+                label_menuitem = LabelMenuItem(name, callback=self.label_clicked)
+                self.add_to_menu(label_menuitem)
+            label_menuitem.label = label_state
+            if old_labels.get(name) != label_state:
+                label_menuitem.title = label_state.title
+
+        if new.checked_at:
+            if not new_labels and Menu.NoNewMail.value not in self.menu:
                 self.add_to_menu(Menu.NoNewMail.value)
-        else:
-            if Menu.NoNewMail.value in self.menu:
+            elif new_labels and Menu.NoNewMail.value in self.menu:
                 del self.menu[Menu.NoNewMail.value]
 
-        self.plugin.update_important(self.email_api.email)
+        if self.menu.title != new.title:
+            self.menu.title = new.title
@@ -1,12 +1,27 @@
 """Email IMAP sources (Fastmail, Gmail, etc.)."""
 
-from collections.abc import Iterator
-from typing import Optional
+from collections.abc import Callable, Iterator
+from datetime import date, datetime
+from typing import Any, Optional
 from urllib.parse import quote_plus
 
 import pendulum
 from imbox import Imbox
 
+from dontforget.constants import IMAP_BATCH_SIZE, IMAP_FETCH_CHUNK_SIZE
+from dontforget.generic import parse_interval
+from dontforget.imap import (
+    IMAP_POOL,
+    ImapConnection,
+    chunks,
+    fetch_headers,
+    folder_name,
+    move_messages,
+    search_criteria,
+    search_uids,
+    select_folder,
+    store_flags,
+)
 from dontforget.pipes import BaseSource
 from dontforget.typedefs import JsonDict
 
@@ -14,61 +29,106 @@ from dontforget.typedefs import JsonDict
 class EmailSource(BaseSource):
     """Email source."""
 
-    imbox: Imbox
-    current_uid: Optional[bytes] = None
+    connection: Optional[ImapConnection] = None
+    folder: str
     search_url: str
     search_date_format: str
     mark_read = False
     archive = False
     archive_folder: str
+    batch_size: int = IMAP_BATCH_SIZE
+    search_from: Optional[str] = None
+
+    def __init__(self):
+        # UIDs of messages that were pushed; they are flagged/moved in bulk
+        self.processed_uids: list[bytes] = []
+        # The Imbox connection where the folder was last selected
+        self._selected_on: Optional[Imbox] = None
 
     def pull(self, connection_info: JsonDict) -> Iterator[JsonDict]:
-        """Pull emails from IMAP sources."""
-        self.imbox = Imbox(
+        """Pull emails from IMAP sources.
+
+        The connection is leased from the shared pool and given back by :py:meth:`on_finish()`.
+        """
+        self.connection = IMAP_POOL.acquire(
             connection_info["hostname"],
-            port=connection_info.get("port", None),
-            username=connection_info["user"],
-            password=connection_info["password"],
-            ssl=True,
-            ssl_context=None,
-            starttls=False,
+            connection_info.get("port", 993),
+            connection_info["user"],
+            connection_info["password"],
         )
         self.search_url = connection_info["search_url"]
         self.search_date_format = connection_info["search_date_format"]
         self.mark_read = connection_info.get("mark_read", False)
         self.archive = connection_info.get("archive", False)
         self.archive_folder = connection_info["archive_folder"]
+        self.batch_size = connection_info.get("batch_size", IMAP_BATCH_SIZE)
+        self.search_from = connection_info.get("from")
 
-        kwargs = {}
-        search_from = connection_info.get("from")
-        if search_from:
-            kwargs["sent_from"] = search_from
+        # Pooled connections might have another folder selected, so always select one
         label = connection_info.get("label")
+        self.folder = connection_info.get("folder") or ("all" if label else "INBOX")
+
+        if connection_info.get("headers_only", False):
+            since = parse_since(connection_info.get("since"))
+            yield from self.pull_headers(label, since, connection_info.get("chunk_size", IMAP_FETCH_CHUNK_SIZE))
+        else:
+            yield from self.pull_messages(label)
+
+    def pull_messages(self, label: Optional[str]) -> Iterator[JsonDict]:
+        """Pull whole messages (headers and body) with Imbox."""
+        kwargs = {"folder": self.folder}
+        if self.search_from:
+            kwargs["sent_from"] = self.search_from
         if label:
-            kwargs.update(folder="all", label=label)
-        folder = connection_info.get("folder")
-        if folder:
-            kwargs.update(folder=folder)
-        messages = self.imbox.messages(**kwargs)
+            kwargs["label"] = label
+
+        def search(imbox: Imbox):
+            self._selected_on = imbox
+            return imbox.messages(**kwargs)
+
+        messages = self.connection.run(search)
         if not messages:
-            return []
+            return
 
         for uid, message in messages:
-            self.current_uid = uid
-            date = pendulum.instance(message.parsed_date).date()
-            subject: str = " ".join(message.subject.splitlines())
-
             # First sender of the email
             message_from = message.sent_from[0].get("email") if message.sent_from else None
-            url = self.build_search_url(search_from or message_from, date, date.add(days=1), subject)
+            yield self.build_item(uid, message.subject, message_from, message.parsed_date)
+
+    def pull_headers(self, label: Optional[str], since: Optional[date], chunk_size: int) -> Iterator[JsonDict]:
+        """Pull only the headers that are needed, in chunks of UIDs, without downloading message bodies."""
+        criteria = search_criteria(self.search_from, label, since)
+        uids = self.run_in_folder(lambda imbox: search_uids(imbox.connection, criteria))
+        for chunk in chunks(uids, chunk_size):
+            for headers in self.run_in_folder(lambda imbox, chunk=chunk: list(fetch_headers(imbox.connection, chunk))):
+                yield self.build_item(headers.uid, headers.subject, headers.from_email, headers.parsed_date)
+
+    def run_in_folder(self, func: Callable[[Imbox], Any]) -> Any:
+        """Run a command on the source folder, selecting it again if the connection was reopened."""
+
+        def run_selected(imbox: Imbox):
+            if imbox is not self._selected_on:
+                select_folder(imbox, self.folder)
+                self._selected_on = imbox
+            return func(imbox)
 
-            yield {
-                "from_": search_from or message_from,
-                "uid": uid.decode(),
-                "url": url,
-                "subject": subject,
-                "parsed_date": message.parsed_date.isoformat(),
-            }
+        return self.connection.run(run_selected)
+
+    def build_item(
+        self, uid: bytes, subject: str, message_from: Optional[str], parsed_date: Optional[datetime]
+    ) -> JsonDict:
+        """Build the item that is pushed to the target."""
+        parsed_date = parsed_date or pendulum.now()
+        day = pendulum.instance(parsed_date).date()
+        subject = " ".join(subject.splitlines())
+        url = self.build_search_url(self.search_from or message_from, day, day.add(days=1), subject)
+        return {
+            "from_": self.search_from or message_from,
+            "uid": uid.decode(),
+            "url": url,
+            "subject": subject,
+            "parsed_date": parsed_date.isoformat(),
+        }
 
     def build_search_url(
         self, from_: str = None, after: pendulum.Date = None, before: pendulum.Date = None, subject=None
@@ -87,11 +147,47 @@ class EmailSource(BaseSource):
         quoted_terms = quote_plus(" ".join(search_terms))
         return f"{self.search_url}{quoted_terms}"
 
-    def on_success(self):
-        """Mark email as read and/or archive it, if requested."""
-        if not self.current_uid:
+    def on_success(self, item: JsonDict):
+        """Collect the UID of the email, to mark it as read and/or archive it in bulk later, if requested."""
+        if not self.mark_read and not self.archive:
+            return
+        self.processed_uids.append(item["uid"].encode())
+        if len(self.processed_uids) >= self.batch_size:
+            self.apply_processed()
+
+    def on_failure(self, item: JsonDict):
+        """Leave the email untouched, so it will be pulled again on the next run."""
+
+    def on_finish(self):
+        """Apply pending changes and give the connection back to the pool."""
+        if self.connection is None:
+            return
+        try:
+            self.apply_processed()
+        finally:
+            IMAP_POOL.release(self.connection)
+            self.connection = None
+
+    def apply_processed(self):
+        """Mark processed emails as read and/or archive them, with a few UID set commands."""
+        if not self.processed_uids or self.connection is None:
             return
-        if self.mark_read:
-            self.imbox.mark_seen(self.current_uid)
-        if self.archive:
-            self.imbox.move(self.current_uid, self.archive_folder)
+        uids, self.processed_uids = self.processed_uids, []
+
+        def apply(imbox: Imbox):
+            if self.mark_read:
+                store_flags(imbox.connection, uids)
+            if self.archive:
+                move_messages(imbox.connection, uids, folder_name(imbox, self.archive_folder))
+
+        self.run_in_folder(apply)
+
+
+def parse_since(value: Optional[str]) -> Optional[date]:
+    """Parse the ``since`` option: an interval like "30 days" or a date like "2024-05-03"."""
+    if not value:
+        return None
+    interval = parse_interval(value)
+    if interval:
+        return pendulum.today().subtract(**interval).date()
+    return pendulum.parse(value).date()
@@ -11,10 +11,10 @@ from dontforget.typedefs import JsonDict
 class RedmineSource(BaseSource):
     """Redmine source."""
 
-    def on_success(self):
+    def on_success(self, item: JsonDict):
         """Hook to do something when an item was pushed successfully."""
 
-    def on_failure(self):
+    def on_failure(self, item: JsonDict):
         """Hook to do something when an item failed when pushed."""
 
     def pull(self, connection_info: JsonDict) -> Iterator[JsonDict]:
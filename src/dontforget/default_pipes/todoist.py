@@ -4,9 +4,15 @@
 - `Python module <https://github.com/Doist/todoist-python>`_
 """
 
+import hashlib
+import json
 import logging
+import uuid
 from datetime import datetime
 from typing import Any, Optional
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
 
 import click
 import jmespath
@@ -14,33 +20,71 @@ from deprecated import deprecated
 from marshmallow import Schema, ValidationError, fields
 from todoist import TodoistAPI
 
+from dontforget.cache import CACHE
+from dontforget.constants import TODOIST_SYNC_TTL_SECONDS, TODOIST_TIMEOUT_SECONDS
 from dontforget.generic import SingletonMixin
 from dontforget.pipes import BaseTarget
 from dontforget.settings import LOG_LEVEL
 from dontforget.typedefs import JsonDict
 
+TODOIST_API_URL = "https://api.todoist.com/api/v1/"
+
 PROJECTS_NAME_ID_JMEX = jmespath.compile("projects[*].[name,id]")
 DictProjectId = dict[str, int]
 
+# Cache namespace of Todoist sync data, keyed by a hash of the API token
+TODOIST_CACHE = "todoist"
+
 LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(LOG_LEVEL)
 
 
+def merge_resources(old: list[Any], changed: list[Any]) -> list[Any]:
+    """Merge the resources of an incremental sync into the old ones, by ID; deleted resources are removed.
+
+    >>> merge_resources(
+    ...     [{"id": 1, "name": "a"}, {"id": 2, "name": "b"}],
+    ...     [{"id": 2, "name": "B"}, {"id": 1, "is_deleted": True}, {"id": 3, "name": "c"}],
+    ... )
+    [{'id': 2, 'name': 'B'}, {'id': 3, 'name': 'c'}]
+    """
+    merged = {}
+    unidentified = []
+    for resource in [*old, *changed]:
+        if not isinstance(resource, dict) or "id" not in resource:
+            unidentified.append(resource)
+            continue
+        if resource.get("is_deleted"):
+            merged.pop(resource["id"], None)
+        else:
+            merged[resource["id"]] = resource
+    return [*merged.values(), *unidentified]
+
+
 class Todoist(SingletonMixin):
     """A wrapper for the Todoist API."""
 
     def __init__(self, api_token: str) -> None:
         super().__init__()
         self.api = TodoistAPI(api_token)
+        self.cache_key = hashlib.sha256(api_token.encode()).hexdigest()[:16]
         self.data: JsonDict = {}
         self.projects: DictProjectId = {}
         self._allow_creation = False
 
     def smart_sync(self):
-        """Only perform a full resync if needed."""
+        """Only perform a full resync if needed.
+
+        Sync data is cached, so a new process only fetches what changed since the last sync of a previous process.
+        """
         if not self.data.get("projects", {}):
-            # If internal data has no projects, reset the state and a full (slow) sync will be performed.
-            self.api.reset_state()
+            self.data = CACHE.get(TODOIST_CACHE, self.cache_key) or {}
+            if self.data.get("projects", {}) and self.data.get("sync_token"):
+                self.api.sync_token = self.data["sync_token"]
+            else:
+                # If internal data has no projects, reset the state and a full (slow) sync will be performed.
+                self.data = {}
+                self.api.reset_state()
 
         partial_data = {}
         for attempt in range(3):
@@ -57,6 +101,7 @@ class Todoist(SingletonMixin):
             raise click.Abort()
 
         self._merge_new_data(partial_data)
+        CACHE.set(TODOIST_CACHE, self.cache_key, self.data, ttl=TODOIST_SYNC_TTL_SECONDS)
 
         # TODO: replace "todoist-python" by https://github.com/Doist/todoist-api-python
         #  getting an error message because of a deprecated endpoint.
@@ -70,15 +115,13 @@ class Todoist(SingletonMixin):
         self.projects = dict(PROJECTS_NAME_ID_JMEX.search(self.data))
 
     def _merge_new_data(self, partial_data: JsonDict):
+        """Merge the data of an incremental sync: changed resources replace the old ones, deleted ones are removed."""
         if not self.data:
-            self.data = partial_data
-            return
+            self.data = {}
 
         for key, value in partial_data.items():
             if isinstance(value, list):
-                if key not in self.data:
-                    self.data[key] = []
-                self.data[key].extend(value)
+                self.data[key] = merge_resources(self.data.get(key, []), value)
             elif isinstance(value, dict):
                 if key not in self.data:
                     self.data[key] = {}
@@ -166,6 +209,95 @@ class Todoist(SingletonMixin):
         ]
 
 
+class TodoistApiError(RuntimeError):
+    """A request to the Todoist API failed."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(status, message)
+        self.status = status
+        self.message = message
+
+    def __str__(self) -> str:
+        return f"HTTP {self.status}: {self.message}"
+
+
+class TodoistRestApi:
+    """A minimal client of the Todoist API v1, to change single tasks without syncing all data.
+
+    - `Docs <https://developer.todoist.com/api/v1/>`_
+    """
+
+    def __init__(self, api_token: str, timeout: float = TODOIST_TIMEOUT_SECONDS) -> None:
+        self.timeout = timeout
+        self._headers = {"Authorization": f"Bearer {api_token}", "Accept": "application/json"}
+
+    def request(
+        self, method: str, path: str, data: Optional[JsonDict] = None, form: Optional[JsonDict] = None, **params: Any
+    ) -> Any:
+        """Send a request; the data is sent as JSON, and the form is sent URL encoded."""
+        query = urlencode({key: value for key, value in params.items() if value is not None})
+        url = TODOIST_API_URL + path + (f"?{query}" if query else "")
+        headers = dict(self._headers)
+        body = None
+        if data is not None:
+            headers["Content-Type"] = "application/json"
+            body = json.dumps(data).encode()
+        elif form is not None:
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+            body = urlencode(form).encode()
+        LOGGER.debug("%s %s", method, url)
+        try:
+            with urlopen(Request(url, data=body, headers=headers, method=method), timeout=self.timeout) as response:
+                content = response.read()
+        except HTTPError as err:
+            raise TodoistApiError(err.code, err.read().decode(errors="replace")[:200]) from err
+        return json.loads(content) if content else None
+
+    def _all(self, path: str, **params: Any) -> list[JsonDict]:
+        """Get all pages of a list of resources."""
+        results: list[JsonDict] = []
+        cursor = None
+        while True:
+            page = self.request("GET", path, cursor=cursor, **params)
+            results.extend(page["results"])
+            cursor = page.get("next_cursor")
+            if not cursor:
+                return results
+
+    def find_project_id(self, exact_name: str) -> Optional[str]:
+        """Find a project ID by its exact name."""
+        return next((project["id"] for project in self._all("projects") if project["name"] == exact_name), None)
+
+    def find_task(self, project_id: str, exact_content: str) -> Optional[JsonDict]:
+        """Find an active task of a project by its exact content."""
+        tasks = self._all("tasks", project_id=project_id)
+        return next((task for task in tasks if task["content"] == exact_content), None)
+
+    def add_task(self, auto_reminder: bool = False, **fields: Any) -> JsonDict:
+        """Add a task.
+
+        :param auto_reminder: Add the default reminder of the user, if the task is due at a time.
+            The tasks endpoint doesn't add reminders, so the task is added with a sync command instead,
+            and only its ID is returned.
+        """
+        if not auto_reminder:
+            return self.request("POST", "tasks", fields)
+        args = {key: value for key, value in fields.items() if key != "due_string"}
+        if "due_string" in fields:
+            args["due"] = {"string": fields["due_string"]}
+        temp_id, command_id = str(uuid.uuid4()), str(uuid.uuid4())
+        command = {"type": "item_add", "temp_id": temp_id, "uuid": command_id, "args": {**args, "auto_reminder": True}}
+        response = self.request("POST", "sync", form={"commands": json.dumps([command])})
+        status = response["sync_status"][command_id]
+        if status != "ok":
+            raise TodoistApiError(status.get("http_code", 400), status.get("error", str(status)))
+        return {"id": response["temp_id_mapping"][temp_id]}
+
+    def update_task(self, task_id: str, **fields: Any) -> JsonDict:
+        """Update a task; an error with status 404 is raised if it doesn't exist anymore."""
+        return self.request("POST", f"tasks/{task_id}", fields)
+
+
 class TodoistSchema(Schema):
     """Task schema."""
 
@@ -4,20 +4,38 @@
 * https://github.com/AuHau/toggl-cli/blob/master/toggl/api/models.py
 """
 
+import json
 import logging
 from dataclasses import dataclass
-from datetime import datetime
-from typing import Optional, Union
+from datetime import datetime, timezone
+from typing import Any, Optional
 
 import click
 import maya
+from apscheduler.jobstores.base import JobLookupError
 from clib.files import fzf
 from click import ClickException
 from rumps import MenuItem
 from toggl import api
 
 from dontforget.app import BasePlugin, DontForgetApp
-from dontforget.settings import JOBLIB_MEMORY, LOG_LEVEL, TOGGL_API_TOKEN, load_config_file
+from dontforget.cache import CACHE
+from dontforget.constants import DEFAULT_DELAY_SECONDS, GO_HOME_INTERVAL_SECONDS, TOGGL_ENTRIES_SYNC_SECONDS
+from dontforget.home import check_go_home
+from dontforget.scheduling import RateLimitError
+from dontforget.settings import (
+    CONFIG_FILE_PATH,
+    HOME_TOGGL_NOT_WORK_DESCRIPTIONS,
+    HOME_TOGGL_NOT_WORK_TAGS,
+    LOG_LEVEL,
+    TODOIST_API_TOKEN,
+    TOGGL_API_TOKEN,
+    load_config_file,
+)
+from dontforget.toggl_store import TOGGL_STORE, TOTALS_GROUPS, TogglApiError, TogglCatalog
+
+# Cache namespace of the shortcut index, resolved to client and project IDs
+TOGGL_SHORTCUTS_CACHE = "toggl-shortcuts"
 
 logger = logging.getLogger(__name__)
 logger.setLevel(LOG_LEVEL)
@@ -34,29 +52,6 @@ class ShortcutDC:
     project_id: Optional[int] = None
 
 
-@dataclass
-class ClientDC:
-    """A client on Toggl."""
-
-    id: int
-    name: str
-
-
-ClientStore = dict[Union[int, str], ClientDC]
-
-
-@dataclass
-class ProjectDC:
-    """A project on Toggl."""
-
-    id: int
-    name: str
-    client: ClientDC
-
-
-ProjectStore = dict[Union[int, str], ProjectDC]
-
-
 class TogglMenuItem(MenuItem):
     """A Toggl menu item."""
 
@@ -64,38 +59,12 @@ class TogglMenuItem(MenuItem):
     updated: bool = True
 
 
-@JOBLIB_MEMORY.cache
-def fetch_all_clients() -> ClientStore:
-    """Cache all Toggl clients."""
-    rv = {c.id: ClientDC(c.id, c.name) for c in api.Client.objects.all()}
-    rv.update({value.name: value for key, value in rv.items()})
-    return rv
-
-
-@JOBLIB_MEMORY.cache
-def fetch_all_projects() -> ProjectStore:
-    """Cache all Toggl projects."""
-    all_clients = fetch_all_clients()
-    rv = {}
-    for p in api.Project.objects.all():
-        if p.client_id not in all_clients:
-            # Probably an archived project with entries
-            continue
-
-        proj = ProjectDC(p.id, p.name, all_clients[p.client_id])
-        click.echo(f"Project: {p} Client: {p.client} - {proj}")
-        rv[p.id] = proj
-    rv.update({value.name: value for key, value in rv.items()})
-    return rv
-
-
 class TogglPlugin(BasePlugin):
     """Toggl plugin."""
 
     shortcuts: dict[str, ShortcutDC] = {}
     menu_items: dict[str, TogglMenuItem] = {}
-    client_store: ClientStore = {}
-    project_store: ProjectStore = {}
+    catalog: TogglCatalog = TogglCatalog()
 
     @property
     def name(self) -> str:
@@ -107,6 +76,24 @@ class TogglPlugin(BasePlugin):
         self.app = app
         if not self.set_api_token():
             return False
+        app.scheduler.add_job(
+            self.sync_time_entries,
+            "interval",
+            id="toggl-sync",
+            replace_existing=True,
+            coalesce=True,
+            seconds=TOGGL_ENTRIES_SYNC_SECONDS,
+        )
+        if TODOIST_API_TOKEN:
+            app.scheduler.add_job(
+                check_go_home,
+                "interval",
+                id="go-home",
+                replace_existing=True,
+                coalesce=True,
+                seconds=GO_HOME_INTERVAL_SECONDS,
+                start_date=app.job_history.start_date("go-home", GO_HOME_INTERVAL_SECONDS, DEFAULT_DELAY_SECONDS),
+            )
         return self.create_menu()
 
     @classmethod
@@ -149,15 +136,16 @@ class TogglPlugin(BasePlugin):
             shortcut = ShortcutDC(**data)
             logger.debug("Fetching client/project for Toggl entry: %s", shortcut)
 
-            shortcut.project_id = self.project_store[shortcut.project].id
-            shortcut.client_id = self.client_store[shortcut.client].id
+            shortcut.project_id = self.catalog.projects_by_name[shortcut.project].id
+            shortcut.client_id = self.catalog.clients_by_name[shortcut.client].id
             self.shortcuts[shortcut.name] = shortcut
+
+        CACHE.set(TOGGL_SHORTCUTS_CACHE, "index", {"key": shortcut_index_key(), "shortcuts": self.shortcuts})
         return self.shortcuts
 
     def fetch_clients_projects(self) -> "TogglPlugin":
-        """Fetch all clients and projects."""
-        self.client_store = fetch_all_clients()
-        self.project_store = fetch_all_projects()
+        """Sync clients and projects changed on Toggl, and load them from the local store."""
+        self.catalog = TOGGL_STORE.catalog()
         return self
 
     def reload_config(self) -> bool:
@@ -185,7 +173,7 @@ class TogglPlugin(BasePlugin):
     @classmethod
     def register_cli_commands(cls):
         """Register CLI commands for this plugin."""
-        return [track, what_i_did]
+        return [track, what_i_did, toggl]
 
     def track_entry(self, entry: ShortcutDC, echo=False):
         """Track an entry on Toggl."""
@@ -193,7 +181,57 @@ class TogglPlugin(BasePlugin):
         if echo:
             click.echo(msg)
         logger.debug(msg)
-        api.TimeEntry.start_and_save(description=entry.name, project=self.shortcuts[entry.name].project_id)
+        start_entry(self.shortcuts[entry.name])
+        # Store the new entry on the background, so the status shows it as running
+        try:
+            self.app.scheduler.modify_job("toggl-sync", next_run_time=datetime.now())
+        except JobLookupError:
+            logger.warning("Toggl sync job not found on the scheduler")
+
+    @staticmethod
+    def sync_time_entries() -> None:
+        """Sync the time entries stored locally."""
+        try:
+            TOGGL_STORE.sync_time_entries()
+        except (OSError, TogglApiError, RateLimitError) as err:
+            logger.error("Could not sync time entries: %s", err)
+
+    def status(self) -> Optional[dict[str, Any]]:
+        """The running time entry, as of the last sync of the local store (without calling the Toggl API)."""
+        running = TOGGL_STORE.running_entry()
+        if not running:
+            return {"tracking": None}
+        project = TOGGL_STORE.catalog(sync=False).project(running.project_id)
+        return {
+            "tracking": {
+                "description": running.description,
+                "project": project.name if project else None,
+                "client": project.client.name if project and project.client else None,
+                "started_at": running.start.isoformat(),
+            }
+        }
+
+
+def shortcut_index_key() -> str:
+    """Key of the shortcut index: it changes when the config file is saved, or when clients/projects change."""
+    return f"{CONFIG_FILE_PATH.stat().st_mtime_ns}:{TOGGL_STORE.catalog_version()}"
+
+
+def load_shortcut_index() -> dict[str, ShortcutDC]:
+    """Shortcuts resolved to client and project IDs, without parsing the config file or calling the Toggl API.
+
+    The index is rebuilt only when the config file or the Toggl catalog changed since it was stored.
+    """
+    index = CACHE.get(TOGGL_SHORTCUTS_CACHE, "index")
+    if index and index["key"] == shortcut_index_key():
+        return index["shortcuts"]
+    logger.debug("Rebuilding the Toggl shortcut index")
+    return TogglPlugin.create().fetch_shortcuts()
+
+
+def start_entry(shortcut: ShortcutDC) -> None:
+    """Start a time entry on Toggl, with a single API call."""
+    api.TimeEntry.start_and_save(description=shortcut.name, project=shortcut.project_id)
 
 
 @click.command()
@@ -202,71 +240,160 @@ def track(entry):
     """Track your work with Toggl."""
     joined_text = "".join(entry).strip().lower()
 
-    plugin = TogglPlugin.create()
-    shortcuts = plugin.fetch_shortcuts()
+    shortcuts = load_shortcut_index()
     chosen = fzf(list(shortcuts.keys()), query=joined_text)
     if not chosen:
         raise ClickException("No entry chosen")
 
-    shortcut = plugin.shortcuts[chosen]
-    plugin.track_entry(shortcut, True)
+    shortcut = shortcuts[chosen]
+    click.echo(f"Starting Toggl entry: {shortcut.name}")
+    start_entry(shortcut)
+
+
+def order_index(name: str, order_by: list[str]) -> int:
+    """Position of a project name on a pre-defined order; names that are not found go to the top.
+
+    >>> order_index("Meetings", ["Dev", "Meet"]), order_index("Other", ["Dev", "Meet"])
+    (1, -1)
+    """
+    for project_index, prefix in enumerate(order_by):
+        if name.startswith(prefix):
+            return project_index
+    return -1
 
 
 @click.command()
+@click.option("--json", "as_json", is_flag=True, default=False, help="Output JSON, with durations")
 @click.argument("date", nargs=1)
 @click.argument("report", nargs=1)
-def what_i_did(date, report):
+def what_i_did(as_json, date, report):
     """Display a report of what I did on Toggl since the chosen date."""
     plugin = TogglPlugin.create().fetch_clients_projects()
 
     report_config = plugin.plugin_config["what_i_did"][report]
     expected_client_names = set(report_config["clients"])
-    chosen_client_ids = {client.id for client in plugin.client_store.values() if client.name in expected_client_names}
+    chosen_client_ids = {
+        client.id for name, client in plugin.catalog.clients_by_name.items() if name in expected_client_names
+    }
     order_by = report_config.get("order_by", [])
 
     exclude_project_names = report_config["exclude_projects"]
-    chosen_project_ids = {
-        project.id
-        for project in plugin.project_store.values()
-        if project.client.id in chosen_client_ids and project.name not in exclude_project_names
+    chosen_projects = {
+        project.id: project
+        for project in (*plugin.catalog.projects_by_id.values(), *plugin.catalog.archived_projects_by_id.values())
+        if project.client and project.client.id in chosen_client_ids and project.name not in exclude_project_names
     }
+    # The order of each project is computed once, not for every line
+    project_order = {project_id: order_index(project.name, order_by) for project_id, project in chosen_projects.items()}
 
     start_date = maya.when(date).datetime()
-    end_date = datetime.now()
-    lines = set()
-    filtered_entries = api.TimeEntry.objects.all(start_date=start_date, end_date=end_date)
-
-    # togglCli, Toggl API and Maya have bugs at the moment, so let's log always
+    end_date = datetime.now(timezone.utc)
+    try:
+        TOGGL_STORE.sync_time_entries(start_date)
+    except (OSError, TogglApiError, RateLimitError) as err:
+        logger.error("Could not sync time entries, using the local copy: %s", err)
+    summaries = TOGGL_STORE.summarize(start_date, end_date, chosen_projects)
+
+    # Maya has bugs at the moment, so let's log always
     logger.warning(
-        "Start date '%s' parsed by Maya: %s / End date: %s / Filtered entries: %s / Chosen projects: %s",
+        "Start date '%s' parsed by Maya: %s / End date: %s / Lines: %s / Chosen projects: %s",
         date,
         start_date,
         end_date,
-        len(filtered_entries),
-        len(chosen_project_ids),
+        len(summaries),
+        len(chosen_projects),
+    )
+    summaries.sort(
+        key=lambda summary: (
+            project_order[summary.project_id],
+            chosen_projects[summary.project_id].name,
+            summary.description,
+        )
     )
-    for entry in filtered_entries:
-        logger.debug("Entry: %s", entry)
-        # TODO: The start_date and end_date filters are not working; all recent entries are being returned
-        if entry.start < start_date:
-            continue
-        try:
-            if entry.project_id not in chosen_project_ids:
-                continue
-        except AttributeError:
-            logger.error(f"This entry has no project: {entry}")
-            continue
-        lines.add(f"{plugin.project_store[entry.project_id].name}: {entry.description}")
-
-    def sort_by_project(value: str):
-        """Sort lines with a pre-defined order.
-
-        If the value is not found on the ``order_by`` list, it goes to the top.
-        """
-        for project_index, project in enumerate(order_by):
-            if value.startswith(project):
-                return project_index
-        return -1
 
-    for line in sorted(lines, key=sort_by_project):
-        click.echo(f"  - {line}")
+    if as_json:
+        lines = [
+            {
+                "client": chosen_projects[summary.project_id].client.name,
+                "project": chosen_projects[summary.project_id].name,
+                "description": summary.description,
+                "seconds": summary.seconds,
+                "entries": summary.entries,
+            }
+            for summary in summaries
+        ]
+        click.echo(json.dumps(lines))
+        return
+    for summary in summaries:
+        click.echo(f"  - {chosen_projects[summary.project_id].name}: {summary.description}")
+
+
+def format_hours(seconds: float) -> str:
+    """Format a duration in hours.
+
+    >>> format_hours(5400), format_hours(36)
+    ('1.50h', '0.01h')
+    """
+    return f"{seconds / 3600:.2f}h"
+
+
+@click.group()
+def toggl():
+    """Toggl time tracking."""
+
+
+@toggl.command()
+@click.option(
+    "--by",
+    "groups",
+    type=click.Choice(["client", *TOTALS_GROUPS]),
+    multiple=True,
+    help="Group hours by client, project, tag, day or work/not work (default: all)",
+)
+@click.option("--json", "as_json", is_flag=True, default=False, help="Output JSON, with durations in seconds")
+@click.argument("date", default="30 days ago")
+def stats(groups, as_json, date):
+    """Hours tracked on Toggl since the chosen date, from the local time entries."""
+    start_date = maya.when(date).datetime()
+    end_date = datetime.now(timezone.utc)
+    catalog = TOGGL_STORE.catalog()
+    try:
+        TOGGL_STORE.sync_time_entries(start_date)
+    except (OSError, TogglApiError, RateLimitError) as err:
+        logger.error("Could not sync time entries, using the local copy: %s", err)
+
+    all_totals: dict[str, dict[str, dict[str, int]]] = {}
+    for group in groups or ("client", *TOTALS_GROUPS):
+        totals = TOGGL_STORE.totals(
+            start_date,
+            end_date,
+            "project" if group == "client" else group,
+            HOME_TOGGL_NOT_WORK_TAGS,
+            HOME_TOGGL_NOT_WORK_DESCRIPTIONS,
+        )
+        named: dict[str, dict[str, int]] = {}
+        for total in totals:
+            name = total.key
+            if group in ("client", "project"):
+                # Projects are grouped by ID; names come from the catalog, and clients are rolled up from projects
+                project = catalog.project(total.key)
+                if group == "project":
+                    name = project.name if project else "(no project)"
+                else:
+                    name = project.client.name if project and project.client else "(no client)"
+            elif group == "tag":
+                name = total.key or "(no tag)"
+            values = named.setdefault(name, {"seconds": 0, "entries": 0})
+            values["seconds"] += total.seconds
+            values["entries"] += total.entries
+        # Days in chronological order, other groups with the most hours first
+        sort_key = (lambda item: item[0]) if group == "day" else (lambda item: -item[1]["seconds"])
+        all_totals[group] = dict(sorted(named.items(), key=sort_key))
+
+    if as_json:
+        click.echo(json.dumps(all_totals))
+        return
+    for group, named in all_totals.items():
+        click.secho(f"Hours by {group}", fg="bright_white")
+        for name, values in named.items():
+            click.echo(f"  {name}: {format_hours(values['seconds'])} ({values['entries']} entries)")
@@ -0,0 +1,796 @@
+"""Headless email checker (Gmail/IMAP): accounts, labels and unread counts, without any user interface.
+
+Checkers publish the state of each account to a :py:class:`StatusBoard`; the menu app, the CLI or any other view
+reads it from there. Without the macOS menu app dependencies, run it with ``python -m dontforget.email_checker``.
+
+Parts of the code below adapted from:
+https://github.com/gsuitedevs/python-samples/blob/master/gmail/quickstart/quickstart.py
+
+Copyright 2018 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+New format documentation:
+https://developers.google.com/gmail/api/v1/reference
+
+Old format documentation:
+https://developers.google.com/resources/api-libraries/documentation/gmail/v1/python/latest/index.html
+"""
+
+from __future__ import annotations
+
+import asyncio
+import imaplib
+import json
+import logging
+import threading
+import time
+import weakref
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field, replace
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from pprint import pformat
+from subprocess import run
+from typing import Any
+from urllib.parse import quote
+
+import click
+import httplib2
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
+from google_auth_oauthlib.flow import InstalledAppFlow
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.errors import HttpError
+
+from dontforget.cache import CACHE
+from dontforget.constants import (
+    EMAIL_JOB_DEADLINE_SECONDS,
+    GMAIL_LABELS_TTL_SECONDS,
+    IMAP_KEEPALIVE_SECONDS,
+    IMAP_TIMEOUT_SECONDS,
+)
+from dontforget.email_engine import EMAIL_ENGINE, AsyncGmailClient, AsyncImapClient
+from dontforget.email_status import AccountState, ImportantCounter, LabelState, StatusBoard, format_states
+from dontforget.imap import CONNECTION_ERRORS, IMAP_POOL, AccountKey, ImapConnection, unseen_count
+from dontforget.scheduling import RateLimitError
+from dontforget.settings import DEFAULT_DIRS, EMAIL_ASYNC_ENGINE, LOG_LEVEL, load_config_file
+
+# If modifying these scopes, delete the file token.pickle.
+SCOPES = ["https://www.googleapis.com/auth/gmail.readonly"]
+
+# Cache namespace of Gmail label metadata, keyed by email
+GMAIL_LABELS_CACHE = "gmail-labels"
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+
+@lru_cache
+def gmail_discovery_document() -> dict[str, Any]:
+    """Discovery document bundled with the Google API client, parsed once for all accounts (no network request)."""
+    return json.loads(get_static_doc("gmail", "v1"))
+
+
+@dataclass
+class Label:
+    """An email label."""
+
+    id: str
+    name: str
+    anchor: str | None = None
+    check_unread: bool = True
+    special: bool = False
+    min_threads: int = 0
+    min_messages: int = 0
+
+    def is_important(self, threads: int, messages: int) -> bool:
+        """True if the unread count reached the configured minimum."""
+        return bool(
+            (self.min_threads and threads >= self.min_threads) or (self.min_messages and messages >= self.min_messages)
+        )
+
+
+class LabelCollection:
+    """Labels of an email account, indexed by id and by casefolded name.
+
+    Labels from the config file are merged into account labels once, when either of them is added,
+    so the checker only iterates the labels that are actually checked.
+    """
+
+    def __init__(self):
+        self._by_id: dict[str, Label] = {}
+        self._by_name: dict[str, Label] = {}
+        self._config_by_name: dict[str, Label] = {}
+        self._checked: list[Label] | None = None
+        # Timestamp of the last time labels were fetched from the API (or from the cache file)
+        self.fetched_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __iter__(self) -> Iterator[Label]:
+        return iter(self._by_id.values())
+
+    def __contains__(self, label_id: str) -> bool:
+        return label_id in self._by_id
+
+    def get(self, label_id: str) -> Label | None:
+        """Get a label by its id."""
+        return self._by_id.get(label_id)
+
+    def find(self, name: str) -> Label | None:
+        """Find a label by its name (case insensitive)."""
+        return self._by_name.get(name.casefold())
+
+    def set_config(self, config_labels: list[Label]) -> None:
+        """Set the labels from the config file and merge them into existing labels."""
+        self._config_by_name = {label.name.casefold(): label for label in config_labels}
+        for label in self._by_id.values():
+            self._merge_config(label)
+        self._checked = None
+
+    def _merge_config(self, label: Label) -> None:
+        """Copy the settings of the config label with the same name, if there is one."""
+        config_label = self._config_by_name.get(label.name.casefold())
+        if config_label:
+            label.check_unread = config_label.check_unread
+            label.min_threads = config_label.min_threads
+            label.min_messages = config_label.min_messages
+
+    def add(self, label: Label) -> None:
+        """Add a label to the collection."""
+        if label.id in self._by_id:
+            return
+        self._merge_config(label)
+        self._by_id[label.id] = label
+        self._by_name[label.name.casefold()] = label
+        self._checked = None
+
+    def remove(self, label_id: str) -> None:
+        """Remove a label from the collection."""
+        label = self._by_id.pop(label_id, None)
+        if label is None:
+            return
+        self._by_name.pop(label.name.casefold(), None)
+        self._checked = None
+
+    def replace_fetched(self, labels: list[Label]) -> None:
+        """Replace fetched labels: add new ones and remove the ones that don't exist anymore."""
+        fetched_ids = {label.id for label in labels}
+        for label in [label for label in self._by_id.values() if not label.special and label.id not in fetched_ids]:
+            self.remove(label.id)
+        for label in labels:
+            self.add(label)
+
+    def checked(self) -> list[Label]:
+        """Labels whose unread messages should be checked; the list is rebuilt only when labels change."""
+        if self._checked is None:
+            self._checked = [label for label in self._by_id.values() if label.check_unread]
+        return self._checked
+
+    def items(self):
+        """Return the labels as dictionary items."""
+        return self._by_id.items()
+
+
+class GmailLabelCollection(LabelCollection):
+    """A collection of Gmail labels."""
+
+    SPECIAL_LABELS = (
+        Label("INBOX", "Inbox", "inbox"),
+        Label("UNREAD", "Unread"),
+        Label("STARRED", "Starred", "starred"),
+        Label("IMPORTANT", "Important", "imp"),
+        Label("CHAT", "Chat", "chats"),
+        Label("SENT", "Sent", "sent"),
+        Label("DRAFT", "Drafts", "drafts"),
+        Label("SPAM", "Spam", "spam"),
+        Label("TRASH", "Trash", "trash"),
+        Label("CATEGORY_PERSONAL", "Category/Personal"),
+        Label("CATEGORY_SOCIAL", "Category/Social", "category/social"),
+        Label("CATEGORY_UPDATES", "Category/Updates", "category/updates"),
+        Label("CATEGORY_FORUMS", "Category/Forums", "category/forums"),
+        Label("CATEGORY_PROMOTIONS", "Category/Promotions", "category/promotions"),
+    )
+
+    def __init__(self):
+        """Init the collection with copies of the special labels; each account changes them with its own config."""
+        super().__init__()
+        for special_label in self.SPECIAL_LABELS:
+            # On special labels, only check the inbox by default
+            self.add(replace(special_label, special=True, check_unread=special_label.id == "INBOX"))
+
+    def add(self, label: Label) -> None:
+        """Add a label to the collection."""
+        if not label.special:
+            label.anchor = "label/" + label.name.replace(" ", "+")
+            label.check_unread = True
+        super().add(label)
+
+
+@dataclass(kw_only=True)
+class Server:
+    """Server information."""
+
+    name: str
+    host: str
+    port: int
+    webmail_url: str
+    search_unread_anchor: str
+    domains: list[str] = field(default_factory=list)
+    api_class: type[ImapApi | GmailApi]
+
+
+@dataclass
+class BaseApi:
+    """Base class for API wrappers."""
+
+    server: Server
+    email: str
+    timeout: float = IMAP_TIMEOUT_SECONDS
+
+    def build_url(self, anchor: str) -> str:
+        """Build the web URL for a label."""
+        return f"{self.server.webmail_url}{anchor}?_email={self.email}"
+
+    def build_unread_url(self) -> str:
+        """Build the web URL for the unread messages."""
+        return f"{self.server.webmail_url}{self.server.search_unread_anchor}?_email={self.email}"
+
+    def abort_connections(self) -> None:
+        """Abort the connections in use, so calls blocked on them fail; new connections are opened on the next call."""
+
+    @classmethod
+    def check_credentials(cls, email: str, password: str | None = None) -> bool:
+        """Check that the credentials of an account are configured, without network calls."""
+        return True
+
+
+@dataclass
+class GmailApi(BaseApi):
+    """Gmail API wrapper."""
+
+    gmail_client: Any | None = field(init=False)
+    credentials: Credentials | None = field(init=False, default=None)
+    _async_client: AsyncGmailClient | None = field(init=False, default=None, repr=False)
+
+    PYTHON_QUICKSTART_URL = "https://developers.google.com/gmail/api/quickstart/python"
+    CONSOLE_CREDENTIALS_URL = "https://console.cloud.google.com/apis/credentials"
+
+    def __post_init__(self) -> None:
+        self.labels = GmailLabelCollection()
+        # httplib2 is not thread-safe, so each thread that calls the API needs its own HTTP object;
+        # objects of finished threads are dropped from the set when their thread-local storage is collected
+        self._local = threading.local()
+        self._https: weakref.WeakSet[AuthorizedHttp] = weakref.WeakSet()
+        self._https_lock = threading.Lock()
+
+    @classmethod
+    def check_credentials(cls, email: str, password: str | None = None) -> bool:
+        """Check that the OAuth 2.0 Client-ID file exists; if not, show the user how to create it."""
+        credentials_file = Path(DEFAULT_DIRS.user_config_dir) / f"{email}-credentials.json"
+        if credentials_file.exists():
+            return True
+        click.secho(f"Credential file not found for {email}.", fg="bright_red")
+        click.echo("Follow the steps and save the OAuth 2.0 Client-ID JSON file as ", nl=False)
+        click.secho(str(credentials_file), fg="green")
+
+        # Open the URL on the browser
+        run(["open", f"{cls.PYTHON_QUICKSTART_URL}?for_finickyjs={email}"], check=False)
+        run(["open", f"{cls.CONSOLE_CREDENTIALS_URL}?for_finickyjs={email}"], check=False)
+
+        # Open the folder on Finder
+        run(["open", str(credentials_file.parent)], check=False)
+        return False
+
+    def authenticate(self, password: str | None = None) -> bool:
+        """Authenticate using the Gmail API.
+
+        The file token.pickle stores the user's access and refresh tokens, and is created automatically when the
+        authorization flow completes for the first time.
+        """
+        if not self.check_credentials(self.email):
+            return False
+        config_dir = Path(DEFAULT_DIRS.user_config_dir)
+        token_file = config_dir / f"{self.email}-token.json"
+        credentials_file = config_dir / f"{self.email}-credentials.json"
+
+        creds = None
+        # The file token.json stores the user's access and refresh tokens, and is
+        # created automatically when the authorization flow completes for the first
+        # time.
+        if token_file.exists():
+            creds = Credentials.from_authorized_user_file(str(token_file), SCOPES)
+        # If there are no (valid) credentials available, let the user log in.
+        if not creds or not creds.valid:
+            if creds and creds.expired and creds.refresh_token:
+                creds.refresh(Request())
+            else:
+                flow = InstalledAppFlow.from_client_secrets_file(str(credentials_file), SCOPES)
+                creds = flow.run_local_server(port=0, for_finickyjs=self.email)
+            # Save the credentials for the next run
+            token_file.write_text(creds.to_json())
+
+        self.credentials = creds
+        self.gmail_client = build_from_document(gmail_discovery_document(), credentials=creds)
+        return True
+
+    @property
+    def http(self) -> AuthorizedHttp:
+        """Authorized HTTP object of the current thread."""
+        http = getattr(self._local, "http", None)
+        if http is None:
+            # Without a timeout, a stalled socket would block the thread forever
+            http = self._local.http = AuthorizedHttp(self.credentials, http=httplib2.Http(timeout=self.timeout))
+            with self._https_lock:
+                self._https.add(http)
+        return http
+
+    def abort_connections(self) -> None:
+        """Close the persistent connections of all threads; httplib2 opens new ones on the next request."""
+        with self._https_lock:
+            https = list(self._https)
+        for http in https:
+            http.close()
+
+    def load_cached_labels(self) -> bool:
+        """Load labels from the cache.
+
+        :return: True if labels were loaded.
+        """
+        cached = CACHE.get(GMAIL_LABELS_CACHE, self.email)
+        if not cached:
+            return False
+        self.labels.replace_fetched([Label(label["id"], label["name"]) for label in cached["labels"]])
+        self.labels.fetched_at = cached["fetched_at"]
+        return True
+
+    def fetch_labels(self) -> bool:
+        """Fetch Gmail labels from the cache, or from the API if the cache is older than its TTL.
+
+        New labels created on Gmail appear after the TTL, without restarting the app.
+
+        :return: True if labels were fetched from the API.
+        """
+        if not self.gmail_client or not self.labels_expired():
+            return False
+        request = self.gmail_client.users().labels().list(userId="me")
+        self.store_labels(request.execute(http=self.http))
+        return True
+
+    async def fetch_labels_async(self) -> bool:
+        """Fetch Gmail labels like :py:meth:`fetch_labels()`, on the asyncio engine."""
+        if not self.credentials or not self.labels_expired():
+            return False
+        self.store_labels(await self.async_client.get("labels"))
+        return True
+
+    def labels_expired(self) -> bool:
+        """True if labels should be fetched from the API; labels are loaded from the cache first."""
+        if not self.labels.fetched_at:
+            self.load_cached_labels()
+        return time.time() - self.labels.fetched_at >= GMAIL_LABELS_TTL_SECONDS
+
+    def store_labels(self, response: dict[str, Any]) -> None:
+        """Replace labels with the ones fetched from the API, and save them to the cache."""
+        fetched = [{"id": label["id"], "name": label["name"]} for label in response.get("labels") or []]
+        self.labels.replace_fetched([Label(label["id"], label["name"]) for label in fetched])
+        self.labels.fetched_at = time.time()
+
+        CACHE.set(
+            GMAIL_LABELS_CACHE,
+            self.email,
+            {"fetched_at": self.labels.fetched_at, "labels": fetched},
+            ttl=GMAIL_LABELS_TTL_SECONDS,
+        )
+
+        logger.debug("%s: %s", self.email, pformat(dict(self.labels.items()), width=200))
+
+    def unread_count(self, label: Label) -> tuple[int, int]:
+        """Return the unread thread/message count for a label.
+
+        See https://developers.google.com/gmail/api/v1/reference/users/labels/get.
+
+        :return: A tuple with unread thread and unread message count.
+        """
+        if self.gmail_client and self.labels and label.check_unread:
+            request = self.gmail_client.users().labels().get(id=label.id, userId="me")
+            try:
+                response = request.execute(http=self.http)
+            except HttpError as err:
+                raise_if_rate_limited(err)
+                raise
+            return response["threadsUnread"], response["messagesUnread"]
+        return -1, -1
+
+    @property
+    def async_client(self) -> AsyncGmailClient:
+        """Client of the REST API on the asyncio engine, sharing the credentials of the synchronous client."""
+        if self._async_client is None:
+            self._async_client = AsyncGmailClient(self.credentials, timeout=self.timeout)
+        return self._async_client
+
+    async def unread_count_async(self, label: Label) -> tuple[int, int]:
+        """Return the unread thread/message count for a label, on the asyncio engine."""
+        if self.credentials and self.labels and label.check_unread:
+            response = await self.async_client.get(f"labels/{quote(label.id, safe='')}")
+            return response["threadsUnread"], response["messagesUnread"]
+        return -1, -1
+
+        # TODO: how to read a single email message
+        # for message_dict in response["messages"]:
+        #     # https://developers.google.com/gmail/api/v1/reference/users/messages/get#python
+        #     result_dict = messages.get(userId="me", id=message_dict["id"], format="full").execute()
+        #     parts = result_dict["payload"]["parts"]
+        #     for part in parts:
+        #         body = base64.urlsafe_b64decode(part["body"]["data"].encode("ASCII"))
+        #         print("-" * 50)
+        #         pprint(body.decode(), width=200)
+
+
+def raise_if_rate_limited(err: HttpError) -> None:
+    """Raise a rate limit error if Gmail is throttling requests, honouring its Retry-After header."""
+    status = err.resp.status
+    if status == 429 or (status == 403 and b"ratelimitexceeded" in (err.content or b"").lower()):
+        retry_after = err.resp.get("retry-after")
+        raise RateLimitError(str(err), float(retry_after) if retry_after and retry_after.isdigit() else None) from err
+
+
+@dataclass
+class ImapApi(BaseApi):
+    """IMAP API wrapper.
+
+    Connections are leased from the shared pool, so pipes running in the same process reuse the same session.
+    """
+
+    keepalive: float = IMAP_KEEPALIVE_SECONDS
+    password: str | None = field(init=False, default=None, repr=False)
+    labels: LabelCollection = field(init=False, default_factory=LabelCollection)
+    _async_client: AsyncImapClient | None = field(init=False, default=None, repr=False)
+
+    @property
+    def pool_key(self) -> AccountKey:
+        """Key of this account on the connection pool."""
+        return self.server.host, self.server.port, self.email.strip()
+
+    @contextmanager
+    def connection(self) -> Iterator[ImapConnection]:
+        """Lease a connection from the pool."""
+        with IMAP_POOL.connection(
+            *self.pool_key, self.password, timeout=self.timeout, keepalive=self.keepalive
+        ) as connection:
+            yield connection
+
+    def authenticate(self, password: str | None = None) -> bool:
+        """Authenticate using IMAP.
+
+        Network errors don't fail the authentication: the connection is opened again lazily on the next check.
+        """
+        self.password = password
+        try:
+            with self.connection() as connection:
+                connection.run(lambda imbox: imbox)
+        except imaplib.IMAP4.error as err:
+            logger.error("%s: IMAP authentication failed: %s", self.email, err)
+            return False
+        except CONNECTION_ERRORS as err:
+            logger.warning("%s: IMAP server unreachable, will connect on the next check: %s", self.email, err)
+        return True
+
+    @classmethod
+    def check_credentials(cls, email: str, password: str | None = None) -> bool:
+        """Check that the account has a password."""
+        if password:
+            return True
+        logger.error("%s: IMAP password not configured", email)
+        return False
+
+    def keep_alive(self) -> None:
+        """Keep the pooled IMAP sessions of this account open between checks."""
+        IMAP_POOL.keep_alive(self.pool_key)
+
+    def abort_connections(self) -> None:
+        """Abort the pooled connections of this account that are in use; they reconnect on the next command."""
+        IMAP_POOL.abort_leased(self.pool_key)
+
+    def fetch_labels(self) -> bool:
+        """Fetch IMAP labels."""
+        self.labels.add(Label("INBOX", "Inbox", "inbox"))
+        return True
+
+    def unread_count(self, label: Label) -> tuple[int, int]:
+        """Return the unread thread/message count for a label."""
+        with self.connection() as connection:
+            try:
+                count = connection.run(lambda imbox: unseen_count(imbox.connection, label.id))
+            except imaplib.IMAP4.error as err:
+                self.raise_if_throttled(err)
+                raise
+        return count, count
+
+    @property
+    def async_client(self) -> AsyncImapClient:
+        """IMAP client on the asyncio engine; it keeps its own connection, outside the pool."""
+        if self._async_client is None:
+            self._async_client = AsyncImapClient(*self.pool_key, self.password, timeout=self.timeout)
+        return self._async_client
+
+    async def fetch_labels_async(self) -> bool:
+        """Fetch IMAP labels."""
+        return self.fetch_labels()
+
+    async def unread_count_async(self, label: Label) -> tuple[int, int]:
+        """Return the unread thread/message count for a label, on the asyncio engine."""
+        try:
+            count = await self.async_client.unseen_count(label.id)
+        except imaplib.IMAP4.error as err:
+            self.raise_if_throttled(err)
+            raise
+        return count, count
+
+    def raise_if_throttled(self, err: imaplib.IMAP4.error) -> None:
+        """Raise a rate limit error on response codes used by servers that throttle clients (RFC 5530)."""
+        if "[THROTTLED]" in str(err) or "[LIMIT]" in str(err):
+            raise RateLimitError(f"{self.email}: {err}") from err
+
+
+ALLOWED_SERVERS = [
+    Server(
+        name="Fastmail",
+        host="imap.fastmail.com",
+        port=993,
+        webmail_url="https://app.fastmail.com/mail/",
+        search_unread_anchor="search:is%3Aunread/",
+        domains=[
+            "fastmail.com",
+            "sent.com",
+            "fea.st",
+            "fastmail.de",
+        ],
+        api_class=ImapApi,
+    ),
+    Server(
+        name="Gmail",
+        host="",
+        port=0,
+        webmail_url="https://mail.google.com/#",
+        search_unread_anchor="search/is%3Aunread",
+        domains=[
+            "gmail.com",
+            "googlemail.com",
+            "wolt.com",
+        ],
+        api_class=GmailApi,
+    ),
+]
+
+
+def find_server_by_domain(email: str) -> Server:
+    """Find the IMAP server by the domain of the email address."""
+    for server in ALLOWED_SERVERS:
+        for domain in server.domains:
+            if email.endswith(domain):
+                return server
+    raise ValueError(f"IMAP server not configured for this domain: {email}")
+
+
+class AccountChecker:
+    """Check the unread messages of an email account and publish the state of the account.
+
+    It knows nothing about menus or schedulers: run :py:meth:`check()` from any thread, or :py:meth:`check_async()`
+    on the asyncio engine.
+    """
+
+    #: Keys of an account on the config file that are used by the checker
+    CONFIG_KEYS = ("email", "labels", "timeout", "keepalive", "concurrency")
+
+    def __init__(
+        self,
+        *,
+        email: str,
+        status_board: StatusBoard,
+        important: ImportantCounter | None = None,
+        labels: list[dict[str, str]] = None,
+        timeout: int = None,
+        keepalive: int = None,
+        concurrency: int = 1,
+    ):
+        self.status_board = status_board
+        self.important = important
+        # How many labels are checked in parallel
+        self.concurrency = max(1, concurrency)
+        self._executor: ThreadPoolExecutor | None = None
+        server: Server = find_server_by_domain(email)
+        api_options: dict[str, Any] = {"timeout": timeout or IMAP_TIMEOUT_SECONDS}
+        if server.api_class is ImapApi and keepalive:
+            api_options["keepalive"] = keepalive
+        self.email_api: ImapApi | GmailApi = server.api_class(server, email, **api_options)
+
+        # Last state published to the status board
+        self.state = AccountState(email)
+        # When the running check started; None if there is no check running
+        self.started_at: float | None = None
+
+        config_labels: list[Label] = []
+        for data in labels or []:
+            data.setdefault("id", data.get("name", ""))
+            config_labels.append(Label(**data))  # type: ignore
+        self.email_api.labels.set_config(config_labels)
+
+    @classmethod
+    def from_config(cls, data: dict[str, Any], **kwargs) -> AccountChecker:
+        """Create a checker from the config of an account, ignoring the keys that are not used by the checker."""
+        return cls(**{key: value for key, value in data.items() if key in cls.CONFIG_KEYS}, **kwargs)
+
+    def authenticate(self, password: str | None = None) -> bool:
+        """Authenticate the account."""
+        return self.email_api.authenticate(password)
+
+    def publish(self, **changes) -> AccountState:
+        """Publish a new state of this account to the status board."""
+        self.state = replace(self.state, **changes)
+        if self.important is not None:
+            self.important.update(self.state.email, self.state.important_threads, self.state.important_messages)
+        self.status_board.publish(self.state)
+        return self.state
+
+    def adopt(self, state: AccountState) -> AccountState:
+        """Publish a state checked somewhere else, e.g. by the app that holds the lease of this account."""
+        return self.publish(
+            checking=state.checking, checked_at=state.checked_at, labels=state.labels, error=state.error
+        )
+
+    def fetch_unread_counts(self, labels: list[Label]) -> list[tuple[Label, tuple[int, int]]]:
+        """Fetch the unread count of labels, in parallel if the account has a concurrency greater than 1.
+
+        The state is only published after all counts were fetched.
+        """
+        if self.concurrency == 1 or len(labels) <= 1:
+            return [(label, self.email_api.unread_count(label)) for label in labels]
+
+        if self._executor is None:
+            # The executor lives as long as the checker: its threads, and their HTTP connections, are reused by checks
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.concurrency, thread_name_prefix=f"labels-{self.email_api.email}"
+            )
+        return list(zip(labels, self._executor.map(self.email_api.unread_count, labels)))
+
+    def check(self) -> AccountState:
+        """Check unread labels and publish the state of the account."""
+        self.publish(checking=True)
+        self.started_at = time.monotonic()
+        try:
+            self.email_api.fetch_labels()
+
+            checked_at = datetime.now()
+            logger.debug("Checking email %s at %s", self.email_api.email, checked_at.strftime("%H:%M:%S"))
+            unread_counts = self.fetch_unread_counts(self.email_api.labels.checked())
+        except Exception as err:  # noqa: B902
+            self.publish(checking=False, error=str(err))
+            raise
+        finally:
+            self.started_at = None
+        return self.finish_check(checked_at, unread_counts)
+
+    async def fetch_unread_counts_async(self, labels: list[Label]) -> list[tuple[Label, tuple[int, int]]]:
+        """Fetch the unread count of labels on the asyncio engine, with at most ``concurrency`` requests at a time."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def count(label: Label) -> tuple[Label, tuple[int, int]]:
+            async with semaphore:
+                return label, await self.email_api.unread_count_async(label)
+
+        return list(await asyncio.gather(*(count(label) for label in labels)))
+
+    async def check_async(self) -> AccountState:
+        """Check unread labels like :py:meth:`check()`, on the asyncio engine."""
+        self.publish(checking=True)
+        self.started_at = time.monotonic()
+        try:
+            await self.email_api.fetch_labels_async()
+
+            checked_at = datetime.now()
+            logger.debug("Checking email %s at %s (async)", self.email_api.email, checked_at.strftime("%H:%M:%S"))
+            unread_counts = await self.fetch_unread_counts_async(self.email_api.labels.checked())
+        except (Exception, asyncio.CancelledError) as err:  # noqa: B902
+            # The engine cancels checks that run past their deadline
+            self.publish(checking=False, error=str(err) or err.__class__.__name__)
+            raise
+        finally:
+            self.started_at = None
+        return self.finish_check(checked_at, unread_counts)
+
+    def finish_check(self, checked_at: datetime, unread_counts: list[tuple[Label, tuple[int, int]]]) -> AccountState:
+        """Publish the unread counts of a check."""
+        # Only show labels with unread messages
+        labels = tuple(
+            LabelState(
+                label.id,
+                label.name,
+                label.anchor,
+                unread_threads,
+                unread_messages,
+                label.is_important(unread_threads, unread_messages),
+            )
+            for label, (unread_threads, unread_messages) in unread_counts
+            if unread_threads > 0 and unread_messages > 0
+        )
+        return self.publish(checking=False, checked_at=checked_at, labels=labels, error=None)
+
+
+def create_checkers(partial_emails: tuple[str, ...], status_board: StatusBoard) -> list[AccountChecker]:
+    """Create and authenticate checkers for the accounts on the config file, concurrently.
+
+    :param partial_emails: Only accounts whose email contains one of these strings; all accounts if empty.
+    """
+    accounts = [
+        data
+        for data in load_config_file()["email"]
+        if not partial_emails or any(partial in data["email"] for partial in partial_emails)
+    ]
+    checkers = [AccountChecker.from_config(data, status_board=status_board) for data in accounts]
+    if not checkers:
+        return []
+    with ThreadPoolExecutor(max_workers=len(checkers), thread_name_prefix="email-auth") as executor:
+        authenticated = list(
+            executor.map(lambda pair: pair[0].authenticate(pair[1].get("password")), zip(checkers, accounts))
+        )
+    for checker, ok in zip(checkers, authenticated):
+        if not ok:
+            checker.publish(error="Not authenticated")
+    return [checker for checker, ok in zip(checkers, authenticated) if ok]
+
+
+def check_all(checkers: list[AccountChecker]) -> None:
+    """Check all accounts once, on the asyncio engine or on a thread per account; errors are published as state."""
+    if EMAIL_ASYNC_ENGINE:
+        futures = [EMAIL_ENGINE.submit(checker.check_async(), EMAIL_JOB_DEADLINE_SECONDS) for checker in checkers]
+    else:
+        executor = ThreadPoolExecutor(max_workers=max(1, len(checkers)), thread_name_prefix="email-check")
+        futures = [executor.submit(checker.check) for checker in checkers]
+        executor.shutdown(wait=False)
+    for checker, future in zip(checkers, futures):
+        try:
+            future.result()
+        except Exception as err:  # noqa: B902
+            logger.debug("%s: Email check failed: %s", checker.email_api.email, err)
+
+
+@click.command()
+@click.option("--json", "as_json", is_flag=True, default=False, help="Output JSON, one object per account")
+@click.option("--watch", "-w", type=float, help="Check again every N seconds, until interrupted")
+@click.argument("partial_emails", nargs=-1)
+def email(as_json: bool, watch: float | None, partial_emails: tuple[str, ...]):
+    """Check unread email without the menu app; it works on any OS, e.g. on servers."""
+    status_board = StatusBoard()
+    checkers = create_checkers(partial_emails, status_board)
+    while True:
+        check_all(checkers)
+        _, states = status_board.snapshot()
+        if as_json:
+            click.echo(json.dumps([state.as_dict() for state in states.values()]))
+        else:
+            click.echo(format_states(states.values()))
+        if not watch:
+            break
+        time.sleep(watch)
+
+
+if __name__ == "__main__":
+    email()
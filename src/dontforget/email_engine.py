@@ -0,0 +1,420 @@
+"""Asyncio engine to check many email accounts from a single thread.
+
+All accounts share one event loop, running in one background thread. IMAP and HTTP are spoken directly on asyncio
+streams: only the few commands needed to count unread messages are implemented, so there are no extra dependencies.
+Connections are kept open between requests, so checks don't pay a TCP and TLS handshake for each request.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import imaplib
+import json
+import logging
+import re
+import ssl
+import threading
+from collections import defaultdict
+from collections.abc import Coroutine
+from concurrent.futures import Future
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, TypeVar
+from urllib.parse import urlencode, urlsplit
+
+from dontforget.constants import EMAIL_ENGINE_CONCURRENCY, EMAIL_ENGINE_MAX_RESPONSE_BYTES, IMAP_TIMEOUT_SECONDS
+from dontforget.generic import SingletonMixin
+from dontforget.imap import parse_unseen, quote_mailbox
+from dontforget.scheduling import RateLimitError
+from dontforget.settings import LOG_LEVEL
+
+GMAIL_API_URL = "https://gmail.googleapis.com/gmail/v1/users/me/"
+
+#: Errors of a dropped or stalled connection
+STREAM_ERRORS = (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError)
+
+#: An IMAP response line that announces a literal: its size, then the data on the next bytes
+IMAP_LITERAL_REGEX = re.compile(rb"\{(\d+)\}\r\n\Z")
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+SSL_CONTEXT = ssl.create_default_context()
+
+
+class HttpStatusError(RuntimeError):
+    """An HTTP request failed with an error status."""
+
+    def __init__(self, response: HttpResponse):
+        super().__init__(f"HTTP {response.status}: {response.body[:200]!r}")
+        self.response = response
+
+
+@dataclass
+class HttpResponse:
+    """Response of an HTTP request."""
+
+    status: int
+    headers: dict[str, str]
+    body: bytes
+
+    def json(self) -> Any:
+        """Decode the body as JSON."""
+        return json.loads(self.body)
+
+
+def parse_http_head(head: bytes) -> tuple[int, dict[str, str]]:
+    r"""Parse the status line and the headers of an HTTP response; header names are lowercased.
+
+    >>> parse_http_head(b"HTTP/1.1 429 Too Many Requests\r\nRetry-After: 30\r\nContent-Length: 0\r\n\r\n")
+    (429, {'retry-after': '30', 'content-length': '0'})
+    """
+    status_line, *header_lines = head.decode("iso-8859-1").split("\r\n")
+    headers = {}
+    for line in header_lines:
+        name, separator, value = line.partition(":")
+        if separator:
+            headers[name.strip().lower()] = value.strip()
+    return int(status_line.split()[1]), headers
+
+
+class ResponseTooLargeError(RuntimeError):
+    """A response is larger than the engine accepts."""
+
+
+async def read_chunked(reader: asyncio.StreamReader, limit: int = EMAIL_ENGINE_MAX_RESPONSE_BYTES) -> bytes:
+    """Read a body sent with chunked transfer encoding."""
+    body = bytearray()
+    while True:
+        size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+        if not size:
+            # Skip the optional trailers until the empty line
+            while await reader.readuntil(b"\r\n") != b"\r\n":
+                pass
+            return bytes(body)
+        if len(body) + size > limit:
+            raise ResponseTooLargeError(f"Chunked body larger than {limit} bytes")
+        body += await reader.readexactly(size)
+        await reader.readexactly(2)
+
+
+async def read_until_eof(reader: asyncio.StreamReader, limit: int = EMAIL_ENGINE_MAX_RESPONSE_BYTES) -> bytes:
+    """Read a body delimited by the end of the connection."""
+    body = bytearray()
+    while chunk := await reader.read(64 * 1024):
+        body += chunk
+        if len(body) > limit:
+            raise ResponseTooLargeError(f"Body larger than {limit} bytes")
+    return bytes(body)
+
+
+class HttpConnection:
+    """A persistent HTTP/1.1 connection to one origin; it sends one request at a time.
+
+    The connection is opened lazily and kept open after a response, unless the server closes it.
+    """
+
+    def __init__(self, scheme: str, host: str, port: int) -> None:
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+
+    @property
+    def connected(self) -> bool:
+        """True if the connection is open, and can be reused by the next request."""
+        return self._writer is not None
+
+    async def request(self, method: str, target: str, headers: dict[str, str], body: bytes | None) -> HttpResponse:
+        """Send a request and read its response."""
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(
+                self.host, self.port, ssl=SSL_CONTEXT if self.scheme == "https" else None
+            )
+        assert self._reader is not None
+        host = self.host if self.port in (80, 443) else f"{self.host}:{self.port}"
+        lines = [f"{method} {target} HTTP/1.1", f"Host: {host}"]
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        if body is not None:
+            lines.append(f"Content-Length: {len(body)}")
+        self._writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + (body or b""))
+        await self._writer.drain()
+
+        status, response_headers = parse_http_head(await self._reader.readuntil(b"\r\n\r\n"))
+        keep_alive = response_headers.get("connection", "").lower() != "close"
+        if status in (204, 304) or 100 <= status < 200:
+            content = b""
+        elif response_headers.get("transfer-encoding", "").lower() == "chunked":
+            content = await read_chunked(self._reader)
+        elif "content-length" in response_headers:
+            length = int(response_headers["content-length"])
+            if length > EMAIL_ENGINE_MAX_RESPONSE_BYTES:
+                raise ResponseTooLargeError(f"Body of {length} bytes is too large")
+            content = await self._reader.readexactly(length)
+        else:
+            content = await read_until_eof(self._reader)
+            keep_alive = False
+        if not keep_alive:
+            self.close()
+        return HttpResponse(status, response_headers, content)
+
+    def close(self) -> None:
+        """Close the connection."""
+        writer, self._reader, self._writer = self._writer, None, None
+        if writer is not None:
+            writer.close()
+
+
+class HttpClient:
+    """An HTTP/1.1 client that keeps connections alive: idle connections are reused by the next requests.
+
+    Concurrent requests to the same origin open more connections, which are all kept for later.
+    """
+
+    def __init__(self, timeout: float = IMAP_TIMEOUT_SECONDS) -> None:
+        self.timeout = timeout
+        self._idle: dict[tuple[str, str, int], list[HttpConnection]] = defaultdict(list)
+
+    async def request(
+        self, method: str, url: str, *, headers: dict[str, str] | None = None, body: bytes | None = None
+    ) -> HttpResponse:
+        """Send a request on an idle connection; retry once on a new connection if the server had closed it."""
+        parts = urlsplit(url)
+        origin = (parts.scheme, parts.hostname or "", parts.port or (443 if parts.scheme == "https" else 80))
+        target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        for attempt in range(2):
+            idle = self._idle[origin]
+            connection = idle.pop() if idle else HttpConnection(*origin)
+            reused = connection.connected
+            try:
+                response = await asyncio.wait_for(connection.request(method, target, headers or {}, body), self.timeout)
+            except BaseException as err:  # noqa: B902
+                # A response that was not read completely would be read by the next request, even after a cancellation
+                connection.close()
+                if attempt or not reused or not isinstance(err, STREAM_ERRORS):
+                    raise
+                logger.debug("%s: Idle connection closed by the server (%r), reconnecting", origin[1], err)
+                continue
+            if connection.connected:
+                idle.append(connection)
+            return response
+        raise AssertionError("unreachable")
+
+    def close(self) -> None:
+        """Close the idle connections."""
+        for idle in self._idle.values():
+            while idle:
+                idle.pop().close()
+
+
+def raise_for_status(response: HttpResponse) -> None:
+    """Raise an error for an HTTP error status; rate limiting raises a rate limit error with the Retry-After delay."""
+    if response.status < 400:
+        return
+    if response.status == 429 or (response.status == 403 and b"ratelimitexceeded" in response.body.lower()):
+        retry_after = response.headers.get("retry-after", "")
+        raise RateLimitError(f"HTTP {response.status}", float(retry_after) if retry_after.isdigit() else None)
+    raise HttpStatusError(response)
+
+
+def imap_quoted(value: str) -> str:
+    r"""Quote a string for IMAP commands, escaping backslashes and double quotes.
+
+    >>> print(imap_quoted('pa"ss\\word'))
+    "pa\"ss\\word"
+    """
+    escaped = value.replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{escaped}"'
+
+
+class AsyncImapClient:
+    """A minimal IMAP client on asyncio streams: login and unseen counts with STATUS.
+
+    The connection is opened lazily and kept open between checks; commands of the same account run one at a time.
+    """
+
+    def __init__(self, host: str, port: int, user: str, password: str | None, timeout: float = IMAP_TIMEOUT_SECONDS):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.timeout = timeout
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._tag = 0
+        self._lock = asyncio.Lock()
+
+    async def _connect(self) -> None:
+        logger.debug("%s@%s: Connecting (async)", self.user, self.host)
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port, ssl=SSL_CONTEXT)
+        try:
+            greeting = await self._reader.readline()
+            if not greeting.startswith(b"* OK"):
+                raise imaplib.IMAP4.error(f"Unexpected greeting: {greeting!r}")
+            await self._command(f"LOGIN {imap_quoted(self.user)} {imap_quoted(self.password or '')}", name="LOGIN")
+        except BaseException:  # noqa: B902
+            # Without a login, the next command would run on a connection that is not authenticated; this includes
+            # a cancellation, which must not leave the connection half open either
+            self.close()
+            raise
+
+    async def _read_line(self) -> bytes:
+        """Read a response line; literals (a ``{size}`` line end, then the data) are read into the line."""
+        assert self._reader is not None
+        line = await self._reader.readline()
+        while line:
+            match = IMAP_LITERAL_REGEX.search(line)
+            if not match:
+                return line
+            size = int(match.group(1))
+            if size > EMAIL_ENGINE_MAX_RESPONSE_BYTES:
+                raise ResponseTooLargeError(f"IMAP literal of {size} bytes is too large")
+            line += await self._reader.readexactly(size)
+            rest = await self._reader.readline()
+            if not rest:
+                break
+            line += rest
+        raise ConnectionResetError(f"{self.user}@{self.host}: connection closed by the server")
+
+    async def _command(self, command: str, name: str | None = None) -> list[bytes]:
+        """Send a command and return its untagged responses; raise an IMAP error if it didn't succeed."""
+        assert self._writer is not None
+        self._tag += 1
+        tag = f"A{self._tag:04d}".encode()
+        untagged = []
+        try:
+            self._writer.write(tag + b" " + command.encode() + b"\r\n")
+            await self._writer.drain()
+            while not (line := await self._read_line()).startswith(tag + b" "):
+                untagged.append(line.rstrip(b"\r\n"))
+        except BaseException:  # noqa: B902
+            # The rest of the response would be read by the next command (e.g. the unseen count of another folder),
+            # so the connection can't be reused after a cancellation or an unexpected response
+            self.close()
+            raise
+        if not line[len(tag) + 1 :].startswith(b"OK"):
+            raise imaplib.IMAP4.error(f"{name or command} failed: {line.decode(errors='replace').strip()}")
+        return untagged
+
+    async def run(self, command: str) -> list[bytes]:
+        """Run a command, connecting lazily; reconnect and retry once if the connection was dropped or stalled."""
+        async with self._lock:
+            for attempt in range(2):
+                try:
+                    return await asyncio.wait_for(self._run(command), self.timeout)
+                except STREAM_ERRORS as err:
+                    self.close()
+                    if attempt:
+                        raise
+                    logger.info("%s@%s: Connection lost (%r), reconnecting", self.user, self.host, err)
+        raise AssertionError("unreachable")
+
+    async def _run(self, command: str) -> list[bytes]:
+        if self._writer is None:
+            await self._connect()
+        return await self._command(command)
+
+    async def unseen_count(self, folder: str) -> int:
+        """Count unseen messages in a folder."""
+        return parse_unseen(await self.run(f"STATUS {quote_mailbox(folder)} (UNSEEN)"))
+
+    def close(self) -> None:
+        """Close the connection without logging out."""
+        writer, self._reader, self._writer = self._writer, None, None
+        if writer is not None:
+            writer.close()
+
+
+class AsyncGmailClient:
+    """A minimal client of the Gmail REST API, refreshing the OAuth access token asynchronously when it expires.
+
+    :param credentials: Google OAuth credentials; the token and its expiry are updated in place.
+    """
+
+    def __init__(self, credentials: Any, timeout: float = IMAP_TIMEOUT_SECONDS):
+        self.credentials = credentials
+        self.timeout = timeout
+        self.http = HttpClient(timeout)
+        self._refresh_lock = asyncio.Lock()
+
+    async def refresh_token(self, force: bool = False) -> None:
+        """Refresh the access token if it expired (or if forced)."""
+        async with self._refresh_lock:
+            if not force and self.credentials.token and not self.credentials.expired:
+                return
+            logger.debug("Refreshing the Gmail access token (async)")
+            body = urlencode(
+                {
+                    "grant_type": "refresh_token",
+                    "client_id": self.credentials.client_id,
+                    "client_secret": self.credentials.client_secret,
+                    "refresh_token": self.credentials.refresh_token,
+                }
+            ).encode()
+            response = await self.http.request(
+                "POST",
+                self.credentials.token_uri,
+                headers={"Content-Type": "application/x-www-form-urlencoded", "Accept": "application/json"},
+                body=body,
+            )
+            raise_for_status(response)
+            data = response.json()
+            self.credentials.token = data["access_token"]
+            # Google credentials keep the expiry as a naive UTC datetime
+            self.credentials.expiry = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(
+                seconds=data.get("expires_in", 3600)
+            )
+
+    async def get(self, path: str) -> Any:
+        """Get a resource of the authenticated user; a rejected token is refreshed and the request retried once."""
+        for attempt in range(2):
+            await self.refresh_token(force=bool(attempt))
+            response = await self.http.request(
+                "GET",
+                GMAIL_API_URL + path,
+                headers={"Authorization": f"Bearer {self.credentials.token}", "Accept": "application/json"},
+            )
+            if response.status != 401:
+                break
+        raise_for_status(response)
+        return response.json()
+
+
+class EmailEngine(SingletonMixin):
+    """An event loop in a background thread, shared by all email accounts.
+
+    Scheduler threads only submit checks and return right away; at most ``max_concurrency`` checks run at a time.
+    """
+
+    def __init__(self, max_concurrency: int = EMAIL_ENGINE_CONCURRENCY) -> None:
+        super().__init__()
+        self.max_concurrency = max_concurrency
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._semaphore: asyncio.Semaphore | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """The event loop, started on first use."""
+        with self._lock:
+            if self._loop is None:
+                logger.debug("Starting the email engine")
+                self._loop = asyncio.new_event_loop()
+                self._semaphore = asyncio.Semaphore(self.max_concurrency)
+                threading.Thread(target=self._loop.run_forever, name="email-engine", daemon=True).start()
+            return self._loop
+
+    def submit(self, coro: Coroutine[Any, Any, T], timeout: float) -> Future[T]:
+        """Run a coroutine on the engine; it's cancelled if it runs longer than the timeout (time waiting excluded)."""
+        return asyncio.run_coroutine_threadsafe(self._limited(coro, timeout), self.loop)
+
+    async def _limited(self, coro: Coroutine[Any, Any, T], timeout: float) -> T:
+        assert self._semaphore is not None
+        async with self._semaphore:
+            return await asyncio.wait_for(coro, timeout)
+
+
+EMAIL_ENGINE = EmailEngine.singleton()
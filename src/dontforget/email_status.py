@@ -0,0 +1,239 @@
+"""State of email accounts, published by background jobs and consumed by the menu (or any other view).
+
+Jobs never touch the UI: they publish immutable snapshots, and views apply the differences.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections.abc import Iterable
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Any
+
+from dontforget.generic import UT
+
+
+# TODO: format_count() should be the str() or repr() of this dataclass
+# @dataclass
+# class MessageCount:
+#     threads: int = 0
+#     messages: int = 0
+def format_count(threads: int, messages: int) -> str:
+    """Format the count of threads and messages.
+
+    >>> format_count(0, 0)
+    ''
+    >>> format_count(3, 3)
+    '3'
+    >>> format_count(2, 5)
+    '2 (5)'
+    """
+    if threads == messages:
+        return str(threads) if threads else ""
+    return f"{threads} ({messages})"
+
+
+@dataclass(frozen=True)
+class LabelState:
+    """Unread messages of a label."""
+
+    id: str
+    name: str
+    anchor: str | None
+    unread_threads: int
+    unread_messages: int
+    important: bool = False
+
+    @property
+    def title(self) -> str:
+        """Title of the label on the menu.
+
+        >>> LabelState("INBOX", "Inbox", "inbox", 2, 3, important=True).title
+        '❗Inbox: 2 (3)'
+        """
+        important = UT.HeavyExclamationMarkSymbol if self.important else ""
+        return f"{important}{self.name}: {format_count(self.unread_threads, self.unread_messages)}"
+
+
+@dataclass(frozen=True)
+class AccountState:
+    """A snapshot of an email account; only labels with unread messages are included."""
+
+    email: str
+    checking: bool = False
+    checked_at: datetime | None = None
+    labels: tuple[LabelState, ...] = ()
+    error: str | None = None
+
+    @property
+    def unread_threads(self) -> int:
+        """Unread threads on all labels."""
+        return sum(label.unread_threads for label in self.labels)
+
+    @property
+    def unread_messages(self) -> int:
+        """Unread messages on all labels."""
+        return sum(label.unread_messages for label in self.labels)
+
+    @property
+    def important_threads(self) -> int:
+        """Unread threads on important labels."""
+        return sum(label.unread_threads for label in self.labels if label.important)
+
+    @property
+    def important_messages(self) -> int:
+        """Unread messages on important labels."""
+        return sum(label.unread_messages for label in self.labels if label.important)
+
+    @property
+    def title(self) -> str:
+        """Title of the account on the menu.
+
+        >>> AccountState("me@example.com").title
+        'me@example.com'
+        >>> AccountState("me@example.com", labels=(LabelState("INBOX", "Inbox", "inbox", 1, 2),)).title
+        '✉️️ 1 (2) | me@example.com'
+        """
+        envelope = ""
+        if self.unread_threads > 0 or self.unread_messages > 0:
+            important = UT.HeavyExclamationMarkSymbol if any(label.important for label in self.labels) else ""
+            envelope = f"{important}{UT.Envelope} {format_count(self.unread_threads, self.unread_messages)} | "
+        return f"{envelope}{self.email}"
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> AccountState:
+        """Create a state from the dict returned by :py:meth:`as_dict()`.
+
+        >>> state = AccountState("me@x.io", checked_at=datetime(2024, 1, 2), labels=(LabelState("A", "A", None, 1, 1),))
+        >>> AccountState.from_dict(state.as_dict()) == state
+        True
+        """
+        checked_at = data.get("checked_at")
+        return cls(
+            email=data["email"],
+            checking=data.get("checking", False),
+            checked_at=datetime.fromisoformat(checked_at) if checked_at else None,
+            labels=tuple(LabelState(**label) for label in data.get("labels", [])),
+            error=data.get("error"),
+        )
+
+    def as_dict(self) -> dict[str, Any]:
+        """The state with its totals, as a dict that can be serialized to JSON.
+
+        >>> state = AccountState("me@x.io", checked_at=datetime(2024, 1, 2, 3, 4, 5))
+        >>> state.as_dict()  # doctest: +NORMALIZE_WHITESPACE
+        {'email': 'me@x.io', 'checking': False, 'checked_at': '2024-01-02T03:04:05', 'error': None,
+         'unread_threads': 0, 'unread_messages': 0, 'important_threads': 0, 'important_messages': 0, 'labels': []}
+        """
+        return {
+            "email": self.email,
+            "checking": self.checking,
+            "checked_at": self.checked_at.isoformat() if self.checked_at else None,
+            "error": self.error,
+            "unread_threads": self.unread_threads,
+            "unread_messages": self.unread_messages,
+            "important_threads": self.important_threads,
+            "important_messages": self.important_messages,
+            "labels": [asdict(label) for label in self.labels],
+        }
+
+
+def format_states(states: Iterable[AccountState]) -> str:
+    """Format account states as text for the terminal, one account per line followed by its labels.
+
+    >>> print(format_states([
+    ...     AccountState("me@x.io", labels=(LabelState("INBOX", "Inbox", "inbox", 1, 1),)),
+    ...     AccountState("you@x.io", error="Connection refused"),
+    ... ]))
+    ✉️️ 1 | me@x.io
+        Inbox: 1
+    you@x.io (error: Connection refused)
+    """
+    lines = []
+    for state in states:
+        lines.append(f"{state.title} (error: {state.error})" if state.error else state.title)
+        lines.extend(f"    {label.title}" for label in state.labels)
+    return "\n".join(lines)
+
+
+@dataclass
+class StatusBoard:
+    """Latest state of each account; jobs publish from any thread, views read consistent snapshots.
+
+    >>> board = StatusBoard()
+    >>> board.publish(AccountState("me@x.io"))
+    True
+    >>> board.publish(AccountState("me@x.io"))
+    False
+    >>> board.snapshot()
+    (1, {'me@x.io': AccountState(email='me@x.io', checking=False, checked_at=None, labels=(), error=None)})
+    """
+
+    version: int = 0
+    _states: dict[str, AccountState] = field(default_factory=dict)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def publish(self, state: AccountState) -> bool:
+        """Publish the state of an account.
+
+        :return: True if the state changed.
+        """
+        with self._lock:
+            if self._states.get(state.email) == state:
+                return False
+            self._states[state.email] = state
+            self.version += 1
+            return True
+
+    def get(self, email: str) -> AccountState | None:
+        """Latest state of an account."""
+        with self._lock:
+            return self._states.get(email)
+
+    def snapshot(self) -> tuple[int, dict[str, AccountState]]:
+        """Version and a copy of all states."""
+        with self._lock:
+            return self.version, dict(self._states)
+
+
+@dataclass
+class ImportantCounter:
+    """Unread counts on important labels of all accounts, kept up to date with the difference of each account.
+
+    >>> counter = ImportantCounter()
+    >>> counter.update("a@x.io", 2, 3), counter.update("b@x.io", 1, 1)
+    (True, True)
+    >>> counter.snapshot()
+    (2, 3, 4)
+    >>> counter.update("a@x.io", 2, 3)
+    False
+    >>> counter.update("a@x.io", 0, 0), counter.snapshot()
+    (True, (3, 1, 1))
+    """
+
+    version: int = 0
+    threads: int = 0
+    messages: int = 0
+    _by_email: dict[str, tuple[int, int]] = field(default_factory=dict)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def update(self, email: str, threads: int, messages: int) -> bool:
+        """Set the important counts of an account.
+
+        :return: True if the totals changed.
+        """
+        with self._lock:
+            old_threads, old_messages = self._by_email.get(email, (0, 0))
+            if (old_threads, old_messages) == (threads, messages):
+                return False
+            self._by_email[email] = (threads, messages)
+            self.threads += threads - old_threads
+            self.messages += messages - old_messages
+            self.version += 1
+            return True
+
+    def snapshot(self) -> tuple[int, int, int]:
+        """Version and total important threads and messages."""
+        with self._lock:
+            return self.version, self.threads, self.messages
@@ -190,6 +190,8 @@ def parse_interval(text: Optional[str]) -> dict[str, Any]:
 
     >>> parse_interval("10 minutes")
     {'minutes': 10}
+    >>> parse_interval("1 hour")
+    {'hours': 1}
     >>> parse_interval(" hours  5  ")
     {'hours': 5}
     >>> parse_interval(None)
@@ -221,7 +223,8 @@ def parse_interval(text: Optional[str]) -> dict[str, Any]:
         if part.isnumeric():
             number = int(part)
         elif part.isalpha():
-            key = part.strip()
+            # Singular units are accepted, but timedelta() and the scheduler expect plural ones
+            key = part.strip() if part.endswith("s") else f"{part.strip()}s"
     return {key: number} if key and number else {}
 
 
@@ -1,13 +1,16 @@
 """Create a task when it's time to go home."""
 
-from datetime import date, timedelta
-from pprint import pprint
-from typing import Union
+import logging
+from collections.abc import Iterable
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Optional, Union
 
 import arrow
-from tapioca_toggl import Toggl
 
-from dontforget.default_pipes.todoist import Todoist
+from dontforget.cache import CACHE
+from dontforget.default_pipes.todoist import TodoistApiError, TodoistRestApi
+from dontforget.scheduling import RateLimitError
 from dontforget.settings import (
     HOME_HOURS,
     HOME_MINUTES_BEFORE,
@@ -16,72 +19,162 @@ from dontforget.settings import (
     HOME_TOGGL_CLIENTS,
     HOME_TOGGL_NOT_WORK_DESCRIPTIONS,
     HOME_TOGGL_NOT_WORK_TAGS,
-    TOGGL_API_TOKEN,
+    LOCAL_TIMEZONE,
+    LOG_LEVEL,
+    TODOIST_API_TOKEN,
 )
+from dontforget.toggl_store import TOGGL_STORE, TimeEntryDC, TogglApiError
 
+# Cache namespace of the Todoist task: its project ID, its ID and its last due date
+HOME_CACHE = "home"
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+
+@dataclass(frozen=True)
+class WorkDay:
+    """Arrival at work and time to go home."""
+
+    arrived_at: datetime
+    non_working_time: timedelta
+    go_home_at: datetime
 
-def go_home(desired_date: Union[date, str] = None):
-    """Determine the time to go home on the desired day."""
-    api = Toggl(access_token=TOGGL_API_TOKEN)
-    my_data = api.me_with_related_data().get().data
-    timezone = my_data.timezone().data
 
+def plan_work_day(
+    entries: Iterable[TimeEntryDC],
+    work_project_ids: set[int],
+    hours: float,
+    minutes_before: float,
+    not_work_tags: Iterable[str] = (),
+    not_work_descriptions: Iterable[str] = (),
+) -> Optional[WorkDay]:
+    """Compute the time to go home in a single pass over the time entries of a day.
+
+    The first entry of a work project is the arrival; entries matching a tag or a part of the description
+    are not working time (each entry is counted once, even if it matches several of them).
+
+    >>> day = [
+    ...     TimeEntryDC(1, 7, "Coffee", datetime(2024, 1, 1, 8), datetime(2024, 1, 1, 8, 30)),
+    ...     TimeEntryDC(2, 1, "Code", datetime(2024, 1, 1, 9), datetime(2024, 1, 1, 12)),
+    ...     TimeEntryDC(3, 7, "Lunch break", datetime(2024, 1, 1, 12), datetime(2024, 1, 1, 13), ("pause",)),
+    ... ]
+    >>> plan_work_day(day, {1}, 8, 15, ["pause"], ["break"]).go_home_at
+    datetime.datetime(2024, 1, 1, 17, 45)
+    >>> plan_work_day(day, {2}, 8, 15) is None
+    True
+    """
+    not_work_tags, not_work_descriptions = set(not_work_tags), list(not_work_descriptions)
+    arrived_at: Optional[datetime] = None
+    non_working_seconds = 0.0
+    for entry in entries:
+        if entry.project_id in work_project_ids and (arrived_at is None or entry.start < arrived_at):
+            arrived_at = entry.start
+        if not_work_tags.intersection(entry.tags) or any(part in entry.description for part in not_work_descriptions):
+            non_working_seconds += entry.seconds
+    if arrived_at is None:
+        return None
+    non_working_time = timedelta(seconds=non_working_seconds)
+    go_home_at = arrived_at + timedelta(hours=hours) - timedelta(minutes=minutes_before) + non_working_time
+    return WorkDay(arrived_at, non_working_time, go_home_at)
+
+
+def compute_work_day(desired_date: Union[date, str] = None) -> tuple[Optional[WorkDay], str]:
+    """Compute the time to go home on the desired day, from the Toggl entries stored locally.
+
+    :return: The work day (None if there are no entries of the configured clients) and the timezone of the user.
+    """
+    timezone = TOGGL_STORE.user_timezone(LOCAL_TIMEZONE)
     final_date = arrow.get(desired_date) if desired_date else arrow.now(timezone)
     day_start = final_date.to(timezone).replace(hour=0, minute=0, second=0, microsecond=0)
     day_end = day_start.replace(hour=23, minute=59, second=59)
 
-    entries = api.time_entries().get(params={"start_date": day_start, "end_date": day_end})
+    try:
+        TOGGL_STORE.sync_time_entries(day_start.datetime)
+    except (OSError, TogglApiError, RateLimitError) as err:
+        logger.error("Could not sync time entries, using the local copy: %s", err)
 
     # Find entries from projects which belong to the configured clients.
-    toggl_clients = HOME_TOGGL_CLIENTS
-    print(f"Toggl clients: {', '.join(toggl_clients)}")
-    client_ids = [client["id"] for client in my_data.clients().data if client["name"] in toggl_clients]
-    client_projects = [project["id"] for project in my_data.projects().data if project["cid"] in client_ids]
-
-    start_dates = [entry["start"] for entry in entries().data if entry["pid"] in client_projects]
-    if not start_dates:
-        print(f"No Toggl entries for {', '.join(toggl_clients)} in {final_date.date().isoformat()}")
-        return
+    catalog = TOGGL_STORE.catalog()
+    work_project_ids = {
+        project.id
+        for project in (*catalog.projects_by_id.values(), *catalog.archived_projects_by_id.values())
+        if project.client and project.client.name in HOME_TOGGL_CLIENTS
+    }
+    work_day = plan_work_day(
+        TOGGL_STORE.time_entries(day_start.datetime, day_end.datetime),
+        work_project_ids,
+        HOME_HOURS,
+        HOME_MINUTES_BEFORE,
+        HOME_TOGGL_NOT_WORK_TAGS,
+        HOME_TOGGL_NOT_WORK_DESCRIPTIONS,
+    )
+    return work_day, timezone
 
-    # Add 8 hours to the first entry.
-    arrived_at = arrow.get(min(start_dates)).to(timezone)
-    print(f"Arrived at work at {arrived_at}")
-    go_home_at = arrived_at + timedelta(hours=HOME_HOURS) - timedelta(minutes=HOME_MINUTES_BEFORE)
-
-    # Find entries with tags and descriptions that should be added to the time to go home (e.g.: pause, not work)
-    non_working_durations = [
-        entry["duration"]
-        for entry in entries().data
-        for tag in HOME_TOGGL_NOT_WORK_TAGS
-        for desc in HOME_TOGGL_NOT_WORK_DESCRIPTIONS
-        if tag in entry.get("tags", []) or desc in entry.get("description", [])
-    ]
-    non_working_time = timedelta(seconds=sum(non_working_durations))
-    print(f"Non working time: {non_working_time}")
-    go_home_at += non_working_time
-    print(f"Go home at {go_home_at}")
-
-    todoist = Todoist.singleton()
-    project_id = todoist.fetch_first("projects", "id", {"name": HOME_TODOIST_PROJECT})
-    if not project_id:
-        print("No project ID")
+
+def update_task(work_day: WorkDay, timezone: str) -> bool:
+    """Create or update the Todoist task to go home, only if its due date changed.
+
+    The ID of the task is stored, so during the day it's updated with a single request instead of a full Todoist sync.
+    On a new day, the task is searched again on the project (yesterday's task might have been completed).
+
+    :return: True if the task was created or updated.
+    """
+    if not TODOIST_API_TOKEN:
+        logger.warning("The Todoist API token is not set on the environment variable TODOIST_API_TOKEN")
+        return False
+    go_home_at = arrow.get(work_day.go_home_at).to(timezone)
+    due_string = f"{go_home_at.format('MMM DD, YYYY')} at {go_home_at.format('HH:mm')}"
+    day = go_home_at.date().isoformat()
+    task = CACHE.get(HOME_CACHE, "task") or {}
+    if task.get("due_string") == due_string:
+        logger.debug("The time to go home didn't change: %s", due_string)
+        return False
+
+    api = TodoistRestApi(TODOIST_API_TOKEN)
+    fields = {"content": HOME_TODOIST_TASK, "due_string": due_string, "priority": 4}
+    task_id = task.get("id") if task.get("day") == day else None
+    if task_id:
+        try:
+            api.update_task(task_id, **fields)
+        except TodoistApiError as err:
+            if err.status != 404:
+                raise
+            # The task was deleted
+            task_id = None
+    if not task_id:
+        project_id = CACHE.get(HOME_CACHE, "project_id") or api.find_project_id(HOME_TODOIST_PROJECT)
+        if not project_id:
+            logger.error("Todoist project not found: %s", HOME_TODOIST_PROJECT)
+            return False
+        CACHE.set(HOME_CACHE, "project_id", project_id)
+
+        existing_task = api.find_task(project_id, HOME_TODOIST_TASK)
+        if existing_task:
+            task_id = api.update_task(existing_task["id"], **fields)["id"]
+        else:
+            task_id = api.add_task(project_id=project_id, auto_reminder=True, **fields)["id"]
+
+    CACHE.set(HOME_CACHE, "task", {"id": task_id, "day": day, "due_string": due_string})
+    logger.info("Todoist task updated: go home %s", due_string)
+    return True
+
+
+def check_go_home() -> None:
+    """Scheduled job: update the task to go home when the time changes."""
+    work_day, timezone = compute_work_day()
+    if work_day:
+        update_task(work_day, timezone)
+
+
+def go_home(desired_date: Union[date, str] = None):
+    """Determine the time to go home on the desired day."""
+    work_day, timezone = compute_work_day(desired_date)
+    if not work_day:
+        print(f"No Toggl entries for {', '.join(HOME_TOGGL_CLIENTS)} on {desired_date or 'today'}")
         return
 
-    task_description = HOME_TODOIST_TASK
-    date_string = f"{go_home_at.format('MMM DD, YYYY')} at {go_home_at.format('HH:mm')}"
-
-    existing_task = todoist.fetch_first("items", None, {"project_id": project_id, "content": task_description})
-    if not existing_task:
-        # Create a new task
-        item = todoist.api.items.add(
-            task_description, project_id, date_string=date_string, priority=4, auto_reminder=True
-        )
-        todoist.api.commit()
-        print("Task created")
-    else:
-        # Update existing task
-        item = todoist.api.items.get_by_id(existing_task["id"])
-        item.update(content=task_description, date_string=date_string, priority=4)
-        todoist.api.commit()
-        print("Task updated")
-    pprint(item)
+    print(f"Arrived at work at {arrow.get(work_day.arrived_at).to(timezone)}")
+    print(f"Non working time: {work_day.non_working_time}")
+    print(f"Go home at {arrow.get(work_day.go_home_at).to(timezone)}")
+    print("Task updated" if update_task(work_day, timezone) else "Task unchanged")
@@ -0,0 +1,586 @@
+"""IMAP connections that survive network changes.
+
+Imbox opens one socket and trusts it forever.
+The classes below keep a connection around, check its health when it was idle for too long
+and reconnect transparently (with backoff) when the socket was dropped.
+Connections are pooled per account, so pipes and the email plugin share the same authenticated sessions.
+"""
+
+from __future__ import annotations
+
+import imaplib
+import logging
+import re
+import socket
+import ssl
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from email import policy
+from email.parser import BytesHeaderParser
+from email.utils import parsedate_to_datetime
+from typing import TypeVar
+
+from imbox import Imbox
+from imbox.imap import ImapTransport
+from imbox.vendors import GmailMessages, hostname_vendorname_dict, name_authentication_string_dict
+
+from dontforget.constants import (
+    IMAP_FETCH_CHUNK_SIZE,
+    IMAP_KEEPALIVE_SECONDS,
+    IMAP_MAX_BACKOFF_SECONDS,
+    IMAP_MIN_BACKOFF_SECONDS,
+    IMAP_POOL_IDLE_SECONDS,
+    IMAP_POOL_MAX_SIZE,
+    IMAP_POOL_WAIT_SECONDS,
+    IMAP_TIMEOUT_SECONDS,
+    IMAP_UID_CHUNK_SIZE,
+)
+from dontforget.generic import SingletonMixin
+from dontforget.settings import LOG_LEVEL
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+#: Errors raised when the socket is gone; ``socket.timeout`` and ``ssl.SSLError`` are subclasses of ``OSError``
+CONNECTION_ERRORS = (imaplib.IMAP4.abort, OSError)
+
+UNSEEN_REGEX = re.compile(rb"UNSEEN (\d+)")
+UID_REGEX = re.compile(rb"UID (\d+)")
+
+#: Headers needed to build items; the body of the message is never downloaded
+HEADER_FIELDS = ("SUBJECT", "FROM", "DATE")
+
+# Month names for IMAP dates, independent of the current locale
+MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+T = TypeVar("T")
+
+#: Pool key: host, port and user
+AccountKey = tuple[str, int, str]
+
+
+class ImapBackoffError(RuntimeError):
+    """The server could not be reached recently; don't try again before the backoff delay."""
+
+
+class TimeoutImapTransport(ImapTransport):
+    """Imbox transport over SSL with a timeout on its own socket, from the TCP connect on."""
+
+    def __init__(self, hostname: str, port: int, timeout: float) -> None:
+        # The parent class doesn't accept a timeout, so the IMAP connection is created here instead
+        self.hostname = hostname
+        self.port = port
+        self.server = imaplib.IMAP4_SSL(hostname, port, ssl_context=ssl.create_default_context(), timeout=timeout)
+
+
+class TimeoutImbox(Imbox):
+    """Imbox with a timeout on the TCP connect, the TLS handshake, the login and the commands that follow.
+
+    Imbox doesn't accept a timeout; setting the default socket timeout instead would also change the sockets
+    that other threads create meanwhile.
+    """
+
+    def __init__(self, hostname: str, port: int, username: str, password: str | None, timeout: float) -> None:
+        self.server = TimeoutImapTransport(hostname, port, timeout)
+        self.hostname = hostname
+        self.username = username
+        self.password = password
+        self.parser_policy = None
+        self.vendor = hostname_vendorname_dict.get(hostname)
+        self.authentication_error_message = name_authentication_string_dict.get(self.vendor) if self.vendor else None
+        try:
+            self.connection = self.server.connect(username, password)
+        except BaseException as err:  # noqa: B902
+            # Don't leak the socket of a login that failed or timed out
+            self.server.server.shutdown()
+            if not isinstance(err, imaplib.IMAP4.error) or self.authentication_error_message is None:
+                raise
+            raise imaplib.IMAP4.error(f"{self.authentication_error_message}\n{err}") from err
+
+
+def quote_mailbox(name: str) -> str:
+    """Quote a mailbox name for IMAP commands, if needed.
+
+    >>> quote_mailbox("INBOX")
+    'INBOX'
+    >>> quote_mailbox("My Folder")
+    '"My Folder"'
+    >>> quote_mailbox('"Already quoted"')
+    '"Already quoted"'
+    """
+    if name.startswith('"') or not any(char in name for char in ' (){%*"\\'):
+        return name
+    escaped = name.replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{escaped}"'
+
+
+def parse_unseen(data: list[bytes]) -> int:
+    """Parse the response of a ``STATUS mailbox (UNSEEN)`` command.
+
+    >>> parse_unseen([b"INBOX (UNSEEN 3)"])
+    3
+    >>> parse_unseen([b'"My Folder" (UNSEEN 0)'])
+    0
+    >>> parse_unseen([b"INBOX (MESSAGES 10)"])
+    Traceback (most recent call last):
+     ...
+    ValueError: Unexpected STATUS response: [b'INBOX (MESSAGES 10)']
+    """
+    for line in data:
+        match = UNSEEN_REGEX.search(line or b"")
+        if match:
+            return int(match.group(1))
+    raise ValueError(f"Unexpected STATUS response: {data}")
+
+
+def unseen_count(connection: imaplib.IMAP4, folder: str) -> int:
+    """Count unseen messages in a folder with a single round trip (no SELECT/SEARCH needed)."""
+    return parse_unseen(check_response(f"STATUS {folder}", connection.status(quote_mailbox(folder), "(UNSEEN)")))
+
+
+def uid_set(uids: Iterable[bytes | str | int]) -> str:
+    """Build a compact UID set for IMAP commands, with ranges of consecutive UIDs.
+
+    >>> uid_set([b"3", b"1", b"2", b"7", b"9", b"10"])
+    '1:3,7,9:10'
+    >>> uid_set(["42"])
+    '42'
+    >>> uid_set([5, 5, 6])
+    '5:6'
+    >>> uid_set([])
+    ''
+    """
+    numbers = sorted({int(uid) for uid in uids})
+    ranges: list[str] = []
+    start = previous = None
+    for number in numbers:
+        if previous is not None and number == previous + 1:
+            previous = number
+            continue
+        if start is not None:
+            ranges.append(str(start) if start == previous else f"{start}:{previous}")
+        start = previous = number
+    if start is not None:
+        ranges.append(str(start) if start == previous else f"{start}:{previous}")
+    return ",".join(ranges)
+
+
+def chunks(items: list[T], size: int) -> Iterator[list[T]]:
+    """Split a list into chunks.
+
+    >>> list(chunks([1, 2, 3, 4, 5], 2))
+    [[1, 2], [3, 4], [5]]
+    >>> list(chunks([], 2))
+    []
+    """
+    for index in range(0, len(items), size):
+        yield items[index : index + size]
+
+
+def check_response(command: str, response: tuple[str, list]) -> list:
+    """Raise an IMAP error if the command failed, otherwise return the response data."""
+    status, data = response
+    if status != "OK":
+        raise imaplib.IMAP4.error(f"{command} failed: {data}")
+    return data
+
+
+def capabilities(connection: imaplib.IMAP4) -> set[str]:
+    """Capabilities of an authenticated connection (servers announce more of them after the login)."""
+    data = check_response("CAPABILITY", connection.capability())
+    return {capability.decode().upper() for line in data for capability in line.split()}
+
+
+def folder_name(imbox: Imbox, folder: str) -> str:
+    """Translate vendor aliases the same way ``Imbox.messages()`` does (e.g. "all" on Gmail), and quote the name."""
+    lookup = GmailMessages.FOLDER_LOOKUP if imbox.vendor == "gmail" else {}
+    return lookup.get(folder.lower()) or quote_mailbox(folder)
+
+
+def select_folder(imbox: Imbox, folder: str) -> None:
+    """Select a folder; needed before UID commands on pooled connections, which might have another one selected."""
+    check_response(f"SELECT {folder}", imbox.connection.select(folder_name(imbox, folder)))
+
+
+def store_flags(
+    connection: imaplib.IMAP4, uids: list[bytes], flags: str = "(\\Seen)", chunk_size: int = IMAP_UID_CHUNK_SIZE
+) -> None:
+    """Add flags to messages of the selected folder, with one UID STORE command per chunk."""
+    for chunk in chunks(sorted(set(uids), key=int), chunk_size):
+        check_response("UID STORE", connection.uid("STORE", uid_set(chunk), "+FLAGS.SILENT", flags))
+
+
+def move_messages(
+    connection: imaplib.IMAP4, uids: list[bytes], folder: str, chunk_size: int = IMAP_UID_CHUNK_SIZE
+) -> None:
+    """Move messages of the selected folder to another one, with UID MOVE (or COPY + EXPUNGE) commands per chunk."""
+    server_capabilities = capabilities(connection)
+    destination = quote_mailbox(folder)
+    for chunk in chunks(sorted(set(uids), key=int), chunk_size):
+        chunk_set = uid_set(chunk)
+        if "MOVE" in server_capabilities:
+            check_response("UID MOVE", connection.uid("MOVE", chunk_set, destination))
+            continue
+        check_response("UID COPY", connection.uid("COPY", chunk_set, destination))
+        check_response("UID STORE", connection.uid("STORE", chunk_set, "+FLAGS.SILENT", "(\\Deleted)"))
+        if "UIDPLUS" in server_capabilities:
+            check_response("UID EXPUNGE", connection.uid("EXPUNGE", chunk_set))
+        else:
+            check_response("EXPUNGE", connection.expunge())
+
+
+@dataclass
+class MessageHeaders:
+    """Headers of a message, fetched without its body."""
+
+    uid: bytes
+    subject: str
+    from_email: str | None
+    parsed_date: datetime | None
+
+
+def imap_date(value: date) -> str:
+    """Format a date for IMAP search criteria.
+
+    >>> imap_date(date(2024, 5, 3))
+    '03-May-2024'
+    """
+    return f"{value.day:02d}-{MONTHS[value.month - 1]}-{value.year}"
+
+
+def quote_string(value: str) -> str:
+    """Quote a string for search criteria; double quotes are replaced like Imbox does."""
+    return '"' + value.replace('"', "'") + '"'
+
+
+def search_criteria(sent_from: str | None = None, label: str | None = None, since: date | None = None) -> str:
+    """Build the criteria for a UID SEARCH command; filtering by date on the server avoids fetching old UIDs.
+
+    >>> search_criteria()
+    'ALL'
+    >>> search_criteria(sent_from="someone@example.com", since=date(2024, 5, 3))
+    '(FROM "someone@example.com") (SINCE 03-May-2024)'
+    >>> search_criteria(label="Work")
+    '(X-GM-LABELS "Work")'
+    """
+    criteria = []
+    if sent_from:
+        criteria.append(f"(FROM {quote_string(sent_from)})")
+    if label:
+        criteria.append(f"(X-GM-LABELS {quote_string(label)})")
+    if since:
+        criteria.append(f"(SINCE {imap_date(since)})")
+    return " ".join(criteria) or "ALL"
+
+
+def search_uids(connection: imaplib.IMAP4, criteria: str) -> list[bytes]:
+    """Search UIDs on the selected folder."""
+    data = check_response("UID SEARCH", connection.uid("SEARCH", None, criteria))
+    return data[0].split() if data and data[0] else []
+
+
+def parse_headers(uid: bytes, raw_headers: bytes) -> MessageHeaders:
+    r"""Parse raw headers returned by a ``BODY.PEEK[HEADER.FIELDS (...)]`` fetch.
+
+    >>> headers = parse_headers(
+    ...     b"7",
+    ...     b"Subject: =?utf-8?q?Caf=C3=A9?= and\r\n more\r\nFrom: Someone <some@example.com>\r\n"
+    ...     b"Date: Fri, 03 May 2024 10:20:30 +0200\r\n\r\n",
+    ... )
+    >>> headers.subject, headers.from_email, headers.parsed_date.isoformat()
+    ('Café and more', 'some@example.com', '2024-05-03T10:20:30+02:00')
+    >>> parse_headers(b"8", b"\r\n")
+    MessageHeaders(uid=b'8', subject='', from_email=None, parsed_date=None)
+    """
+    message = BytesHeaderParser(policy=policy.default).parsebytes(raw_headers)
+    subject = " ".join(str(message.get("subject", "")).splitlines())
+
+    from_email = None
+    from_header = message.get("from")
+    if from_header is not None and getattr(from_header, "addresses", None):
+        from_email = from_header.addresses[0].addr_spec
+
+    parsed_date = None
+    date_header = message.get("date")
+    if date_header:
+        try:
+            parsed_date = parsedate_to_datetime(str(date_header))
+        except (TypeError, ValueError):
+            logger.warning("UID %s: Invalid date header %r", uid, date_header)
+    return MessageHeaders(uid, subject, from_email, parsed_date)
+
+
+def fetch_headers(
+    connection: imaplib.IMAP4,
+    uids: list[bytes],
+    chunk_size: int = IMAP_FETCH_CHUNK_SIZE,
+    fields: tuple[str, ...] = HEADER_FIELDS,
+) -> Iterator[MessageHeaders]:
+    """Fetch only some headers of messages on the selected folder, one chunk of UIDs at a time.
+
+    Nothing is fetched before the caller asks for the next item, so memory stays bounded by the chunk size.
+    """
+    query = f"(UID BODY.PEEK[HEADER.FIELDS ({' '.join(fields)})])"
+    for chunk in chunks(uids, chunk_size):
+        data = check_response("UID FETCH", connection.uid("FETCH", uid_set(chunk), query))
+        for part in data:
+            # Each message comes as a tuple (metadata, headers), followed by a closing b")"
+            if not isinstance(part, tuple):
+                continue
+            match = UID_REGEX.search(part[0])
+            if match:
+                yield parse_headers(match.group(1), part[1])
+
+
+@dataclass
+class ImapConnection:
+    """An authenticated IMAP connection with keepalive, health checks and lazy reconnect.
+
+    Use :py:meth:`run()` to execute commands; it reconnects and retries once if the socket was dropped.
+    """
+
+    host: str
+    port: int
+    user: str
+    password: str | None = field(default=None, repr=False)
+    timeout: float = IMAP_TIMEOUT_SECONDS
+    keepalive: float = IMAP_KEEPALIVE_SECONDS
+
+    imbox: Imbox | None = field(init=False, default=None, repr=False)
+    last_used: float = field(init=False, default=0.0)
+    failures: int = field(init=False, default=0)
+    retry_at: float = field(init=False, default=0.0)
+    lock: threading.RLock = field(init=False, default_factory=threading.RLock, repr=False)
+
+    @property
+    def key(self) -> AccountKey:
+        """Key of this connection in the pool."""
+        return self.host, self.port, self.user
+
+    @property
+    def connected(self) -> bool:
+        """True if there is an open connection (it might be dead, though)."""
+        return self.imbox is not None
+
+    @property
+    def idle_seconds(self) -> float:
+        """Seconds since the connection was last used."""
+        return time.monotonic() - self.last_used
+
+    def connect(self) -> Imbox:
+        """Open a new connection, unless the last attempts failed and we are still backing off."""
+        now = time.monotonic()
+        if now < self.retry_at:
+            raise ImapBackoffError(f"{self.user}@{self.host}: next connection attempt in {self.retry_at - now:.0f}s")
+
+        logger.debug("%s@%s: Connecting", self.user, self.host)
+        try:
+            imbox = TimeoutImbox(self.host, self.port, self.user, self.password, self.timeout)
+        except CONNECTION_ERRORS as err:
+            self.failures += 1
+            delay = min(IMAP_MAX_BACKOFF_SECONDS, IMAP_MIN_BACKOFF_SECONDS * 2 ** (self.failures - 1))
+            self.retry_at = now + delay
+            logger.warning("%s@%s: Connection failed (%s), retrying in %ss", self.user, self.host, err, delay)
+            raise
+
+        self.imbox = imbox
+        self.failures = 0
+        self.retry_at = 0.0
+        self.last_used = time.monotonic()
+        return imbox
+
+    def apply_timeout(self, timeout: float | None = None) -> None:
+        """Set the timeout of the socket, so a dropped connection fails fast instead of hanging forever."""
+        if timeout is not None:
+            self.timeout = timeout
+        if self.imbox is not None:
+            self.imbox.connection.sock.settimeout(self.timeout)
+
+    def disconnect(self) -> None:
+        """Close the connection, ignoring errors from a socket that is already dead."""
+        if self.imbox is None:
+            return
+        imbox, self.imbox = self.imbox, None
+        try:
+            imbox.connection.logout()
+        except (imaplib.IMAP4.error, OSError) as err:
+            logger.debug("%s@%s: Ignoring error on logout: %s", self.user, self.host, err)
+
+    def abort(self) -> None:
+        """Shut down the socket without waiting for the lock, so a call blocked on it in another thread fails now."""
+        imbox = self.imbox
+        if imbox is None:
+            return
+        logger.warning("%s@%s: Aborting connection", self.user, self.host)
+        try:
+            imbox.connection.sock.shutdown(socket.SHUT_RDWR)
+        except OSError as err:
+            logger.debug("%s@%s: Ignoring error on shutdown: %s", self.user, self.host, err)
+
+    def is_alive(self) -> bool:
+        """Health check with a NOOP command."""
+        if self.imbox is None:
+            return False
+        try:
+            status, _ = self.imbox.connection.noop()
+        except CONNECTION_ERRORS:
+            return False
+        self.last_used = time.monotonic()
+        return status == "OK"
+
+    def ensure(self) -> Imbox:
+        """Return a working connection: connect lazily, and check the health only after a long idle time."""
+        if self.imbox is None:
+            return self.connect()
+        if self.idle_seconds >= self.keepalive and not self.is_alive():
+            logger.info("%s@%s: Connection dropped while idle, reconnecting", self.user, self.host)
+            self.disconnect()
+            return self.connect()
+        return self.imbox
+
+    def keep_alive(self) -> bool:
+        """Send a NOOP if the connection was idle for too long; call it periodically to keep the session open."""
+        with self.lock:
+            if self.imbox is None or self.idle_seconds < self.keepalive:
+                return self.imbox is not None
+            if self.is_alive():
+                return True
+            self.disconnect()
+            return False
+
+    def run(self, func: Callable[[Imbox], T]) -> T:
+        """Run a function with a working connection; reconnect and retry once if the socket was dropped."""
+        with self.lock:
+            imbox = self.ensure()
+            try:
+                rv = func(imbox)
+            except CONNECTION_ERRORS as err:
+                logger.info("%s@%s: Connection lost (%s), reconnecting", self.user, self.host, err)
+                self.disconnect()
+                rv = func(self.connect())
+            self.last_used = time.monotonic()
+            return rv
+
+
+class ImapPool(SingletonMixin):
+    """A pool of IMAP connections, keyed by host, port and user.
+
+    Connections are created lazily up to a limit per account, reused while they are idle,
+    and closed when they were not leased for a long time.
+    """
+
+    def __init__(self, max_size: int = IMAP_POOL_MAX_SIZE, idle_timeout: float = IMAP_POOL_IDLE_SECONDS) -> None:
+        super().__init__()
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        # Idle connections with the time they were released, most recent last
+        self._idle: dict[AccountKey, list[tuple[ImapConnection, float]]] = {}
+        self._leased: defaultdict[AccountKey, list[ImapConnection]] = defaultdict(list)
+        self._condition = threading.Condition()
+
+    def acquire(self, host: str, port: int, user: str, password: str | None = None, **options) -> ImapConnection:
+        """Lease a connection for an account, waiting if all of them are in use.
+
+        The connection is not opened here; :py:meth:`ImapConnection.run()` will connect lazily.
+        """
+        key: AccountKey = (host, port, user)
+        with self._condition:
+            expired = self._pop_expired()
+            while True:
+                idle = self._idle.get(key)
+                if idle:
+                    connection, _ = idle.pop()
+                    break
+                if len(self._leased[key]) < self.max_size:
+                    connection = ImapConnection(host, port, user, password, **options)
+                    break
+                if not self._condition.wait(IMAP_POOL_WAIT_SECONDS):
+                    raise TimeoutError(f"{user}@{host}: no IMAP connection available after {IMAP_POOL_WAIT_SECONDS}s")
+            self._leased[key].append(connection)
+        self._close(expired)
+        if password is not None:
+            connection.password = password
+        # A reused connection might have been created with another timeout, or had it changed by a caller
+        connection.apply_timeout(options.get("timeout"))
+        return connection
+
+    def release(self, connection: ImapConnection, discard: bool = False) -> None:
+        """Give a connection back to the pool; discarded or closed connections are not reused."""
+        key = connection.key
+        with self._condition:
+            self._leased[key] = [leased for leased in self._leased[key] if leased is not connection]
+            if not discard and connection.connected:
+                self._idle.setdefault(key, []).append((connection, time.monotonic()))
+            self._condition.notify()
+        if discard:
+            connection.disconnect()
+
+    @contextmanager
+    def connection(
+        self, host: str, port: int, user: str, password: str | None = None, **options
+    ) -> Iterator[ImapConnection]:
+        """Lease a connection for the duration of a ``with`` block."""
+        connection = self.acquire(host, port, user, password, **options)
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def keep_alive(self, key: AccountKey | None = None) -> None:
+        """Send a NOOP on idle connections (of one account or all of them) and drop the dead ones."""
+        with self._condition:
+            expired = self._pop_expired()
+            candidates = [
+                connection
+                for idle_key, idle in self._idle.items()
+                if key is None or idle_key == key
+                for connection, _ in idle
+            ]
+        self._close(expired)
+        for connection in candidates:
+            if not connection.keep_alive():
+                with self._condition:
+                    idle = self._idle.get(connection.key, [])
+                    self._idle[connection.key] = [pair for pair in idle if pair[0] is not connection]
+
+    def abort_leased(self, key: AccountKey) -> int:
+        """Abort the connections of an account that are in use, so calls blocked on them fail and reconnect.
+
+        :return: The number of aborted connections.
+        """
+        with self._condition:
+            leased = list(self._leased[key])
+        for connection in leased:
+            connection.abort()
+        return len(leased)
+
+    def close_all(self) -> None:
+        """Close all idle connections."""
+        with self._condition:
+            idle = [connection for pairs in self._idle.values() for connection, _ in pairs]
+            self._idle.clear()
+        self._close(idle)
+
+    def _pop_expired(self) -> list[ImapConnection]:
+        """Remove connections that were idle for too long; the caller should hold the lock."""
+        limit = time.monotonic() - self.idle_timeout
+        expired = []
+        for key, idle in self._idle.items():
+            expired.extend(connection for connection, released_at in idle if released_at < limit)
+            self._idle[key] = [pair for pair in idle if pair[1] >= limit]
+        return expired
+
+    @staticmethod
+    def _close(connections: list[ImapConnection]) -> None:
+        """Close connections outside the lock, because logging out is a network round trip."""
+        for connection in connections:
+            logger.debug("%s@%s: Closing pooled connection", connection.user, connection.host)
+            connection.disconnect()
+
+
+IMAP_POOL = ImapPool.singleton()
@@ -128,24 +128,27 @@ class Pipe:
 
         has_items = False
         source_instance = source_class()
-        for item_dict in source_instance.pull(expanded_source_dict):
-            LOGGER.debug("item_dict: %s", item_dict)
-            LOGGER.debug("target_template: %s", target_template)
-
-            rendered_item = Template(target_template).render({"env": os.environ, source_class.name: item_dict})
-            LOGGER.debug("rendered_item: %s", rendered_item)
-            expanded_item_dict = json.loads(rendered_item)
-            LOGGER.debug("expanded_item_dict: %s", expanded_item_dict)
-            click.echo("  Pushing ", nl=False)
-            target = target_class()
-            success = target.push(expanded_item_dict)
-            if success:
-                click.secho("ok", fg="green")
-                source_instance.on_success()
-            else:
-                click.secho(f"not saved: {target.validation_error}", fg="yellow")
-                source_instance.on_failure()
-            has_items = True
+        try:
+            for item_dict in source_instance.pull(expanded_source_dict):
+                LOGGER.debug("item_dict: %s", item_dict)
+                LOGGER.debug("target_template: %s", target_template)
+
+                rendered_item = Template(target_template).render({"env": os.environ, source_class.name: item_dict})
+                LOGGER.debug("rendered_item: %s", rendered_item)
+                expanded_item_dict = json.loads(rendered_item)
+                LOGGER.debug("expanded_item_dict: %s", expanded_item_dict)
+                click.echo("  Pushing ", nl=False)
+                target = target_class()
+                success = target.push(expanded_item_dict)
+                if success:
+                    click.secho("ok", fg="green")
+                    source_instance.on_success(item_dict)
+                else:
+                    click.secho(f"not saved: {target.validation_error}", fg="yellow")
+                    source_instance.on_failure(item_dict)
+                has_items = True
+        finally:
+            source_instance.on_finish()
 
         if not has_items:
             click.echo("  No items on source")
@@ -252,13 +255,16 @@ class BaseSource(metaclass=abc.ABCMeta):
         """Pull items from the source, using the provided connection info."""
 
     @abc.abstractmethod
-    def on_success(self):
+    def on_success(self, item: JsonDict):
         """Hook to do something when an item was pushed successfully."""
 
     @abc.abstractmethod
-    def on_failure(self):
+    def on_failure(self, item: JsonDict):
         """Hook to do something when an item failed when pushed."""
 
+    def on_finish(self):  # noqa: B027
+        """Hook to do something when the pipe run ends (e.g. apply pending changes in bulk, release connections)."""
+
 
 class BaseTarget(metaclass=abc.ABCMeta):
     """Base target."""
@@ -0,0 +1,91 @@
+"""Detection of running processes, shared by all plugins."""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections.abc import Iterable
+from pathlib import PurePath
+from subprocess import SubprocessError, run
+
+from dontforget.constants import PROCESS_SCAN_TTL_SECONDS
+from dontforget.generic import SingletonMixin
+from dontforget.settings import LOG_LEVEL
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+
+#: Executables inside macOS app bundles, whose names can have spaces
+APP_BUNDLE_EXECUTABLE = "/Contents/MacOS/"
+
+
+def parse_process_names(output: str) -> frozenset[str]:
+    r"""Parse the names of processes from the output of ``ps -o args=``, like ``pidof`` does.
+
+    The name is the basename of the first argument; ``comm`` is not used because Linux truncates it to 15 characters.
+    Executables of macOS app bundles can have spaces, so their name goes until the first option.
+
+    >>> sorted(parse_process_names(
+    ...     "/Applications/Google Chrome.app/Contents/MacOS/Google Chrome --flag\n  zsh -l\n\n"
+    ...     "/usr/libexec/gnome-session-binary --session=ubuntu\n"
+    ... ))
+    ['Google Chrome', 'gnome-session-binary', 'zsh']
+    """
+    names = set()
+    for line in output.splitlines():
+        args = line.strip()
+        if not args:
+            continue
+        if APP_BUNDLE_EXECUTABLE in args:
+            names.add(args.split(APP_BUNDLE_EXECUTABLE, 1)[1].split(" -", 1)[0].strip())
+        else:
+            names.add(PurePath(args.split()[0]).name)
+    return frozenset(names)
+
+
+class ProcessTable(SingletonMixin):
+    """Names of the running processes.
+
+    The process table is scanned with a single ``ps`` call per refresh interval, no matter how many jobs ask.
+    """
+
+    def __init__(self, ttl: float = PROCESS_SCAN_TTL_SECONDS) -> None:
+        super().__init__()
+        self.ttl = ttl
+        self._names: frozenset[str] = frozenset()
+        self._scanned_at: float | None = None
+        self._lock = threading.Lock()
+
+    def names(self) -> frozenset[str]:
+        """Names of the running processes, scanned again if the last scan is older than the TTL.
+
+        A failed scan is not cached: the last known names are returned, and the next call scans again.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._scanned_at is None or now - self._scanned_at >= self.ttl:
+                names = self.scan()
+                if names is not None:
+                    self._names = names
+                    self._scanned_at = now
+            return self._names
+
+    @staticmethod
+    def scan() -> frozenset[str] | None:
+        """Scan the process table; None if it failed."""
+        try:
+            process = run(["ps", "-A", "-ww", "-o", "args="], capture_output=True, text=True, check=True)
+        except (OSError, SubprocessError) as err:
+            logger.error("Could not list running processes: %s", err)
+            return None
+        return parse_process_names(process.stdout)
+
+    def any_running(self, apps: Iterable[str]) -> bool:
+        """True if any of the apps is running."""
+        names = self.names()
+        return any(app in names for app in apps)
+
+
+PROCESS_TABLE = ProcessTable.singleton()
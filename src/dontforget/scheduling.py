@@ -0,0 +1,163 @@
+"""Scheduling helpers for background jobs."""
+
+import logging
+import random
+import sqlite3
+import threading
+from collections.abc import Iterator
+from contextlib import closing, contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Optional
+
+from dontforget.constants import JOB_START_JITTER_SECONDS
+from dontforget.generic import parse_interval
+from dontforget.settings import LOG_LEVEL
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+
+class RateLimitError(RuntimeError):
+    """The server asked us to slow down.
+
+    >>> import pickle
+    >>> err = pickle.loads(pickle.dumps(RateLimitError("Too many requests", 30.0)))
+    >>> str(err), err.retry_after
+    ('Too many requests', 30.0)
+    """
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message, retry_after)
+        self.message = message
+        self.retry_after = retry_after
+
+    def __str__(self) -> str:
+        return self.message
+
+
+def interval_seconds(text: Optional[str]) -> float:
+    """Parse an interval from text and return it in seconds.
+
+    >>> interval_seconds("30 seconds")
+    30.0
+    >>> interval_seconds("2 hours")
+    7200.0
+    >>> interval_seconds(None)
+    0.0
+    """
+    return timedelta(**parse_interval(text)).total_seconds()
+
+
+@dataclass
+class AdaptiveInterval:
+    """A polling interval that speeds up on activity and backs off exponentially while there is none.
+
+    >>> interval = AdaptiveInterval(30, 300)
+    >>> interval.seconds
+    30
+    >>> interval.quiet(), interval.quiet(), interval.quiet(), interval.quiet()
+    (60, 120, 240, 300)
+    >>> interval.activity()
+    30
+    >>> interval.rate_limited(), interval.rate_limited(900)
+    (300, 900)
+    >>> interval.quiet()
+    300
+    """
+
+    min_seconds: float
+    max_seconds: float
+    factor: float = 2
+    seconds: float = field(init=False)
+
+    def __post_init__(self):
+        self.seconds = self.min_seconds
+
+    def activity(self) -> float:
+        """New mail or user interaction: poll as fast as allowed."""
+        self.seconds = self.min_seconds
+        return self.seconds
+
+    def quiet(self) -> float:
+        """Nothing happened: back off, up to the maximum."""
+        self.seconds = min(self.max_seconds, self.seconds * self.factor)
+        return self.seconds
+
+    def rate_limited(self, retry_after: Optional[float] = None) -> float:
+        """The server is throttling: wait as long as it asked, or the maximum interval if it didn't say."""
+        self.seconds = max(self.min_seconds, retry_after or self.max_seconds)
+        return self.seconds
+
+
+def next_start(last_run: Optional[datetime], interval: float, now: datetime, delay: float = 0) -> datetime:
+    """Time of the first run of a job, considering its last run before the app was restarted.
+
+    Runs missed while the app was not running are coalesced into a single catch-up run, right after the delay.
+
+    >>> now = datetime(2024, 1, 1, 12, 0)
+    >>> next_start(None, 3600, now, 15)
+    datetime.datetime(2024, 1, 1, 12, 0, 15)
+    >>> next_start(datetime(2024, 1, 1, 11, 30), 3600, now, 15)
+    datetime.datetime(2024, 1, 1, 12, 30)
+    >>> next_start(datetime(2023, 12, 31, 8, 0), 3600, now, 15)
+    datetime.datetime(2024, 1, 1, 12, 0, 15)
+    """
+    earliest = now + timedelta(seconds=delay)
+    if last_run is None:
+        return earliest
+    return max(earliest, last_run + timedelta(seconds=interval))
+
+
+class JobHistory:
+    """Last run of each scheduler job, persisted in SQLite so schedules survive restarts, sleep and wake.
+
+    Jobs themselves are not persisted: they hold API clients and menus that can't be pickled.
+    """
+
+    def __init__(self, path: Path, jitter: float = JOB_START_JITTER_SECONDS) -> None:
+        self.path = path
+        self.jitter = jitter
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS job_run (job_id TEXT PRIMARY KEY, last_run TIMESTAMP NOT NULL)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Open a connection for a transaction; it's committed (or rolled back) and closed at the end."""
+        with closing(sqlite3.connect(self.path, timeout=10)) as conn, conn:
+            yield conn
+
+    def last_run(self, job_id: str) -> Optional[datetime]:
+        """Last time a job was run."""
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT last_run FROM job_run WHERE job_id = ?", (job_id,)).fetchone()
+        return datetime.fromisoformat(row[0]) if row else None
+
+    def record(self, job_id: str, run_at: Optional[datetime] = None) -> None:
+        """Record the run of a job."""
+        run_at = run_at or datetime.now()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT INTO job_run (job_id, last_run) VALUES (?, ?)"
+                " ON CONFLICT (job_id) DO UPDATE SET last_run = excluded.last_run",
+                (job_id, run_at.isoformat()),
+            )
+
+    def record_event(self, event: Any) -> None:
+        """Scheduler listener that records executed jobs (successful or not)."""
+        try:
+            self.record(event.job_id)
+        except sqlite3.Error as err:
+            logger.error("Could not record the run of job %s: %s", event.job_id, err)
+
+    def start_date(self, job_id: str, interval: float, delay: float = 0) -> datetime:
+        """Jittered start date of a job, so jobs of several accounts don't all start at the same second."""
+        try:
+            last_run = self.last_run(job_id)
+        except sqlite3.Error as err:
+            logger.error("Could not read the last run of job %s: %s", job_id, err)
+            last_run = None
+        return next_start(last_run, interval, datetime.now(), delay) + timedelta(seconds=random.uniform(0, self.jitter))
@@ -5,7 +5,6 @@ from pathlib import Path
 
 from appdirs import AppDirs
 from environs import Env
-from joblib import Memory
 from ruamel.yaml import YAML
 
 from dontforget.constants import CONFIG_YAML, PROJECT_NAME
@@ -41,12 +40,23 @@ HOME_TODOIST_PROJECT = env("HOME_TODOIST_PROJECT")
 #: Description of the task that will be created
 HOME_TODOIST_TASK = env("HOME_TODOIST_TASK")
 
+#: Todoist API token of the task to go home; empty to disable the task
+TODOIST_API_TOKEN = env("TODOIST_API_TOKEN", default="")
+
+#: Check email accounts on a single asyncio event loop, instead of one scheduler thread per account
+EMAIL_ASYNC_ENGINE = env.bool("EMAIL_ASYNC_ENGINE", default=False)
+
+#: Directory (e.g. on a shared filesystem) where apps on several hosts elect a single poller for each email account;
+#: the other apps read the results published by the poller. Empty to disable coordination
+EMAIL_LEASE_DIR = env("EMAIL_LEASE_DIR", default="")
+
 #: List of directories with user-configured pipes
 USER_PIPES_DIR = env.list("USER_PIPES_DIR")
 
 DEFAULT_DIRS = AppDirs(PROJECT_NAME)
 CACHE_DIR = Path(DEFAULT_DIRS.user_cache_dir)
-JOBLIB_MEMORY = Memory(CACHE_DIR)  # , verbose=0
+#: The running app serves its status on this Unix socket
+STATUS_SOCKET_PATH = CACHE_DIR / "status.sock"
 CONFIG_FILE_PATH = Path(DEFAULT_DIRS.user_config_dir) / CONFIG_YAML
 if not CONFIG_FILE_PATH.exists():
     raise RuntimeError(f"Config file not found: {CONFIG_FILE_PATH}")
@@ -0,0 +1,112 @@
+"""Status of the running app, served on a local Unix socket.
+
+Scripts and CLI commands read the latest results of the app instead of authenticating and polling the servers again.
+A client connects, the app writes its status as JSON and closes the connection.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+from dontforget.constants import STATUS_SOCKET_TIMEOUT_SECONDS
+from dontforget.settings import LOG_LEVEL, STATUS_SOCKET_PATH
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+
+class StatusError(RuntimeError):
+    """The app accepted the connection but didn't send a valid status."""
+
+
+class StatusRequestHandler(socketserver.StreamRequestHandler):
+    """Write the status as JSON to the client."""
+
+    server: StatusServer
+
+    def handle(self) -> None:
+        """Write the current status of the app, then close the connection."""
+        try:
+            self.wfile.write(json.dumps(self.server.provider(), default=str).encode())
+        except Exception:  # noqa: B902
+            logger.exception("Could not serve the status")
+
+
+class StatusServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """A server on a local Unix socket, only accessible by the current user."""
+
+    daemon_threads = True
+
+    def __init__(self, path: Path, provider: Callable[[], dict[str, Any]]) -> None:
+        self.path = path
+        self.provider = provider
+        super().__init__(str(path), StatusRequestHandler, bind_and_activate=False)
+
+    def start(self) -> bool:
+        """Start serving in a background thread.
+
+        :return: False if another app is already serving its status on the same socket.
+        """
+        if self.path.exists():
+            try:
+                running = read_status(self.path) is not None
+            except StatusError:
+                running = True
+            if running:
+                logger.warning("Another app is already serving its status on %s", self.path)
+                self.server_close()
+                return False
+            # A socket file left behind by an app that didn't exit cleanly
+            self.path.unlink()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # The socket is created with the permissions of the umask: other users must never be able to connect to it
+        previous_umask = os.umask(0o177)
+        try:
+            self.server_bind()
+        finally:
+            os.umask(previous_umask)
+        self.server_activate()
+        threading.Thread(target=self.serve_forever, name="status-server", daemon=True).start()
+        logger.debug("Serving status on %s", self.path)
+        return True
+
+    def stop(self) -> None:
+        """Stop serving and remove the socket file."""
+        self.shutdown()
+        self.server_close()
+        self.path.unlink(missing_ok=True)
+
+
+def read_status(
+    path: Path = STATUS_SOCKET_PATH, timeout: float = STATUS_SOCKET_TIMEOUT_SECONDS
+) -> dict[str, Any] | None:
+    """Read the status of the running app.
+
+    :return: None if the app is not running.
+    :raises StatusError: If the app closed the connection without a valid status, e.g. because its handler failed.
+    """
+    data = bytearray()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        try:
+            client.connect(str(path))
+            while chunk := client.recv(65536):
+                data += chunk
+        except OSError as err:
+            logger.debug("No status from the app on %s: %s", path, err)
+            return None
+    if not data:
+        raise StatusError(f"The app on {path} sent an empty status; check its log")
+    try:
+        return json.loads(data)
+    except ValueError as err:
+        raise StatusError(f"The app on {path} sent an invalid status: {err}") from err
@@ -0,0 +1,593 @@
+"""Local copy of Toggl data in SQLite, synced incrementally with the Toggl API v9.
+
+* https://engineering.toggl.com/docs/api/me
+
+Only records changed since the last sync are fetched (the ``since`` parameter),
+so workspaces with thousands of projects sync in one cheap call.
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Optional
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+from dontforget.constants import (
+    TOGGL_CATALOG_REFRESH_SECONDS,
+    TOGGL_ENTRIES_CHUNK_DAYS,
+    TOGGL_ENTRIES_INITIAL_DAYS,
+    TOGGL_FETCH_ATTEMPTS,
+    TOGGL_FETCH_WORKERS,
+    TOGGL_TIMEOUT_SECONDS,
+)
+from dontforget.scheduling import RateLimitError
+from dontforget.settings import CACHE_DIR, LOG_LEVEL, TOGGL_API_TOKEN
+
+TOGGL_API_URL = "https://api.track.toggl.com/api/v9/"
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+
+class TogglApiError(RuntimeError):
+    """A request to the Toggl API failed."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(status, message)
+        self.status = status
+        self.message = message
+
+    def __str__(self) -> str:
+        return f"HTTP {self.status}: {self.message}"
+
+
+class TogglApi:
+    """A minimal client of the Toggl API v9, authenticated with the API token."""
+
+    def __init__(self, api_token: str, timeout: float = TOGGL_TIMEOUT_SECONDS) -> None:
+        self.timeout = timeout
+        credentials = base64.b64encode(f"{api_token}:api_token".encode()).decode()
+        self._headers = {"Authorization": f"Basic {credentials}", "Accept": "application/json"}
+
+    def get(self, path: str, **params: Any) -> Any:
+        """Get a resource; parameters with None values are not sent."""
+        query = urlencode({key: value for key, value in params.items() if value is not None})
+        url = TOGGL_API_URL + path + (f"?{query}" if query else "")
+        logger.debug("GET %s", url)
+        try:
+            with urlopen(Request(url, headers=self._headers), timeout=self.timeout) as response:
+                return json.load(response)
+        except HTTPError as err:
+            body = err.read().decode(errors="replace")[:200]
+            if err.code == 429:
+                retry_after = err.headers.get("Retry-After", "")
+                raise RateLimitError(f"Toggl: {body}", float(retry_after) if retry_after.isdigit() else None) from err
+            raise TogglApiError(err.code, body) from err
+
+
+def unix_time(iso_timestamp: str) -> int:
+    """Convert an ISO timestamp of the Toggl API to a Unix timestamp.
+
+    >>> unix_time("2024-01-02T03:04:05+00:00"), unix_time("2024-01-02T03:04:05Z")
+    (1704164645, 1704164645)
+    """
+    return int(parse_time(iso_timestamp).timestamp())
+
+
+def parse_time(iso_timestamp: str) -> datetime:
+    """Parse an ISO timestamp of the Toggl API to an aware datetime.
+
+    >>> parse_time("2024-01-02T03:04:05Z")
+    datetime.datetime(2024, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc)
+    """
+    return datetime.fromisoformat(iso_timestamp.replace("Z", "+00:00"))
+
+
+def format_time(moment: datetime) -> str:
+    """Format a datetime in UTC for the Toggl API; naive datetimes are local time.
+
+    >>> format_time(datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone(timedelta(hours=1))))
+    '2024-01-02T02:04:05Z'
+    """
+    return moment.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def time_chunks(start: datetime, end: datetime, days: float) -> list[tuple[datetime, datetime]]:
+    """Split a time range into consecutive chunks of at most a number of days.
+
+    >>> chunks = time_chunks(datetime(2024, 1, 1), datetime(2024, 1, 20), 7)
+    >>> [(chunk_start.day, chunk_end.day) for chunk_start, chunk_end in chunks]
+    [(1, 8), (8, 15), (15, 20)]
+    """
+    chunks = []
+    while start < end:
+        chunk_end = min(end, start + timedelta(days=days))
+        chunks.append((start, chunk_end))
+        start = chunk_end
+    return chunks
+
+
+@dataclass
+class ClientDC:
+    """A client on Toggl."""
+
+    id: int
+    name: str
+
+
+@dataclass
+class ProjectDC:
+    """A project on Toggl."""
+
+    id: int
+    name: str
+    client: Optional[ClientDC]
+
+
+@dataclass
+class TogglCatalog:
+    """Clients and projects, indexed by ID and by name; archived projects are kept apart."""
+
+    version: int = 0
+    clients_by_id: dict[int, ClientDC] = field(default_factory=dict)
+    clients_by_name: dict[str, ClientDC] = field(default_factory=dict)
+    projects_by_id: dict[int, ProjectDC] = field(default_factory=dict)
+    projects_by_name: dict[str, ProjectDC] = field(default_factory=dict)
+    archived_projects_by_id: dict[int, ProjectDC] = field(default_factory=dict)
+
+    def project(self, project_id: Optional[int]) -> Optional[ProjectDC]:
+        """Find a project by ID, active or archived (old entries can belong to archived projects)."""
+        if project_id is None:
+            return None
+        return self.projects_by_id.get(project_id) or self.archived_projects_by_id.get(project_id)
+
+
+@dataclass(frozen=True)
+class TimeEntryDC:
+    """A time entry on Toggl; running entries have no stop time."""
+
+    id: int
+    project_id: Optional[int]
+    description: str
+    start: datetime
+    stop: Optional[datetime]
+    tags: tuple[str, ...] = ()
+
+    @property
+    def seconds(self) -> float:
+        """Duration in seconds, up to now for a running entry.
+
+        >>> TimeEntryDC(1, None, "", datetime(2024, 1, 1, 9), datetime(2024, 1, 1, 10, 30)).seconds
+        5400.0
+        """
+        stop = self.stop or datetime.now(timezone.utc)
+        return (stop - self.start).total_seconds()
+
+
+@dataclass(frozen=True)
+class EntrySummary:
+    """Total duration of the time entries of a project with the same description."""
+
+    project_id: Optional[int]
+    description: str
+    seconds: int
+    entries: int
+
+
+@dataclass(frozen=True)
+class EntryTotal:
+    """Total duration of the time entries of a group."""
+
+    key: Any
+    seconds: int
+    entries: int
+
+
+#: Groups of :py:meth:`TogglStore.totals()`
+TOTALS_GROUPS = ("project", "tag", "day", "work")
+
+
+class TogglStore:
+    """Toggl clients, projects and time entries in SQLite.
+
+    Projects that are archived on Toggl are moved to their own table, and deleted records are removed.
+    The catalog version is incremented when a sync changes something.
+    Time entries are indexed by start time and by project, so reports don't need the API.
+    """
+
+    def __init__(self, path: Path, api: TogglApi) -> None:
+        self.path = path
+        self.api = api
+        self._lock = threading.Lock()
+        self._created = False
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Open a connection for a transaction; it's committed (or rolled back) and closed at the end."""
+        if not self._created:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(sqlite3.connect(self.path, timeout=10)) as conn, conn:
+            if not self._created:
+                conn.executescript("""
+                    CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+                    CREATE TABLE IF NOT EXISTS client (
+                        id INTEGER PRIMARY KEY, workspace_id INTEGER, name TEXT NOT NULL, at TEXT
+                    );
+                    CREATE INDEX IF NOT EXISTS client_name ON client (name);
+                    CREATE TABLE IF NOT EXISTS project (
+                        id INTEGER PRIMARY KEY, workspace_id INTEGER, client_id INTEGER, name TEXT NOT NULL, at TEXT
+                    );
+                    CREATE INDEX IF NOT EXISTS project_name ON project (name);
+                    CREATE TABLE IF NOT EXISTS archived_project (
+                        id INTEGER PRIMARY KEY, workspace_id INTEGER, client_id INTEGER, name TEXT NOT NULL, at TEXT
+                    );
+                    CREATE TABLE IF NOT EXISTS time_entry (
+                        id INTEGER PRIMARY KEY,
+                        workspace_id INTEGER,
+                        project_id INTEGER,
+                        description TEXT NOT NULL,
+                        start_ts INTEGER NOT NULL,
+                        stop_ts INTEGER,
+                        tags TEXT NOT NULL,
+                        at TEXT
+                    );
+                    CREATE INDEX IF NOT EXISTS time_entry_start ON time_entry (start_ts);
+                    CREATE INDEX IF NOT EXISTS time_entry_project_start ON time_entry (project_id, start_ts);
+                    """)
+                self._created = True
+            yield conn
+
+    @staticmethod
+    def _get_meta(conn: sqlite3.Connection, key: str, default: str | None = None) -> str | None:
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    @staticmethod
+    def _set_meta(conn: sqlite3.Connection, key: str, value: Any) -> None:
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+            (key, str(value)),
+        )
+
+    def catalog_version(self) -> int:
+        """Version of the catalog, incremented when a sync changes clients or projects."""
+        with self._lock, self._connect() as conn:
+            return int(self._get_meta(conn, "catalog_version", "0"))
+
+    def sync_catalog(self, force: bool = False) -> bool:
+        """Fetch clients and projects changed since the last sync; everything on the first sync.
+
+        Syncs closer than :py:data:`TOGGL_CATALOG_REFRESH_SECONDS` apart are skipped, unless forced.
+
+        :return: True if something changed.
+        """
+        with self._lock, self._connect() as conn:
+            since = self._get_meta(conn, "catalog_since")
+            synced_at = float(self._get_meta(conn, "catalog_synced_at", "0"))
+        if not force and time.time() - synced_at < TOGGL_CATALOG_REFRESH_SECONDS:
+            return False
+
+        try:
+            clients = self.api.get("me/clients", since=since)
+            projects = self.api.get("me/projects", since=since, include_archived="true")
+        except TogglApiError as err:
+            if since is None or err.status != 400:
+                raise
+            # The API only accepts recent "since" timestamps; fetch everything again
+            logger.warning("Toggl: Incremental sync refused (%s), fetching all clients and projects", err)
+            since = None
+            clients = self.api.get("me/clients")
+            projects = self.api.get("me/projects", include_archived="true")
+        return self._store_catalog(clients or [], projects or [], full=since is None)
+
+    @staticmethod
+    def _replace_row(conn: sqlite3.Connection, table: str, record_id: int, row: tuple | None) -> bool:
+        """Replace (or delete, if None) the row of a record.
+
+        :return: True if the row changed.
+        """
+        if conn.execute(f"SELECT * FROM {table} WHERE id = ?", (record_id,)).fetchone() == row:
+            return False
+        conn.execute(f"DELETE FROM {table} WHERE id = ?", (record_id,))
+        if row is not None:
+            conn.execute(f"INSERT INTO {table} VALUES ({', '.join('?' * len(row))})", row)
+        return True
+
+    def _store_catalog(self, clients: list[dict[str, Any]], projects: list[dict[str, Any]], full: bool) -> bool:
+        """Store fetched clients and projects; on a full sync, records that were not fetched are removed."""
+        changed = False
+        with self._lock, self._connect() as conn:
+            if full:
+                fetched = {
+                    "client": {client["id"] for client in clients},
+                    "project": {project["id"] for project in projects},
+                    "archived_project": {project["id"] for project in projects},
+                }
+                for table, fetched_ids in fetched.items():
+                    for (record_id,) in conn.execute(f"SELECT id FROM {table}").fetchall():
+                        if record_id not in fetched_ids:
+                            changed |= self._replace_row(conn, table, record_id, None)
+
+            for client in clients:
+                row = None
+                if not client.get("server_deleted_at"):
+                    row = (client["id"], client.get("wid"), client["name"], client.get("at"))
+                changed |= self._replace_row(conn, "client", client["id"], row)
+            for project in projects:
+                row = None
+                if not project.get("server_deleted_at"):
+                    row = (
+                        project["id"],
+                        project.get("workspace_id"),
+                        project.get("client_id"),
+                        project["name"],
+                        project.get("at"),
+                    )
+                active = project.get("active", True)
+                changed |= self._replace_row(conn, "project", project["id"], row if active else None)
+                changed |= self._replace_row(conn, "archived_project", project["id"], None if active else row)
+
+            timestamps = [unix_time(record["at"]) for record in clients + projects if record.get("at")]
+            if timestamps:
+                # Records changed at the same second are fetched again next time; their rows don't change
+                self._set_meta(conn, "catalog_since", max(timestamps))
+            self._set_meta(conn, "catalog_synced_at", time.time())
+            if changed:
+                version = int(self._get_meta(conn, "catalog_version", "0")) + 1
+                self._set_meta(conn, "catalog_version", version)
+        logger.debug("Toggl: %d clients and %d projects synced (full=%s)", len(clients), len(projects), full)
+        return changed
+
+    def catalog(self, sync: bool = True) -> TogglCatalog:
+        """Load clients and projects, syncing them first.
+
+        If the sync fails (e.g. offline), the local copy is used.
+        """
+        if sync:
+            try:
+                self.sync_catalog()
+            except (OSError, TogglApiError, RateLimitError) as err:
+                logger.error("Toggl: Could not sync clients and projects, using the local copy: %s", err)
+
+        catalog = TogglCatalog()
+        with self._lock, self._connect() as conn:
+            catalog.version = int(self._get_meta(conn, "catalog_version", "0"))
+            for client_id, name in conn.execute("SELECT id, name FROM client ORDER BY id"):
+                client = ClientDC(client_id, name)
+                catalog.clients_by_id[client_id] = catalog.clients_by_name[name] = client
+            for table, by_id in (
+                ("project", catalog.projects_by_id),
+                ("archived_project", catalog.archived_projects_by_id),
+            ):
+                for project_id, name, client_id in conn.execute(f"SELECT id, name, client_id FROM {table} ORDER BY id"):
+                    by_id[project_id] = ProjectDC(project_id, name, catalog.clients_by_id.get(client_id))
+        catalog.projects_by_name = {project.name: project for project in catalog.projects_by_id.values()}
+        return catalog
+
+    def sync_time_entries(self, start: Optional[datetime] = None) -> int:
+        """Fetch time entries changed since the last sync (including deleted ones).
+
+        The first sync fetches the last :py:data:`TOGGL_ENTRIES_INITIAL_DAYS` days.
+        If ``start`` is earlier than the entries stored so far, the missing range is fetched too.
+
+        :return: Number of entries fetched.
+        """
+        now = datetime.now(timezone.utc)
+        with self._lock, self._connect() as conn:
+            since = self._get_meta(conn, "entries_since")
+            stored_from = self._get_meta(conn, "entries_from")
+
+        fetched = []
+        if stored_from is None:
+            stored_from = format_time(min(start or now, now - timedelta(days=TOGGL_ENTRIES_INITIAL_DAYS)))
+            fetched.extend(self._fetch_range(stored_from, format_time(now + timedelta(days=1))))
+        else:
+            try:
+                fetched.extend(self.api.get("me/time_entries", since=since) or [])
+            except TogglApiError as err:
+                if err.status != 400:
+                    raise
+                logger.warning("Toggl: Incremental sync refused (%s), fetching all stored time entries again", err)
+                fetched.extend(self._fetch_range(stored_from, format_time(now + timedelta(days=1))))
+            if start and start < parse_time(stored_from):
+                fetched.extend(self._fetch_range(format_time(start), stored_from))
+                stored_from = format_time(start)
+
+        self._store_time_entries(fetched, stored_from)
+        return len(fetched)
+
+    def _fetch_range(self, start_date: str, end_date: str) -> list[dict[str, Any]]:
+        """Fetch time entries that started in a time range.
+
+        Long ranges are split in chunks of :py:data:`TOGGL_ENTRIES_CHUNK_DAYS`, fetched in parallel,
+        so each response stays small.
+        """
+        chunks = time_chunks(parse_time(start_date), parse_time(end_date), TOGGL_ENTRIES_CHUNK_DAYS)
+        with ThreadPoolExecutor(TOGGL_FETCH_WORKERS, thread_name_prefix="toggl-fetch") as executor:
+            results = list(executor.map(lambda chunk: self._fetch_chunk(*chunk), chunks))
+        return [entry for entries in results for entry in entries]
+
+    def _fetch_chunk(self, start: datetime, end: datetime) -> list[dict[str, Any]]:
+        """Fetch the time entries of a chunk, waiting and trying again if the API is throttling."""
+        logger.debug("Toggl: Fetching time entries from %s to %s", start, end)
+        for attempt in range(TOGGL_FETCH_ATTEMPTS):
+            try:
+                return self.api.get("me/time_entries", start_date=format_time(start), end_date=format_time(end)) or []
+            except RateLimitError as err:
+                if attempt == TOGGL_FETCH_ATTEMPTS - 1:
+                    raise
+                time.sleep(err.retry_after or (1 + attempt))
+        raise AssertionError("unreachable")
+
+    def _store_time_entries(self, entries: list[dict[str, Any]], stored_from: str) -> None:
+        """Store fetched time entries; deleted entries are removed."""
+        with self._lock, self._connect() as conn:
+            for entry in entries:
+                conn.execute("DELETE FROM time_entry WHERE id = ?", (entry["id"],))
+                if entry.get("server_deleted_at"):
+                    continue
+                conn.execute(
+                    "INSERT INTO time_entry (id, workspace_id, project_id, description, start_ts, stop_ts, tags, at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        entry["id"],
+                        entry.get("workspace_id"),
+                        entry.get("project_id"),
+                        entry.get("description") or "",
+                        unix_time(entry["start"]),
+                        unix_time(entry["stop"]) if entry.get("stop") else None,
+                        json.dumps(entry.get("tags") or []),
+                        entry.get("at"),
+                    ),
+                )
+            timestamps = [unix_time(entry["at"]) for entry in entries if entry.get("at")]
+            # Without any entries yet, the next sync starts from now
+            since = max([int(self._get_meta(conn, "entries_since", "0")), *timestamps]) or int(time.time())
+            self._set_meta(conn, "entries_since", since)
+            self._set_meta(conn, "entries_from", stored_from)
+        logger.debug("Toggl: %d time entries synced", len(entries))
+
+    @staticmethod
+    def _entries_filter(start: datetime, end: datetime, project_ids: Optional[Iterable[int]]) -> tuple[str, list[Any]]:
+        """WHERE clause and parameters of time entries that started in a time range, optionally of some projects."""
+        where = "WHERE start_ts BETWEEN ? AND ?"
+        params: list[Any] = [int(start.timestamp()), int(end.timestamp())]
+        if project_ids is not None:
+            project_ids = list(project_ids)
+            where += f" AND project_id IN ({', '.join('?' * len(project_ids))})"
+            params.extend(project_ids)
+        return where, params
+
+    def time_entries(
+        self, start: datetime, end: datetime, project_ids: Optional[Iterable[int]] = None
+    ) -> list[TimeEntryDC]:
+        """Time entries stored locally that started in a time range, optionally only of some projects."""
+        where, params = self._entries_filter(start, end, project_ids)
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT id, project_id, description, start_ts, stop_ts, tags FROM time_entry {where}"
+                " ORDER BY start_ts",
+                params,
+            ).fetchall()
+        return [
+            TimeEntryDC(
+                entry_id,
+                project_id,
+                description,
+                datetime.fromtimestamp(start_ts, timezone.utc),
+                datetime.fromtimestamp(stop_ts, timezone.utc) if stop_ts is not None else None,
+                tuple(json.loads(tags)),
+            )
+            for entry_id, project_id, description, start_ts, stop_ts, tags in rows
+        ]
+
+    def running_entry(self) -> Optional[TimeEntryDC]:
+        """The running time entry stored locally (the one without a stop time), as of the last sync."""
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT id, project_id, description, start_ts, tags FROM time_entry WHERE stop_ts IS NULL"
+                " ORDER BY start_ts DESC LIMIT 1"
+            ).fetchone()
+        if not row:
+            return None
+        entry_id, project_id, description, start_ts, tags = row
+        return TimeEntryDC(
+            entry_id,
+            project_id,
+            description,
+            datetime.fromtimestamp(start_ts, timezone.utc),
+            None,
+            tuple(json.loads(tags)),
+        )
+
+    def summarize(
+        self, start: datetime, end: datetime, project_ids: Optional[Iterable[int]] = None
+    ) -> list[EntrySummary]:
+        """Total duration of time entries, grouped by project and description.
+
+        SQLite aggregates the rows while it reads them from the index, so entries are never loaded in memory.
+        """
+        where, params = self._entries_filter(start, end, project_ids)
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                "SELECT project_id, description, SUM(COALESCE(stop_ts, ?) - start_ts), COUNT(*)"
+                f" FROM time_entry {where} GROUP BY project_id, description",
+                [int(time.time()), *params],
+            ).fetchall()
+        return [EntrySummary(*row) for row in rows]
+
+    def totals(
+        self,
+        start: datetime,
+        end: datetime,
+        group_by: str,
+        not_work_tags: Iterable[str] = (),
+        not_work_descriptions: Iterable[str] = (),
+    ) -> list[EntryTotal]:
+        """Total duration of time entries, grouped by one of :py:data:`TOTALS_GROUPS`, sorted by duration.
+
+        Entries are grouped by SQLite over the index, so years of entries are aggregated without loading them.
+
+        :param group_by: ``project`` (by project ID), ``tag`` (entries without tags are grouped under an empty tag),
+            ``day`` (local date) or ``work`` (``work`` or ``not work``, by tags and parts of the description).
+        """
+        not_work_tags, not_work_descriptions = list(not_work_tags), list(not_work_descriptions)
+        source = "time_entry"
+        key_params: list[Any] = []
+        if group_by == "project":
+            key = "project_id"
+        elif group_by == "tag":
+            source = "time_entry LEFT JOIN json_each(time_entry.tags) AS tag"
+            key = "COALESCE(tag.value, '')"
+        elif group_by == "day":
+            key = "date(start_ts, 'unixepoch', 'localtime')"
+        elif group_by == "work":
+            conditions = ["0"]
+            if not_work_tags:
+                placeholders = ", ".join("?" * len(not_work_tags))
+                conditions.append(f"EXISTS (SELECT 1 FROM json_each(time_entry.tags) WHERE value IN ({placeholders}))")
+            conditions.extend("instr(description, ?) > 0" for _ in not_work_descriptions)
+            key = f"CASE WHEN {' OR '.join(conditions)} THEN 'not work' ELSE 'work' END"
+            key_params = [*not_work_tags, *not_work_descriptions]
+        else:
+            raise ValueError(f"Invalid group: {group_by}")
+
+        where, params = self._entries_filter(start, end, None)
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT {key} AS group_key, SUM(COALESCE(stop_ts, ?) - start_ts) AS seconds, COUNT(*)"
+                f" FROM {source} {where} GROUP BY group_key ORDER BY seconds DESC",
+                [*key_params, int(time.time()), *params],
+            ).fetchall()
+        return [EntryTotal(*row) for row in rows]
+
+    def user_timezone(self, default: str) -> str:
+        """Timezone of the Toggl user, fetched once and stored."""
+        with self._lock, self._connect() as conn:
+            user_timezone = self._get_meta(conn, "timezone")
+        if user_timezone:
+            return user_timezone
+        try:
+            user_timezone = self.api.get("me").get("timezone") or default
+        except (OSError, TogglApiError, RateLimitError) as err:
+            logger.error("Toggl: Could not fetch the timezone of the user, using %s: %s", default, err)
+            return default
+        with self._lock, self._connect() as conn:
+            self._set_meta(conn, "timezone", user_timezone)
+        return user_timezone
+
+
+TOGGL_STORE = TogglStore(CACHE_DIR / "toggl.sqlite3", TogglApi(TOGGL_API_TOKEN))
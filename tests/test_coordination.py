@@ -0,0 +1,42 @@
+"""Tests of the coordination of several apps with leases."""
+
+import multiprocessing
+import os
+import time
+from pathlib import Path
+
+from dontforget.coordination import Lease
+
+PROCESSES = 4
+ROUNDS = 25
+
+
+def hold_lease(directory: str, owner: str) -> tuple[int, int]:
+    """Acquire and release the lease repeatedly, as an app would; count rounds where another owner held it too."""
+    lease = Lease(Path(directory), "me@x.io", 60, owner=owner)
+    marker = Path(directory) / "holder"
+    held = overlaps = 0
+    deadline = time.monotonic() + 30
+    while held < ROUNDS and time.monotonic() < deadline:
+        if not lease.acquire():
+            time.sleep(0.001)
+            continue
+        held += 1
+        try:
+            fd = os.open(marker, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            overlaps += 1
+        else:
+            os.close(fd)
+            time.sleep(0.001)
+            marker.unlink()
+        lease.release()
+    return held, overlaps
+
+
+def test_lease_is_exclusive_across_processes(tmp_path):
+    """Only one process at a time holds the lease, and all of them get it in turn."""
+    with multiprocessing.get_context("spawn").Pool(PROCESSES) as pool:
+        results = pool.starmap(hold_lease, [(str(tmp_path), f"app:{index}") for index in range(PROCESSES)])
+    assert [held for held, _ in results] == [ROUNDS] * PROCESSES
+    assert sum(overlaps for _, overlaps in results) == 0
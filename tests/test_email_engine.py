@@ -0,0 +1,150 @@
+"""Tests of the asyncio email engine."""
+
+import asyncio
+from contextlib import suppress
+
+from dontforget import email_engine
+from dontforget.email_engine import AsyncImapClient, HttpClient
+
+
+class FakeImapServer:
+    """An IMAP server on localhost that answers LOGIN and STATUS; the STATUS of a slow folder waits to be released."""
+
+    def __init__(self, unseen: dict[str, int], slow_folder: str) -> None:
+        self.unseen = unseen
+        self.slow_folder = slow_folder
+        self.slow_requested = asyncio.Event()
+        self.slow_released = asyncio.Event()
+        self.connections = 0
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Answer the commands of a client connection."""
+        self.connections += 1
+        writer.write(b"* OK IMAP4rev1 ready\r\n")
+        while line := await reader.readline():
+            tag, command, *args = line.decode().split()
+            if command == "STATUS":
+                folder = args[0]
+                if folder == self.slow_folder:
+                    self.slow_requested.set()
+                    await self.slow_released.wait()
+                writer.write(f"* STATUS {folder} (UNSEEN {self.unseen[folder]})\r\n".encode())
+            writer.write(f"{tag} OK {command} completed\r\n".encode())
+            await writer.drain()
+        writer.close()
+
+
+def test_cancelled_command_does_not_leak_its_response(monkeypatch):
+    """A command cancelled in the middle must not leave its response for the next command of the client."""
+    monkeypatch.setattr(email_engine, "SSL_CONTEXT", None)
+
+    async def scenario() -> tuple[int, int]:
+        server = FakeImapServer({"INBOX": 3, "Slow": 7}, slow_folder="Slow")
+        async with await asyncio.start_server(server.handle, "127.0.0.1", 0) as tcp_server:
+            port = tcp_server.sockets[0].getsockname()[1]
+            client = AsyncImapClient("127.0.0.1", port, "user", "password", timeout=5)
+
+            slow = asyncio.create_task(client.unseen_count("Slow"))
+            await server.slow_requested.wait()
+            slow.cancel()
+            with suppress(asyncio.CancelledError):
+                await slow
+            # The server answers the cancelled command, like a real server would
+            server.slow_released.set()
+            await asyncio.sleep(0.1)
+
+            count = await client.unseen_count("INBOX")
+            client.close()
+            await asyncio.sleep(0.1)
+            return count, server.connections
+
+    count, connections = asyncio.run(scenario())
+    assert count == 3
+    # The connection of the cancelled command was closed, and a new one was opened
+    assert connections == 2
+
+
+def test_status_of_folder_sent_as_literal(monkeypatch):
+    """Servers send folder names with non-ASCII characters as literals; their STATUS response must be parsed."""
+    monkeypatch.setattr(email_engine, "SSL_CONTEXT", None)
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        writer.write(b"* OK IMAP4rev1 ready\r\n")
+        while line := await reader.readline():
+            tag, command, *_ = line.decode().split()
+            if command == "STATUS":
+                name = "Caixa de saída".encode()
+                writer.write(b"* STATUS {%d}\r\n%s (UNSEEN 5)\r\n" % (len(name), name))
+            writer.write(f"{tag} OK {command} completed\r\n".encode())
+            await writer.drain()
+        writer.close()
+
+    async def scenario() -> tuple[int, list[bytes]]:
+        async with await asyncio.start_server(handle, "127.0.0.1", 0) as tcp_server:
+            port = tcp_server.sockets[0].getsockname()[1]
+            client = AsyncImapClient("127.0.0.1", port, "user", "password", timeout=5)
+            count = await client.unseen_count("Caixa de sa&AO0-da")
+            untagged = await client.run('STATUS "Caixa de sa&AO0-da" (UNSEEN)')
+            client.close()
+            return count, untagged
+
+    count, untagged = asyncio.run(scenario())
+    assert count == 5
+    # The literal is part of its response line
+    assert untagged == ["* STATUS {15}\r\nCaixa de saída (UNSEEN 5)".encode()]
+
+
+class FakeHttpServer:
+    """An HTTP server on localhost that answers with chunked bodies and closes idle connections on request."""
+
+    def __init__(self) -> None:
+        self.connections = 0
+        self.requests = 0
+        self.close_idle = asyncio.Event()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Answer the requests of a client connection, keeping it alive."""
+        self.connections += 1
+        while True:
+            try:
+                head = await reader.readuntil(b"\r\n\r\n")
+            except asyncio.IncompleteReadError:
+                break
+            self.requests += 1
+            path = head.split()[1].decode()
+            body = f'{{"path": "{path}"}}'.encode()
+            writer.write(b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n")
+            writer.write(b"%x\r\n%s\r\n0\r\n\r\n" % (len(body), body))
+            await writer.drain()
+            if self.close_idle.is_set():
+                break
+        writer.close()
+
+
+def test_http_connection_is_kept_alive():
+    """Requests reuse the idle connection; a connection closed by the server is replaced transparently."""
+
+    async def scenario() -> tuple[list[str], int, int]:
+        server = FakeHttpServer()
+        async with await asyncio.start_server(server.handle, "127.0.0.1", 0) as tcp_server:
+            port = tcp_server.sockets[0].getsockname()[1]
+            client = HttpClient(timeout=5)
+            paths = []
+            for index in range(3):
+                response = await client.request("GET", f"http://127.0.0.1:{port}/labels/{index}")
+                paths.append(response.json()["path"])
+                if index == 1:
+                    server.close_idle.set()
+            await asyncio.sleep(0.1)
+            server.close_idle.clear()
+            response = await client.request("GET", f"http://127.0.0.1:{port}/labels/3")
+            paths.append(response.json()["path"])
+            client.close()
+            await asyncio.sleep(0.1)
+            return paths, server.connections, server.requests
+
+    paths, connections, requests = asyncio.run(scenario())
+    assert paths == ["/labels/0", "/labels/1", "/labels/2", "/labels/3"]
+    # The first connection served 2 requests, and was closed by the server after the third one
+    assert connections == 2
+    assert requests == 4